@@ -0,0 +1,107 @@
+"""Benchmark the pandas.read_sql and typed Access fetch paths
+
+A synthetic follow-up log is written to a temporary SQLite database, which
+stands in for the Access database, and read back with both fetch paths.
+
+Usage: python benchmarks/bench_access_fetch.py [--rows 500000]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'obs_email_lsq')
+)
+import obs_data  # noqa: E402
+
+
+def synthetic_followup(rows, seed=0):
+    """Synthetic OBSFollowupLog with the columns in ACCESS_COLUMNS
+
+    Parameters
+    ----------
+    rows : int
+        Number of rows
+    seed : int, optional
+        Seed of the random number generator. The default is 0.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Follow-up log with one column per ACCESS_COLUMNS['followup'] column
+
+    """
+    rng = np.random.default_rng(seed)
+    obs_num = rng.integers(1, 20000, rows)
+    visit_date = (
+        pd.Timestamp(2016, 5, 30)
+        + pd.to_timedelta(rng.integers(0, 2000, rows), unit='D')
+    )
+    followup = {'ID': np.arange(1, rows + 1)}
+    for col in obs_data.ACCESS_COLUMNS['followup']:
+        if col == 'OBSEnrolmentID':
+            followup[col] = [f'OBS912-{num:05d}' for num in obs_num]
+        elif col in ['PatientID', 'PatientFirstName', 'PatientSurname']:
+            followup[col] = [f'{col}{num}' for num in obs_num]
+        elif obs_data.ACCESS_SCHEMA.get(col) == 'datetime64[ns]':
+            followup[col] = visit_date.strftime('%Y-%m-%d %H:%M:%S')
+        elif obs_data.ACCESS_SCHEMA.get(col) == 'bool':
+            followup[col] = rng.random(rows) < 0.1
+        else:
+            followup[col] = None
+
+    return pd.DataFrame(followup)
+
+
+def time_path(cnxn, query, typed, repeat):
+    """Best time and peak size of a fetch path
+
+    The read_sql path also converts the date columns, as
+    obs_email.ObsParticipants does, so both paths end with the same types.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        loaded = obs_data._load_access_table(cnxn, query, typed=typed)
+        table = loaded['table']
+        if not typed:
+            for col in ['OBSVisitDate', 'DeliveryDate']:
+                table[col] = pd.to_datetime(table[col])
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+
+    return best, int(table.memory_usage(deep=True).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cnxn = sqlite3.connect(os.path.join(tmp_dir, 'access.sqlite'))
+        synthetic_followup(args.rows).to_sql(
+            'OBSFollowupLog', cnxn, index=False
+        )
+        query = obs_data._access_query(
+            'followup', obs_data.ACCESS_COLUMNS['followup']
+        )
+
+        print(f'{args.rows} rows, best of {args.repeat}')
+        for name, typed in [('read_sql', False), ('typed', True)]:
+            seconds, size = time_path(cnxn, query, typed, args.repeat)
+            print(f'  {name:>8}: {seconds:.2f} s, {size / 1e6:.1f} MB')
+        cnxn.close()
+
+
+if __name__ == '__main__':
+    main()
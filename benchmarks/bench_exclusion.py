@@ -0,0 +1,158 @@
+"""Benchmark excluding withdrawn subjects from the Access table
+
+Synthetic enrolled subjects and exclusion flags are run through
+obs_data.access_exclude and obs_email.ObsParticipants.remove_exclusion_ids,
+and through the list-based versions they replaced (a list of excluded IDs
+searched for each enrolled ID).
+
+Usage: python benchmarks/bench_exclusion.py [--enrolled 100000]
+           [--excluded 20000] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'obs_email_lsq')
+)
+import obs_data  # noqa: E402
+import obs_email  # noqa: E402
+
+
+def synthetic_access(enrolled, excluded, seed=0):
+    """Synthetic enrolment and follow-up tables with exclusion flags
+
+    Parameters
+    ----------
+    enrolled : int
+        Number of enrolled subjects
+    excluded : int
+        Number of subjects with an exclusion flag
+    seed : int, optional
+        Seed of the random number generator. The default is 0.
+
+    Returns
+    -------
+    dict of pandas.DataFrame
+        'enrolment' and 'followup', as returned by obs_data.access_data
+
+    """
+    rng = np.random.default_rng(seed)
+    obs_ids = 91200000 + np.arange(enrolled)
+    flagged = rng.choice(enrolled, excluded, replace=False)
+    flags = ['NoUse', 'NoContact', 'NoAccess', 'Fetal Demise/Termination',
+             'Neonatal death']
+    followup = pd.DataFrame({'obs_study_id': obs_ids})
+    flag_of = rng.integers(0, len(flags), excluded)
+    for i, flag in enumerate(flags):
+        followup[flag] = 0
+        followup.loc[flagged[flag_of == i], flag] = 1
+    followup['TwinBDelivery'] = None
+    enrolment = pd.DataFrame({
+        'obs_study_id': obs_ids,
+        'Previous OBS participant': np.zeros(enrolled, dtype=bool),
+    })
+
+    return {'enrolment': enrolment, 'followup': followup}
+
+
+def list_exclude(access_data_dict):
+    """access_exclude as it was: a list of the flagged IDs"""
+    followup = access_data_dict['followup']
+    access_excl = []
+    for key in ['NoUse', 'NoContact', 'NoAccess', 'Fetal Demise/Termination',
+                'Neonatal death']:
+        access_excl.extend(
+            followup.loc[followup[key] == 1, 'obs_study_id'].tolist()
+        )
+    return list(set(access_excl))
+
+
+def set_exclude(access_data_dict):
+    """Current access_exclude, with the exclusions main.py uses"""
+    return obs_data.access_exclude(
+        access_data_dict, excl_previous=False, excl_multiple=False,
+        excl_no_use=True, excl_no_contact=True, excl_no_access=True,
+        excl_fetal_demise=True, excl_neonatal_death=True
+    )
+
+
+def list_remove(access_table, id_enrol, id_exclude):
+    """remove_exclusion_ids as it was: id_exclude searched per enrolled ID"""
+    id_enrol_wo_excl = [
+        obs_id for obs_id in id_enrol if int(obs_id) not in id_exclude
+    ]
+    return access_table[access_table['obs_study_id'].isin(id_enrol_wo_excl)]
+
+
+def set_remove(access_table, id_enrol, id_exclude):
+    """Current ObsParticipants.remove_exclusion_ids
+
+    The integer OBS IDs (obs_id column) are parsed once by
+    set_access_table, so they are not timed here.
+    """
+    obs_email.ObsParticipants.remove_exclusion_ids(id_exclude)
+    return obs_email.ObsParticipants.access_wo_excl
+
+
+def best_time(func, *args, repeat=3):
+    """Best time (seconds) of repeated calls and the last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--enrolled', type=int, default=100000)
+    parser.add_argument('--excluded', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    access_data_dict = synthetic_access(args.enrolled, args.excluded)
+    access_table = pd.DataFrame({
+        'obs_study_id': access_data_dict['enrolment']['obs_study_id']
+        .astype(str),
+        'obs_id': access_data_dict['enrolment']['obs_study_id'],
+    })
+    id_enrol = list(access_table['obs_study_id'].unique())
+    obs_email.ObsParticipants.access_table = access_table
+    obs_email.ObsParticipants.id_enrol = id_enrol
+
+    # the list-based versions are run once: they take seconds
+    print(
+        f'{args.enrolled} enrolled, {args.excluded} excluded, '
+        f'best of {args.repeat}'
+    )
+    rows = {}
+    for name, exclude_func, remove_func, repeat in [
+        ('list', list_exclude, list_remove, 1),
+        ('set', set_exclude, set_remove, args.repeat),
+    ]:
+        exclude_seconds, id_exclude = best_time(
+            exclude_func, access_data_dict, repeat=repeat
+        )
+        remove_seconds, access_wo_excl = best_time(
+            remove_func, access_table, id_enrol, id_exclude, repeat=repeat
+        )
+        rows[name] = len(access_wo_excl.index)
+        print(
+            f'  {name:>4}: access_exclude {exclude_seconds * 1000:.1f} ms, '
+            f'remove_exclusion_ids {remove_seconds * 1000:.1f} ms'
+        )
+    assert rows['list'] == rows['set'] == args.enrolled - args.excluded
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark the REDCap export formats and decode paths
+
+A recorded REDCap CSV export (or a synthetic LSQ2 export with the EPDS
+fields) is encoded the way REDCap sends it as CSV and as JSON, then decoded
+by obs_data with every column as str and with the REDCAP_DTYPES hints.
+Transfer size is the gzip-compressed body, as negotiated by RedcapClient.
+
+Usage: python benchmarks/bench_redcap_formats.py [--rows 50000]
+                                                 [--fixture export.csv]
+"""
+
+import io
+import os
+import sys
+import gzip
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'obs_email_lsq')
+)
+import obs_data  # noqa: E402
+import obs_lsq_epds  # noqa: E402
+
+
+def synthetic_export(rows, seed=0):
+    """Synthetic LSQ2 export with the summary and EPDS fields
+
+    Parameters
+    ----------
+    rows : int
+        Number of records
+    seed : int, optional
+        Seed of the random number generator. The default is 0.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Export with every value as str ('' if missing)
+
+    """
+    rng = np.random.default_rng(seed)
+    completed = rng.random(rows) < 0.7
+    timestamp = (
+        pd.Timestamp(2016, 5, 30)
+        + pd.to_timedelta(rng.integers(0, 2000 * 86400, rows), unit='s')
+    ).strftime('%Y-%m-%d %H:%M:%S')
+    export = {
+        'obs_study_id': [f'912{num:05d}' for num in range(1, rows + 1)],
+        'lifestyle_questionnaire_2_timestamp': np.where(
+            completed, timestamp, '[not completed]'
+        ),
+        'lifestyle_questionnaire_2_complete': np.where(completed, '2', '0'),
+    }
+    for field in obs_lsq_epds.Lsq2Epds.epds_fields[1:]:
+        export[field] = np.where(
+            completed, rng.integers(0, 4, rows).astype(str), ''
+        )
+
+    return pd.DataFrame(export)
+
+
+def encode(export, fmt):
+    """Response body of an export in a REDCap format"""
+    if fmt == 'json':
+        return export.to_json(orient='records').encode('utf-8')
+    return export.to_csv(index=False).encode('utf-8')
+
+
+def decode(body, fmt, dtype):
+    """Decode a response body with obs_data"""
+    return pd.concat(
+        obs_data._read_export(
+            obs_data.RedcapBody(io.BytesIO(body).read), fmt, dtype
+        ),
+        ignore_index=True
+    )
+
+
+def time_decode(body, fmt, dtype, repeat):
+    """Best decode time, peak memory while decoding and final frame size
+
+    Memory is traced in a separate decode since tracing slows it down.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(body, fmt, dtype)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+
+    tracemalloc.start()
+    rc_data = decode(body, fmt, dtype)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak, int(rc_data.memory_usage(deep=True).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--fixture', help='recorded REDCap CSV export used instead of the '
+        'synthetic export'
+    )
+    args = parser.parse_args()
+
+    if args.fixture is None:
+        export = synthetic_export(args.rows)
+    else:
+        export = pd.read_csv(
+            args.fixture, dtype=str, keep_default_na=False, index_col=False
+        )
+
+    print(f'{len(export.index)} records, best of {args.repeat}')
+    for fmt in obs_data.REDCAP_FORMATS:
+        body = encode(export, fmt)
+        transfer = len(gzip.compress(body))
+        for name, dtype in [('str', str), ('typed', obs_data.REDCAP_DTYPES)]:
+            seconds, peak, size = time_decode(body, fmt, dtype, args.repeat)
+            print(
+                f'  {fmt:>4} {name:>5}: {transfer / 1e6:.2f} MB sent, '
+                f'{seconds:.2f} s, {peak / 1e6:.1f} MB peak, '
+                f'{size / 1e6:.1f} MB frame'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Load test the REDCap client against the local REDCap stand-in
+
+Concurrent record exports (batches of records[], as sent by
+obs_data.redcap_clinic) are sent through one pooled obs_data.RedcapClient to
+an obs_redcap_server.RedcapServer serving a synthetic LSQ2 export, with the
+requested latency, throttling and error rate injected.
+
+With --throttle, requests are paced by an obs_throttle.Throttle (AIMD limit
+of at most --workers requests in flight, retries with backoff, and hedging
+after --hedge-after seconds or a latency percentile such as p95).
+
+Usage: python benchmarks/bench_redcap_load.py [--requests 200] [--workers 4]
+           [--latency 0.05] [--jitter 0.05] [--error-rate 0.01]
+           [--max-rate 50] [--throttle [--hedge-after p95]]
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'obs_email_lsq')
+)
+import obs_data  # noqa: E402
+import obs_redcap_server  # noqa: E402
+import obs_throttle  # noqa: E402
+from bench_redcap_formats import synthetic_export  # noqa: E402
+
+
+def timed_export(client, records):
+    """Duration (seconds) and HTTP status of one records[] export"""
+    start = time.perf_counter()
+    try:
+        obs_data.redcap_data(
+            client,
+            {f'records[{i}]': obs_id for i, obs_id in enumerate(records)}
+        )
+        status = 200
+    except requests.HTTPError as error:
+        status = error.response.status_code
+    except requests.Timeout:
+        status = 'timeout'
+
+    return time.perf_counter() - start, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--max-rate', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--throttle', action='store_true')
+    parser.add_argument('--hedge-after', default=None)
+    args = parser.parse_args()
+
+    throttle = None
+    if args.throttle:
+        hedge_after = args.hedge_after
+        if hedge_after is not None and not hedge_after.startswith('p'):
+            hedge_after = float(hedge_after)
+        throttle = obs_throttle.Throttle(
+            obs_throttle.AimdLimiter(max_limit=args.workers),
+            backoff=0.1, hedge_after=hedge_after, seed=args.seed
+        )
+
+    project = synthetic_export(args.records, seed=args.seed)
+    obs_ids = project['obs_study_id'].tolist()
+    rng = np.random.default_rng(args.seed)
+    batches = [
+        rng.choice(obs_ids, args.batch_size, replace=False).tolist()
+        for _ in range(args.requests)
+    ]
+
+    with obs_redcap_server.RedcapServer(
+        {'TOKEN': project}, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, max_rate=args.max_rate, seed=args.seed
+    ) as server:
+        client = obs_data.RedcapClient(
+            'TOKEN', url=server.url, pool_size=args.workers,
+            throttle=throttle
+        )
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(
+                lambda records: timed_export(client, records), batches
+            ))
+        elapsed = time.perf_counter() - start
+        connections = client.connection_count
+        client.close()
+
+    seconds = np.array([duration for duration, _ in results])
+    statuses = [status for _, status in results]
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    print(
+        f'{args.requests} exports of {args.batch_size} records, '
+        f'{args.workers} workers'
+    )
+    print(
+        f'  {args.requests / elapsed:.1f} exports/s, '
+        f'p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, '
+        f'p99 {p99 * 1000:.0f} ms, max {seconds.max() * 1000:.0f} ms'
+    )
+    outcomes = [f'{statuses.count(200)} ok'] + [
+        f'{statuses.count(status)} {status}'
+        for status in sorted(set(statuses) - {200}, key=str)
+    ]
+    print(
+        f'  {", ".join(outcomes)}; {connections} connection(s), '
+        f'{client.bytes_received / 1e6:.1f} MB received'
+    )
+    if throttle is not None:
+        print(
+            f'  final limit {throttle.limiter.limit:.1f}, '
+            f'{throttle.limiter.decrease_count} cuts, '
+            f'{throttle.retry_count} retries, {throttle.hedge_count} hedged '
+            f'({throttle.hedge_win_count} won)'
+        )
+        throttle.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,87 @@ LINK_PATH = (
 )
 # path to access database; must be backward slash
 ACCESS_PATH = r'T:\Dept ObGyn Research\Screening\Research Database.accdb'
+# database holding the OBS tables; 'access' for the Access database at
+# ACCESS_PATH or 'sqlite' for a SQLite copy at SQLITE_PATH (e.g. for testing
+# outside Windows)
+DATABASE_BACKEND = 'access'
+# path to SQLite database used when DATABASE_BACKEND is 'sqlite'
+SQLITE_PATH = 'cache/obs.sqlite'
+# local folder for snapshots of the Access tables; None disables snapshots
+ACCESS_CACHE_DIR = 'cache/access'
+# autonumber column of OBSFollowupLog; used to only read new rows of the
+# table when its snapshot is stale
+ACCESS_FOLLOWUP_KEY = 'ID'
+# number of days after which OBSFollowupLog is read in full again
+ACCESS_RECONCILE_DAYS = 7
+# column whose highest value, along with the row count, fingerprints each
+# Access table; a snapshot stays valid while its table's fingerprint is
+# unchanged, so writes to one table do not invalidate the others
+ACCESS_FINGERPRINT_COLS = {'enrolment': 'OBSEnrolmentID', 'followup': 'ID'}
+# read the Access tables at the same time, each on its own short-lived
+# connection, instead of one after another on the run's single connection
+ACCESS_CONCURRENT_READS = True
+# number of rows streamed from each Access table at a time; None reads each
+# table at once
+ACCESS_CHUNKSIZE = 10000
+# decode the Access columns declared in obs_data.ACCESS_SCHEMA straight
+# into numpy arrays instead of letting pandas infer their types
+ACCESS_TYPED_FETCH = True
+# memory ceiling (bytes) for a streamed Access table; the run stops before
+# any Access update or email once it is exceeded. None for no ceiling
+ACCESS_MAX_BYTES = None
+# local journal that OBSFollowupLog updates are recorded in before they are
+# applied to the database
+ACCESS_JOURNAL_PATH = 'cache/access_journal.jsonl'
+# number of journalled updates committed to the database at a time
+ACCESS_JOURNAL_BATCH_SIZE = 500
+# seconds between background applies of the journalled updates
+ACCESS_JOURNAL_FLUSH_SECONDS = 5
+# connect and read timeouts (seconds) of REDCap API requests
+REDCAP_TIMEOUT = (10, 300)
+# REDCap API of the LSQ projects (e.g. the URL of an
+# obs_redcap_server.RedcapServer for load tests)
+REDCAP_API_URL = 'https://redcap.smh.ca/redcap/api/'
+# number of REDCap exports sent to the same REDCap server at a time
+REDCAP_MAX_CONCURRENT = 4
+# times a REDCap request is sent again after a 429, 502, 503, 504 or
+# connection error
+REDCAP_RETRIES = 3
+# seconds of the first (doubling, jittered) backoff before a REDCap request
+# is sent again
+REDCAP_BACKOFF_SECONDS = 1
+# seconds (or a latency percentile such as 'p95') after which an unanswered
+# REDCap export is sent a second time; None to never hedge
+REDCAP_HEDGE_AFTER = None
+# seconds above which a REDCap response makes the client send fewer requests
+# at a time; None to only slow down on errors
+REDCAP_LATENCY_TARGET = None
+# local folder for cached REDCap exports that are brought up to date with
+# records modified since the previous run
+REDCAP_CACHE_DIR = 'cache/redcap'
+# number of days after which the REDCap exports are downloaded in full again
+REDCAP_RECONCILE_DAYS = 7
+# download the REDCap exports in full this run
+REDCAP_FULL_EXPORT = False
+# let REDCap only export completed LSQs (filterLogic) instead of dropping
+# incomplete ones after downloading them
+REDCAP_FILTER_COMPLETE = True
+# directory of the cached REDCap API responses
+REDCAP_RESPONSE_CACHE_DIR = 'cache/redcap_responses'
+# REDCap response cache: 'off', 'read-through' (reuse fresh responses) or
+# 'offline' (only use cached responses, without contacting REDCap; for tests
+# and benchmarks, main.py refuses to run with it)
+REDCAP_CACHE_MODE = 'off'
+# hours a cached REDCap response is reused in 'read-through' mode
+REDCAP_CACHE_TTL_HOURS = 24
+# size (bytes) above which the least recently used responses are removed
+REDCAP_CACHE_MAX_BYTES = 500 * 1024 ** 2
+# export format ('csv' or 'json') of each LSQ project; compare them with
+# benchmarks/bench_redcap_formats.py
+REDCAP_EXPORT_FORMATS = {'lsq1': 'csv', 'lsq2': 'csv', 'lsq3': 'csv'}
+# number of days the REDCap data dictionaries (kept in REDCAP_CACHE_DIR) are
+# reused before they are exported again to check the planned fields
+REDCAP_METADATA_MAX_AGE_DAYS = 1
 
 # email information to be included in the LSQ emails
 EMAIL_INFO = {
@@ -5,12 +5,74 @@ import obs_data
 import obs_email
 import config
 import obs_lsq_epds
+import obs_storage
+import obs_journal
+import obs_async
+import obs_cache
+import obs_throttle
 import config_api
 
 
 def main():
+    # cached responses may be stale, and a run updates Access and emails
+    # participants based on them
+    if config.REDCAP_CACHE_MODE == 'offline':
+        raise ValueError(
+            "REDCAP_CACHE_MODE 'offline' cannot be used to run main.py; use "
+            "'off' or 'read-through'"
+        )
+    if config.DATABASE_BACKEND == 'sqlite':
+        path_database = config.SQLITE_PATH
+    else:
+        path_database = config.ACCESS_PATH
+    backend = obs_storage.get_backend(config.DATABASE_BACKEND, path_database)
+    # one connection shared by every Access read/write of the run; concurrent
+    # reads add a short-lived connection per table, counted by the session
+    session = obs_storage.Session(backend).open()
+    # Access updates are journalled locally and applied in the background
+    # (on a session connection of the flusher's thread); apply updates left
+    # in the journal by an interrupted run first
+    journal = obs_journal.FollowupJournal(
+        config.ACCESS_JOURNAL_PATH, session,
+        batch_size=config.ACCESS_JOURNAL_BATCH_SIZE,
+        flush_interval=config.ACCESS_JOURNAL_FLUSH_SECONDS
+    )
+    replayed = journal.flush()
+    if replayed > 0:
+        print(f'Applied {replayed} Access update(s) from an interrupted run')
+
     print('Importing Access data')
-    access_data_dict = obs_data.access_data(path_access=config.ACCESS_PATH)
+    access_stats = {}
+    try:
+        access_data_dict = obs_data.access_data(
+            backend=session, columns=obs_data.ACCESS_COLUMNS,
+            stats=access_stats, cache_dir=config.ACCESS_CACHE_DIR,
+            incremental={'followup': config.ACCESS_FOLLOWUP_KEY},
+            reconcile_days=config.ACCESS_RECONCILE_DAYS,
+            fingerprint=config.ACCESS_FINGERPRINT_COLS,
+            concurrent=config.ACCESS_CONCURRENT_READS,
+            chunksize=config.ACCESS_CHUNKSIZE,
+            max_bytes=config.ACCESS_MAX_BYTES,
+            typed=config.ACCESS_TYPED_FETCH
+        )
+    except obs_data.AccessTableTooLarge as error:
+        # nothing has been written or sent yet
+        session.close()
+        print(f'Stopping: {error} (see ACCESS_MAX_BYTES in config.py)')
+        return
+    for table, table_stats in access_stats.items():
+        if table_stats['delta']:
+            source = ' (new rows appended to snapshot)'
+        elif table_stats['cached']:
+            source = ' (snapshot)'
+        else:
+            source = ''
+        print(
+            f"  {table}: {table_stats['rows']} rows, "
+            f"{table_stats['bytes']} bytes, "
+            f"read {table_stats['read_seconds']:.2f} s, "
+            f"cleaned {table_stats['clean_seconds']:.2f} s" + source
+        )
     obs_email.ObsParticipants.set_access_table(
         access_data_dict['enrolment'], access_data_dict['followup']
     )
@@ -29,24 +91,90 @@ def main():
         path_link=config.LINK_PATH
     )
 
+    # one pooled keep-alive REDCap client per LSQ project
+    response_cache = None
+    if config.REDCAP_CACHE_MODE != 'off':
+        response_cache = obs_cache.ResponseCache(
+            config.REDCAP_RESPONSE_CACHE_DIR,
+            mode=config.REDCAP_CACHE_MODE,
+            ttl=config.REDCAP_CACHE_TTL_HOURS * 3600,
+            max_bytes=config.REDCAP_CACHE_MAX_BYTES
+        )
+    # the LSQ projects share the REDCap server, so they share its pacing
+    redcap_throttle = obs_throttle.Throttle(
+        obs_throttle.AimdLimiter(
+            max_limit=config.REDCAP_MAX_CONCURRENT,
+            latency_target=config.REDCAP_LATENCY_TARGET
+        ),
+        retries=config.REDCAP_RETRIES,
+        backoff=config.REDCAP_BACKOFF_SECONDS,
+        hedge_after=config.REDCAP_HEDGE_AFTER
+    )
+    redcap = {
+        lsq_str: obs_data.redcap_client(
+            token, timeout=config.REDCAP_TIMEOUT, cache=response_cache,
+            export_format=config.REDCAP_EXPORT_FORMATS.get(lsq_str),
+            url=config.REDCAP_API_URL, throttle=redcap_throttle
+        )
+        for lsq_str, token in config_api.redcap_api.items()
+    }
+
     lsq_dict = {}
     print('Downloading REDCap data')
+    # one export per LSQ project with the summary (recent completions) and
+    # the EPDS items of LSQ2/LSQ3; the projects are independent, so they are
+    # downloaded at the same time. Exports only include records modified
+    # since the previous run, and REDCap only sends completed LSQs
+    # (lsq_complete still drops any it sends otherwise)
+    # each export first gets the project's data dictionary, so fields
+    # missing from the project are reported before its records are exported
+    planner = obs_data.RedcapPlanner(
+        metadata_param={
+            'cache_dir': config.REDCAP_CACHE_DIR,
+            'max_age_days': config.REDCAP_METADATA_MAX_AGE_DAYS,
+        },
+        cache_dir=config.REDCAP_CACHE_DIR,
+        reconcile_days=config.REDCAP_RECONCILE_DAYS,
+        refresh=config.REDCAP_FULL_EXPORT,
+        complete_only=config.REDCAP_FILTER_COMPLETE
+    )
+    planner.add('lsq2', obs_lsq_epds.Lsq2Epds.epds_fields)
+    planner.add('lsq3', obs_lsq_epds.Lsq3Epds.epds_fields)
+    redcap_stats = {lsq_str: {} for lsq_str in ['lsq1', 'lsq2', 'lsq3']}
+    exports = {
+        lsq_str: (planner.export, redcap[lsq_str], lsq_str, lsq_stats)
+        for lsq_str, lsq_stats in redcap_stats.items()
+    }
+    redcap_aio = obs_async.AsyncRedcap(config.REDCAP_MAX_CONCURRENT)
+    redcap_frames = obs_async.gather_exports(exports, aio=redcap_aio)
+
     # list of lsq subjects given but not returned
     for lsq_num in range(1, 4):
         lsq_str = f'lsq{lsq_num}'
-        # use API to get LSQ info regarding recent completions
-        redcap_lsq = obs_data.redcap_lsq_summary(
-            config_api.redcap_api[lsq_str], lsq_num
+        redcap_lsq = obs_data.lsq_complete(
+            redcap_frames[lsq_str], stats=redcap_stats[lsq_str]
         )
-        redcap_lsq = obs_data.lsq_complete(redcap_lsq)
 
         lsq_dict[lsq_str] = obs_email.Lsq(str(lsq_num), redcap_lsq)
 
+    for name, export_stats in redcap_stats.items():
+        export_info = (
+            f"  {name}: {redcap_aio.timings[name]:.2f} s, "
+            f"{export_stats['rows']} rows ({export_stats['bytes']} bytes) "
+            'transferred'
+        )
+        if 'rows_kept' in export_stats:
+            export_info += (
+                (' (full export)' if export_stats['full'] else ' (modified)')
+                + f", {export_stats['rows_checked']} rows cached, "
+                f"{export_stats['rows_kept']} completed"
+            )
+        print(export_info)
+
     print('Updating Access')
+    journal.start()
     for val in lsq_dict.values():
-        val.update_access_returned(
-            path_access=config.ACCESS_PATH
-        )
+        val.update_access_returned(backend=session, journal=journal)
 
     print('Determining LSQ statuses')
     for val in lsq_dict.values():
@@ -73,12 +201,20 @@ def main():
     print('Sending LSQ emails')
     # num_email tracks how many emails were sent
     num_email = 0
-    # send emails, update access
+    # each subject's Access update is journalled as soon as their emails
+    # are sent, so a crash mid-send neither loses a sent email nor records
+    # one that was not sent
     for val in lsq_dict.values():
-        val.send_lsq_emails(10)
-        val.update_access_status(path_access=config.ACCESS_PATH)
+        val.send_lsq_emails(10, journal=journal)
         for val2 in val.lsq_status.values():
             num_email = num_email + len(val2)
+    journal.stop()
+    print(
+        f'  {journal.applied_count} Access update(s) applied, '
+        f'{journal.skipped_count} already present'
+    )
+    session.close()
+    print(f'  {session.connect_count} database connection(s) opened')
 
     # transfer emails from personal to communal email address:
     time.sleep(60)  # timer ensures emails in sent folder before transfer
@@ -96,15 +232,28 @@ def main():
     )
 
     print('Determining EPDS followups')
-    # EPDS info
+    # EPDS info of subjects who newly completed LSQ2/LSQ3; taken from the
+    # LSQ2/LSQ3 exports
+    epds_ids = {
+        lsq_str: lsq_dict[lsq_str].update_access_comp['obs_study_id'].tolist()
+        for lsq_str in ['lsq2', 'lsq3']
+    }
     lsq2_epds = obs_lsq_epds.Lsq2Epds(
-        lsq_dict['lsq2'].update_access_comp['obs_study_id'].tolist(),
-        config_api.redcap_api['lsq2'], cut_off=10
+        epds_ids['lsq2'], redcap['lsq2'], cut_off=10,
+        redcap_lsq2=planner.frame(
+            'lsq2', obs_lsq_epds.Lsq2Epds.epds_fields, epds_ids['lsq2']
+        )
     ).fu_ids
     lsq3_epds = obs_lsq_epds.Lsq3Epds(
-        lsq_dict['lsq3'].update_access_comp['obs_study_id'].tolist(),
-        config_api.redcap_api['lsq3'], cut_off=10
+        epds_ids['lsq3'], redcap['lsq3'], cut_off=10,
+        redcap_lsq3=planner.frame(
+            'lsq3', obs_lsq_epds.Lsq3Epds.epds_fields, epds_ids['lsq3']
+        )
     ).fu_ids
+    print(
+        f'  {planner.export_count} REDCap export(s) for '
+        f'{planner.request_count} request(s)'
+    )
     lsq_epds = lsq2_epds + lsq3_epds
 
     if len(lsq_epds) > 0:
@@ -123,6 +272,31 @@ def main():
     else:
         epds_body = 'There are no EPDS followups this week\n\n'
 
+    for lsq_str, client in redcap.items():
+        latency = client.latencies.percentiles()
+        print(
+            f'  REDCap {lsq_str}: {client.request_count} request(s), '
+            f'{client.connection_count} connection(s), '
+            f'{client.bytes_received} bytes'
+            + (
+                f', p50/p95/p99 {latency[50]:.2f}/{latency[95]:.2f}/'
+                f'{latency[99]:.2f} s' if latency else ''
+            )
+        )
+        client.close()
+    print(
+        f'  REDCap throttle: limit {redcap_throttle.limiter.limit:.1f}, '
+        f'{redcap_throttle.retry_count} retries, '
+        f'{redcap_throttle.hedge_count} hedged '
+        f'({redcap_throttle.hedge_win_count} won)'
+    )
+    redcap_throttle.close()
+    if response_cache is not None:
+        print(
+            f'  REDCap response cache: {response_cache.hits} hit(s), '
+            f'{response_cache.misses} miss(es)'
+        )
+
     obs_email.send_email(
         config.EPDS_FU_EMAIL,
         'EPDS Followup',
@@ -0,0 +1,151 @@
+"""Concurrent REDCap exports with asyncio"""
+
+import time
+import asyncio
+import urllib.parse
+import obs_data
+
+
+class AsyncRedcap():
+    """Awaitable REDCap exports with a concurrency limit per host
+
+    Exports run the blocking obs_data functions in worker threads on the
+    pooled obs_data.RedcapClient of their token, so independent projects can
+    be downloaded at the same time without a second HTTP stack.
+
+    Attributes
+    ----------
+    max_per_host : int
+        Number of exports sent to the same REDCap server at a time
+    peak : dict of int
+        Key is the host, value is the largest number of exports it was sent
+        at the same time
+    timings : dict of float
+        Key is the name of an export run by gather, value is its duration
+        (seconds)
+
+    Examples
+    --------
+    >>> async def exports(tokens):
+    ...     aio = AsyncRedcap(max_per_host=4)
+    ...     return await asyncio.gather(*(
+    ...         aio.export(obs_data.redcap_lsq_summary, token, lsq_num)
+    ...         for lsq_num, token in tokens.items()
+    ...     ))
+    """
+    def __init__(self, max_per_host=4):
+        """Exports limited per REDCap host
+
+        Parameters
+        ----------
+        max_per_host : int, optional
+            Number of exports sent to the same REDCap server at a time. The
+            default is 4.
+        """
+        self.max_per_host = max_per_host
+        self.peak = {}
+        self.timings = {}
+        self._active = {}
+        # semaphores belong to the event loop they were created in; they are
+        # created again when the runner is used by another loop (e.g. a
+        # second gather_exports)
+        self._semaphores = {}
+        self._loop = None
+
+    async def export(self, func, api_param, *args, **kwargs):
+        """Run a REDCap export once its host has a free slot
+
+        Parameters
+        ----------
+        func : callable
+            Blocking export taking the REDCap client as its first argument
+            (e.g. obs_data.redcap_data or obs_data.redcap_lsq_summary)
+        api_param : str or obs_data.RedcapClient
+            API token of the REDCap project, or the client of that token
+        *args, **kwargs
+            Passed to func after the client
+
+        Returns
+        -------
+        Return value of func
+        """
+        client = obs_data.redcap_client(api_param)
+        host = urllib.parse.urlsplit(client.url).netloc
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphores = {}
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+            self._active[host] = 0
+            self.peak.setdefault(host, 0)
+
+        async with self._semaphores[host]:
+            self._active[host] += 1
+            self.peak[host] = max(self.peak[host], self._active[host])
+            try:
+                return await asyncio.to_thread(func, client, *args, **kwargs)
+            finally:
+                self._active[host] -= 1
+
+    async def gather(self, exports):
+        """Run REDCap exports concurrently and wait for all of them
+
+        Parameters
+        ----------
+        exports : dict of tuples
+            Key is the name of the export, value is (func, api_param, *args)
+            as passed to self.export
+
+        Returns
+        -------
+        dict
+            Key is the name of the export, value is its result
+
+        Raises
+        ------
+        Exception
+            The first error raised by an export, once every export finished
+        """
+        async def timed(name, export):
+            start = time.perf_counter()
+            try:
+                return await self.export(*export)
+            finally:
+                self.timings[name] = time.perf_counter() - start
+
+        results = await asyncio.gather(
+            *(timed(name, export) for name, export in exports.items()),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return dict(zip(exports, results))
+
+
+def gather_exports(exports, max_per_host=4, aio=None):
+    """Run REDCap exports concurrently from synchronous code
+
+    Parameters
+    ----------
+    exports : dict of tuples
+        Key is the name of the export, value is (func, api_param, *args); see
+        AsyncRedcap.gather
+    max_per_host : int, optional
+        Number of exports sent to the same REDCap server at a time. The
+        default is 4.
+    aio : AsyncRedcap, optional
+        Runner whose peak and timings are updated. The default is None (a
+        new runner with max_per_host).
+
+    Returns
+    -------
+    dict
+        Key is the name of the export, value is its result
+    """
+    if aio is None:
+        aio = AsyncRedcap(max_per_host)
+
+    return asyncio.run(aio.gather(exports))
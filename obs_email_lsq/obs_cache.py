@@ -0,0 +1,755 @@
+"""Local on-disk caches of OBS data"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import pandas as pd
+import pyarrow
+import pyarrow.feather as feather
+
+
+class AccessSnapshot():
+    """Columnar (Arrow IPC) snapshots of cleaned Access tables
+
+    Snapshots are written uncompressed so warm runs can memory-map them
+    instead of reading the Access database through ODBC.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory containing the snapshots
+    path_access : str
+        Path to the Access database the snapshots were taken from
+    checksum : bool
+        If True, a snapshot is valid while the content checksum of the
+        Access database is unchanged; otherwise, while its modification time
+        and size are unchanged
+    refresh : bool
+        If True, every snapshot is treated as stale
+    meta_path : str
+        Path to the JSON file describing the snapshots
+
+    """
+    def __init__(self, cache_dir, path_access, checksum=False, refresh=False):
+        """Snapshots of the Access database
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory containing the snapshots; created if it does not exist
+        path_access : str
+            Path to Access database
+        checksum : bool, optional
+            Validate snapshots against a checksum of the Access database
+            rather than its modification time. The default is False.
+        refresh : bool, optional
+            Treat every snapshot as stale. The default is False.
+        """
+        self.cache_dir = cache_dir
+        self.path_access = path_access
+        self.checksum = checksum
+        self.refresh = refresh
+        self.meta_path = os.path.join(cache_dir, 'snapshot.json')
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._source_state = None
+
+    def source_state(self):
+        """State of the Access database used to validate snapshots
+
+        Returns
+        -------
+        dict
+            'mtime' and 'size' of the Access database, and 'sha256' if
+            self.checksum is True
+
+        """
+        if self._source_state is None:
+            file_stat = os.stat(self.path_access)
+            self._source_state = {
+                'mtime': file_stat.st_mtime,
+                'size': file_stat.st_size,
+            }
+            if self.checksum:
+                self._source_state['sha256'] = file_checksum(self.path_access)
+
+        return self._source_state
+
+    def load(self, key, columns=None, fingerprint=None, max_age_days=None):
+        """Load a snapshot if it is still valid
+
+        Parameters
+        ----------
+        key : str
+            Key of the table (e.g. 'followup')
+        columns : list of str, optional
+            Column projection the snapshot must have been taken with. The
+            default is None (i.e. all columns).
+        fingerprint : list, optional
+            Current fingerprint of the table (see obs_data.access_data).
+            If provided, the snapshot is valid while the fingerprint it was
+            saved with is unchanged, whatever the state of the rest of the
+            Access database. The default is None (validate against the whole
+            Access database).
+        max_age_days : int or float, optional
+            Snapshots validated by fingerprint whose last full read is older
+            than this are stale, so that edits to existing rows (which do not
+            change the fingerprint) are eventually picked up. The default is
+            None (no age limit).
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            Cleaned Access table, or None if there is no valid snapshot
+
+        """
+        # capture the state before the Access database is read so a
+        # snapshot is never stamped with a newer state than its contents
+        source_state = self.source_state()
+        if self.refresh:
+            return None
+
+        table_meta = self._read_meta().get(key)
+        if table_meta is None or table_meta['columns'] != columns:
+            return None
+
+        if fingerprint is not None:
+            if table_meta.get('fingerprint') != list(fingerprint) or (
+                max_age_days is not None
+                and time.time() - table_meta.get('reconciled', 0)
+                > max_age_days * 24 * 60 * 60
+            ):
+                return None
+        elif self.checksum:
+            if table_meta['source'].get('sha256') != source_state['sha256']:
+                return None
+        elif (
+            table_meta['source']['mtime'] != source_state['mtime']
+            or table_meta['source']['size'] != source_state['size']
+        ):
+            return None
+
+        path_table = self._table_path(key)
+        if not os.path.exists(path_table):
+            return None
+
+        return feather.read_table(path_table, memory_map=True).to_pandas()
+
+    def load_incremental(self, key, columns, watermark_col, reconcile_days):
+        """Load a snapshot that can be brought up to date with a delta fetch
+
+        Unlike self.load, the snapshot may be older than the Access database;
+        rows with watermark_col above the returned watermark are missing.
+
+        Parameters
+        ----------
+        key : str
+            Key of the table (e.g. 'followup')
+        columns : list of str
+            Column projection the snapshot must have been taken with
+        watermark_col : str
+            Column the watermark must have been taken on
+        reconcile_days : int or float
+            Snapshots whose last full read is older than this are not
+            returned so that edits to existing rows are eventually picked up
+
+        Returns
+        -------
+        (pandas.DataFrame, int) or (None, None)
+            Cleaned Access table and its watermark, or None and None if
+            there is no usable snapshot
+
+        """
+        if self.refresh:
+            return None, None
+
+        table_meta = self._read_meta().get(key)
+        if (
+            table_meta is None
+            or table_meta['columns'] != columns
+            or table_meta.get('watermark_col') != watermark_col
+            or table_meta.get('watermark') is None
+            or (
+                time.time() - table_meta.get('reconciled', 0)
+                > reconcile_days * 24 * 60 * 60
+            )
+        ):
+            return None, None
+
+        path_table = self._table_path(key)
+        if not os.path.exists(path_table):
+            return None, None
+
+        table = feather.read_table(path_table, memory_map=True).to_pandas()
+        return table, table_meta['watermark']
+
+    def save(
+        self, key, table, columns=None, watermark_col=None, watermark=None,
+        full_read=True, fingerprint=None
+    ):
+        """Save a snapshot of a cleaned Access table
+
+        Tables that cannot be converted to Arrow (e.g. columns with mixed
+        types) are not cached.
+
+        Parameters
+        ----------
+        key : str
+            Key of the table (e.g. 'followup')
+        table : pandas.DataFrame
+            Cleaned Access table
+        columns : list of str, optional
+            Column projection the table was read with. The default is None
+            (i.e. all columns).
+        watermark_col : str, optional
+            Column the watermark was taken on. The default is None.
+        watermark : int, optional
+            Highest value of watermark_col in the Access table when it was
+            read, including rows removed during cleaning. The default is
+            None.
+        full_read : bool, optional
+            True if the table was just read in full rather than brought up to
+            date with a delta fetch. The default is True.
+        fingerprint : list, optional
+            Fingerprint of the table taken before it was read (see
+            self.load). The default is None.
+
+        Returns
+        -------
+        bool
+            True if the snapshot was saved
+
+        """
+        path_table = self._table_path(key)
+        path_tmp = path_table + '.tmp'
+        try:
+            feather.write_feather(
+                table.reset_index(drop=True), path_tmp,
+                compression='uncompressed'
+            )
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
+            return False
+        os.replace(path_tmp, path_table)
+
+        meta = self._read_meta()
+        if full_read:
+            reconciled = time.time()
+        else:
+            reconciled = meta.get(key, {}).get('reconciled', 0)
+        meta[key] = {
+            'columns': columns,
+            'source': self.source_state(),
+            'watermark_col': watermark_col,
+            'watermark': watermark,
+            'reconciled': reconciled,
+            'fingerprint': None if fingerprint is None else list(fingerprint),
+        }
+        self._write_meta(meta)
+
+        return True
+
+    def _table_path(self, key):
+        """Path to the snapshot of a table"""
+        return os.path.join(self.cache_dir, key + '.arrow')
+
+    def _read_meta(self):
+        """Read the snapshot descriptions; empty if there are none"""
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path) as meta_file:
+            return json.load(meta_file)
+
+    def _write_meta(self, meta):
+        """Atomically write the snapshot descriptions"""
+        path_tmp = self.meta_path + '.tmp'
+        with open(path_tmp, 'w') as meta_file:
+            json.dump(meta, meta_file, indent=1)
+        os.replace(path_tmp, self.meta_path)
+
+
+class RedcapView():
+    """Locally cached full views of REDCap exports kept up to date with
+    incremental (dateRangeBegin) exports
+
+    Views are stored as CSV so they are read back exactly like a fresh
+    export (all columns as str).
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory containing the views
+    meta_path : str
+        Path to the JSON file describing the views
+
+    """
+    def __init__(self, cache_dir):
+        """Views of REDCap exports
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory containing the views; created if it does not exist
+        """
+        self.cache_dir = cache_dir
+        self.meta_path = os.path.join(cache_dir, 'redcap.json')
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, key, token, params, reconcile_days):
+        """Load a view that can be brought up to date with a delta export
+
+        Parameters
+        ----------
+        key : str
+            Key of the view (e.g. 'lsq1_summary')
+        token : str
+            API token of the REDCap project the view was exported from; only
+            a digest is stored
+        params : dict
+            Request parameters the view was exported with
+        reconcile_days : int or float
+            Views whose last full export is older than this are not returned
+            so that deleted records are eventually dropped
+
+        Returns
+        -------
+        (pandas.DataFrame, str) or (None, None)
+            View and its watermark ('%Y-%m-%d %H:%M:%S'), or None and None if
+            there is no usable view
+
+        """
+        view_meta = self._read_meta().get(key)
+        if (
+            view_meta is None
+            or view_meta['project'] != _token_digest(token)
+            or view_meta['params'] != _sorted_params(params)
+            or (
+                time.time() - view_meta['reconciled']
+                > reconcile_days * 24 * 60 * 60
+            )
+        ):
+            return None, None
+
+        path_view = self._view_path(key)
+        if not os.path.exists(path_view):
+            return None, None
+
+        view = pd.read_csv(path_view, index_col=False, dtype=str)
+        return view, view_meta['watermark']
+
+    def save(self, key, token, params, view, watermark, full_export=True):
+        """Save a view and the watermark of the export it includes
+
+        Parameters
+        ----------
+        key : str
+            Key of the view (e.g. 'lsq1_summary')
+        token : str
+            API token of the REDCap project
+        params : dict
+            Request parameters the view was exported with
+        view : pandas.DataFrame
+            Full view of the export
+        watermark : str
+            Records modified after this time ('%Y-%m-%d %H:%M:%S') may be
+            missing from the view
+        full_export : bool, optional
+            True if the view was just exported in full rather than brought
+            up to date with a delta export. The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        path_view = self._view_path(key)
+        path_tmp = path_view + '.tmp'
+        view.to_csv(path_tmp, index=False)
+        os.replace(path_tmp, path_view)
+
+        meta = self._read_meta()
+        if full_export:
+            reconciled = time.time()
+        else:
+            reconciled = meta.get(key, {}).get('reconciled', 0)
+        meta[key] = {
+            'project': _token_digest(token),
+            'params': _sorted_params(params),
+            'watermark': watermark,
+            'reconciled': reconciled,
+        }
+        self._write_meta(meta)
+
+    def _view_path(self, key):
+        """Path to a view"""
+        return os.path.join(self.cache_dir, key + '.csv')
+
+    def _read_meta(self):
+        """Read the view descriptions; empty if there are none"""
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path) as meta_file:
+            return json.load(meta_file)
+
+    def _write_meta(self, meta):
+        """Atomically write the view descriptions"""
+        path_tmp = self.meta_path + '.tmp'
+        with open(path_tmp, 'w') as meta_file:
+            json.dump(meta, meta_file, indent=1)
+        os.replace(path_tmp, self.meta_path)
+
+
+class RedcapMetadata():
+    """Locally cached data dictionaries (content=metadata) of REDCap projects
+
+    Each data dictionary is stored as the CSV REDCap exported, along with
+    the time it was exported and its sha256, which tells whether a newer
+    export of the project's data dictionary changed.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory containing the data dictionaries
+    meta_path : str
+        Path to the JSON file describing the data dictionaries
+
+    """
+    def __init__(self, cache_dir):
+        """Data dictionaries of REDCap projects
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory containing the data dictionaries; created if it does
+            not exist
+        """
+        self.cache_dir = cache_dir
+        self.meta_path = os.path.join(cache_dir, 'metadata.json')
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, token, max_age_days=None):
+        """Load the data dictionary of a project
+
+        Parameters
+        ----------
+        token : str
+            API token of the REDCap project; only a digest is stored
+        max_age_days : int or float, optional
+            Data dictionaries exported longer ago are not returned. The
+            default is None (any age).
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            Data dictionary (all columns as str), or None if there is no
+            usable one
+        """
+        digest = _token_digest(token)
+        project_meta = self._read_meta().get(digest)
+        if project_meta is None or (
+            max_age_days is not None
+            and time.time() - project_meta['exported']
+            > max_age_days * 24 * 60 * 60
+        ):
+            return None
+
+        path_metadata = self._metadata_path(digest)
+        if not os.path.exists(path_metadata):
+            return None
+        return pd.read_csv(path_metadata, index_col=False, dtype=str)
+
+    def save(self, token, content):
+        """Save the data dictionary exported from a project
+
+        Parameters
+        ----------
+        token : str
+            API token of the REDCap project
+        content : bytes
+            Data dictionary as exported by REDCap (CSV)
+
+        Returns
+        -------
+        bool
+            True if it differs from the cached data dictionary (or there was
+            none)
+        """
+        digest = _token_digest(token)
+        sha256 = hashlib.sha256(content).hexdigest()
+        path_metadata = self._metadata_path(digest)
+        path_tmp = path_metadata + '.tmp'
+        with open(path_tmp, 'wb') as metadata_file:
+            metadata_file.write(content)
+        os.replace(path_tmp, path_metadata)
+
+        meta = self._read_meta()
+        changed = meta.get(digest, {}).get('sha256') != sha256
+        meta[digest] = {'exported': time.time(), 'sha256': sha256}
+        path_tmp = self.meta_path + '.tmp'
+        with open(path_tmp, 'w') as meta_file:
+            json.dump(meta, meta_file, indent=1)
+        os.replace(path_tmp, self.meta_path)
+
+        return changed
+
+    def _metadata_path(self, digest):
+        """Path to the data dictionary of a project"""
+        return os.path.join(self.cache_dir, f'metadata_{digest}.csv')
+
+    def _read_meta(self):
+        """Read the data dictionary descriptions; empty if there are none"""
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path) as meta_file:
+            return json.load(meta_file)
+
+
+class ResponseCache():
+    """Content-addressed on-disk cache of REDCap API responses
+
+    Responses are stored gzip-compressed under a hash of the project and
+    the request parameters. Reads refresh an entry's access time, which
+    orders the least recently used entries for eviction.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory containing the responses
+    mode : str
+        'off' (never used), 'read-through' (fresh responses are returned
+        from the cache, others are requested and cached) or 'offline'
+        (responses are only returned from the cache, however old)
+    ttl : int or float or None
+        Seconds a response is fresh; None for no expiry
+    max_bytes : int or None
+        Size of the cache (compressed bytes) above which the least recently
+        used responses are removed; None for no limit
+    hits : int
+        Number of responses returned from the cache
+    misses : int
+        Number of responses not found (or stale) in the cache
+
+    """
+    MODES = ('off', 'read-through', 'offline')
+
+    def __init__(
+        self, cache_dir, mode='read-through', ttl=None, max_bytes=None
+    ):
+        """Cache of REDCap responses
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory containing the responses; created if it does not exist
+        mode : str, optional
+            'off', 'read-through' or 'offline'. The default is
+            'read-through'.
+        ttl : int or float, optional
+            Seconds a response is fresh. The default is None (no expiry).
+        max_bytes : int, optional
+            Size of the cache (compressed bytes) kept by evicting the least
+            recently used responses. The default is None (no limit).
+
+        Raises
+        ------
+        ValueError
+            If mode is not one of self.MODES
+        """
+        if mode not in self.MODES:
+            raise ValueError(
+                f'Unknown cache mode "{mode}"; expected one of '
+                + ', '.join(self.MODES)
+            )
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def offline(self):
+        """True if responses may only come from the cache"""
+        return self.mode == 'offline'
+
+    def key(self, token, params):
+        """Hash of a request
+
+        Parameters
+        ----------
+        token : str
+            API token of the REDCap project
+        params : dict
+            Request parameters, without the token
+
+        Returns
+        -------
+        str
+        """
+        request = json.dumps(
+            [_token_digest(token), _sorted_params(params)],
+            separators=(',', ':')
+        )
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def get(self, token, params):
+        """Cached response of a request
+
+        Parameters
+        ----------
+        token : str
+            API token of the REDCap project
+        params : dict
+            Request parameters, without the token
+
+        Returns
+        -------
+        bytes or None
+            Response, or None if it is not cached (or is stale and the cache
+            is not offline)
+
+        Raises
+        ------
+        LookupError
+            If the cache is offline and the response is not cached
+        """
+        if self.mode == 'off':
+            return None
+
+        path = self._response_path(self.key(token, params))
+        try:
+            file_stat = os.stat(path)
+            stale = (
+                not self.offline and self.ttl is not None
+                and time.time() - file_stat.st_mtime > self.ttl
+            )
+            if not stale:
+                with gzip.open(path, 'rb') as response_file:
+                    response = response_file.read()
+                # access time orders entries for eviction
+                os.utime(path, (time.time(), file_stat.st_mtime))
+                self.hits += 1
+                return response
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        if self.offline:
+            raise LookupError(
+                'REDCap response not in the offline cache: '
+                + json.dumps(params)
+            )
+        return None
+
+    def put(self, token, params, response):
+        """Cache a response, then evict responses over self.max_bytes
+
+        Parameters
+        ----------
+        token : str
+            API token of the REDCap project
+        params : dict
+            Request parameters, without the token
+        response : bytes
+            Response body
+
+        Returns
+        -------
+        None.
+        """
+        if self.mode != 'read-through':
+            return
+
+        path = self._response_path(self.key(token, params))
+        fd, path_tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            with gzip.GzipFile(fileobj=tmp_file, mode='wb') as gzip_file:
+                gzip_file.write(response)
+        os.replace(path_tmp, path)
+
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        """Remove the least recently used responses over a size
+
+        Parameters
+        ----------
+        max_bytes : int
+            Size of the cache (compressed bytes) to keep
+
+        Returns
+        -------
+        int
+            Number of responses removed
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.gz'):
+                try:
+                    file_stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append(
+                    (file_stat.st_atime, file_stat.st_size, entry.path)
+                )
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+
+        return removed
+
+    def _response_path(self, key):
+        """Path to a cached response"""
+        return os.path.join(self.cache_dir, key + '.gz')
+
+
+def _token_digest(token):
+    """Digest identifying a REDCap project without storing its token"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+
+
+def _sorted_params(params):
+    """Request parameters as a sorted list of [name, value] pairs"""
+    return [[name, str(value)] for name, value in sorted(params.items())]
+
+
+def file_checksum(path, block_size=1 << 20):
+    """SHA-256 checksum of a file
+
+    Parameters
+    ----------
+    path : str
+        Path to the file
+    block_size : int, optional
+        Number of bytes read at a time. The default is 1 MiB.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of the file
+
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            sha256.update(block)
+
+    return sha256.hexdigest()
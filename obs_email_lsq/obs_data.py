@@ -2,20 +2,121 @@
 
 import io
 import re
+import csv
+import json
+import time
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import (
+    ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+)
+import numpy as np
 import pandas as pd
 import requests
-import pyodbc
+import obs_cache
+import obs_storage
+import obs_throttle
+
+
+# Access table names associated with the keys returned by access_data
+ACCESS_TABLES = {
+    'enrolment': 'OBS Enrolment Log',
+    'followup': 'OBSFollowupLog',
+    'screening': 'OBS Screening log',
+}
+
+# Access columns read downstream by obs_email.ObsParticipants, obs_email.Lsq
+# and access_exclude; used for column-projected reads in access_data
+ACCESS_COLUMNS = {
+    'enrolment': [
+        'OBSEnrolmentID', 'EDC', 'DIPLateEntry', 'DIPCurEnrol',
+        'Previous OBS participant',
+    ],
+    'followup': [
+        'OBSEnrolmentID', 'PatientID', 'PatientFirstName', 'PatientSurname',
+        'OBSVisitDate', 'DeliveryDate', 'TwinBDelivery',
+        'NoUse', 'NoContact', 'NoAccess', 'Fetal Demise/Termination',
+        'Neonatal death',
+    ] + [
+        col.format(lsq_num)
+        for lsq_num in range(1, 4)
+        for col in [
+            'LSQ({})Given', 'LSQ({})Followup1', 'LSQ({})Followup2',
+            'LSQ({})Followup3', 'LSQ({})Returned', 'LSQ{}Refused',
+            'Paper LSQ{}',
+        ]
+    ],
+}
+
+# numpy types of the Access columns decoded by the typed fetch path; 'obs_id'
+# parses OBSEnrolmentID (e.g. 'OBS912-00001') into a nullable integer and
+# undeclared columns are left as Python objects
+ACCESS_SCHEMA = {
+    'ID': 'int64',
+    'OBSEnrolmentID': 'obs_id',
+    'EDC': 'datetime64[ns]',
+    'OBSVisitDate': 'datetime64[ns]',
+    'DeliveryDate': 'datetime64[ns]',
+    'DIPLateEntry': 'bool',
+    'DIPCurEnrol': 'bool',
+    'Previous OBS participant': 'bool',
+    'NoUse': 'bool',
+    'NoContact': 'bool',
+    'NoAccess': 'bool',
+    'Fetal Demise/Termination': 'bool',
+    'Neonatal death': 'bool',
+}
+ACCESS_SCHEMA.update({
+    col.format(lsq_num): 'bool'
+    for lsq_num in range(1, 4)
+    for col in [
+        'LSQ({})Given', 'LSQ({})Followup1', 'LSQ({})Followup2',
+        'LSQ({})Followup3', 'LSQ({})Returned', 'LSQ{}Refused', 'Paper LSQ{}',
+    ]
+})
+
+# REDCap API of the OBS LSQ projects
+REDCAP_API_URL = 'https://redcap.smh.ca/redcap/api/'
+
+# connect and read timeouts (seconds) of REDCap requests
+REDCAP_TIMEOUT = (10, 300)
+
+# seconds subtracted from the start of an export for its dateRangeBegin
+# watermark; see redcap_incremental
+REDCAP_WATERMARK_OVERLAP = 60 * 60
+
+# shared RedcapClient of each API token; see redcap_client
+_REDCAP_CLIENTS = {}
+
+# type hints of exported REDCap columns as (column name pattern, type);
+# survey completion codes are 0 (incomplete), 1 (unverified) and 2 (complete)
+# and timestamps that are not dates (e.g. '[not completed]') are NaT
+REDCAP_DTYPES = (
+    (r'^obs_study_id$', 'Int64'),
+    (r'_complete$', pd.CategoricalDtype(['0', '1', '2'])),
+    (r'_timestamp$', 'datetime64[ns]'),
+)
+
+# bytes read from a REDCap response at a time by the streaming CSV parser
+REDCAP_READ_SIZE = 2 ** 18
+
+# record export formats decoded by redcap_data
+REDCAP_FORMATS = ('csv', 'json')
 
 
 def access_data(
-    path_access, enrolment=True, followup=True, screening=False
+    path_access=None, enrolment=True, followup=True, screening=False,
+    columns=None, stats=None, cache_dir=None, refresh=False, checksum=False,
+    incremental=None, reconcile_days=7, concurrent=False, chunksize=None,
+    max_bytes=None, typed=False, fingerprint=None, backend=None
 ):
     """Get data from Access database
 
     Parameters
     ----------
     path_access : str, optional
-        Path to Access database.
+        Path to Access database; used when backend is None.
     enrolment : bool, optional
         Setting to True will return dictionary containing 'enrolment'
         (i.e. 'OBS Enrolment Log') pandas dataframe. The default is True.
@@ -25,6 +126,68 @@ def access_data(
     screening : bool, optional
         Setting to True will return dictionary containing 'enrolment'
         (i.e. 'OBS Screening Log') pandas dataframe. The default is False.
+    columns : dict of lists, optional
+        Columns to read from each table, keyed as in ACCESS_TABLES (e.g.
+        ACCESS_COLUMNS). Tables without a key are read in full. The default
+        is None, which reads every column of every table.
+    stats : dict, optional
+        If provided, filled with the number of 'rows' and 'bytes' (in-memory
+        size of the uncleaned rows) pulled from each table, whether it was
+        loaded from a snapshot ('cached'), whether only new rows were read
+        ('delta'), and the seconds spent reading ('read_seconds') and
+        cleaning ('clean_seconds') it. The default is None.
+    cache_dir : str, optional
+        Directory of columnar snapshots of the cleaned tables (see
+        obs_cache.AccessSnapshot). Valid snapshots are loaded instead of
+        reading the Access database. The default is None (no snapshots).
+    refresh : bool, optional
+        Setting to True will ignore existing snapshots and take new ones.
+        The default is False.
+    checksum : bool, optional
+        Setting to True will validate snapshots against a checksum of the
+        Access database instead of its modification time. The default is
+        False.
+    fingerprint : dict of str, optional
+        Tables whose snapshots are validated on their own rather than
+        against the whole Access database, keyed as in ACCESS_TABLES, with
+        the column whose highest value fingerprints the table along with its
+        row count (e.g. {'followup': 'ID'}); writes to other tables then
+        leave their snapshots valid. Such snapshots are also taken again
+        after reconcile_days to pick up edits to existing rows. The default
+        is None.
+    incremental : dict of str, optional
+        Tables that are only appended to, keyed as in ACCESS_TABLES, with
+        the name of their autonumber column (e.g. {'followup': 'ID'}). When
+        the snapshot of such a table is stale, only rows above the highest
+        autonumber in the snapshot are read and appended to it. Requires
+        cache_dir. The default is None.
+    reconcile_days : int or float, optional
+        Number of days after which incremental and fingerprinted tables are
+        read in full again to pick up edits to existing rows. The default is
+        7.
+    concurrent : bool, optional
+        Setting to True will read the tables at the same time, each on its
+        own connection, and clean each table as soon as it arrives. With an
+        obs_storage.Session, these connections are counted by the session
+        and closed once their table is read. The default is False
+        (the tables are read one after another on a single connection).
+    chunksize : int, optional
+        If provided, tables are streamed from Access this many rows at a
+        time and each chunk is cleaned before the next one is read, so only
+        one chunk of uncleaned rows is held in memory. The default is None
+        (each table is read at once).
+    max_bytes : int, optional
+        Memory ceiling for a single streamed table, counting its cleaned
+        rows and the uncleaned chunk being read; AccessTableTooLarge is
+        raised once it is exceeded. Only used with chunksize. The default is
+        None (no ceiling).
+    typed : bool, optional
+        Setting to True will decode the columns declared in ACCESS_SCHEMA
+        straight into numpy arrays (see fetch_typed) instead of letting
+        pandas infer their types. The default is False.
+    backend : obs_storage.StorageBackend, optional
+        Database holding the tables. The default is None, which reads the
+        Access database at path_access.
 
     Returns
     -------
@@ -32,35 +195,632 @@ def access_data(
         'enrolment' contains 'OBS Enrolment Log' Access table
         'followup' contains 'OBSFollowupLog' Access table
         'screening' contains 'OBS Screening Log' Access table
+
+    Notes
+    -----
+        The watermark of an incremental table must increase with every
+        insert; 'OBSVisitDate' is not suitable since returned LSQs are
+        inserted with their REDCap completion date.
     """
 
-    cnxn = pyodbc.connect(
-        (
-            r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)}; DBQ='
-            + path_access +
-            r';;UID="";PWD="";'
-        )
-    )
+    if backend is None:
+        backend = obs_storage.AccessBackend(path_access)
+    if columns is None:
+        columns = {}
+    if incremental is None or cache_dir is None:
+        incremental = {}
+    if fingerprint is None or cache_dir is None:
+        fingerprint = {}
+    keys = [
+        key for key, include in [
+            ('enrolment', enrolment), ('followup', followup),
+            ('screening', screening)
+        ] if include
+    ]
+    # the watermark column has to be read along with a column projection
+    table_columns = {}
+    for key in keys:
+        table_columns[key] = columns.get(key)
+        if (
+            key in incremental and table_columns[key]
+            and incremental[key] not in table_columns[key]
+        ):
+            table_columns[key] = table_columns[key] + [incremental[key]]
 
     access_dict = {}
-    if enrolment:
-        access_dict['enrolment'] = pd.read_sql(
-            "Select * From [OBS Enrolment Log]", cnxn
+    # key is the table to read from Access, value is the watermark above
+    # which rows are read (None to read the full table)
+    read_dict = {}
+    snapshot = None
+    if cache_dir is not None:
+        snapshot = obs_cache.AccessSnapshot(
+            cache_dir, backend.path, checksum=checksum, refresh=refresh
         )
-    if followup:
-        access_dict['followup'] = pd.read_sql(
-            "Select * From [OBSFollowupLog]", cnxn
+    # taken before the tables are read so a snapshot is never stamped with a
+    # newer fingerprint than its contents
+    fingerprints = {}
+    if any(key in fingerprint for key in keys):
+        cnxn = backend.connect()
+        try:
+            for key in keys:
+                if key in fingerprint:
+                    fingerprints[key] = _access_fingerprint(
+                        cnxn, key, fingerprint[key]
+                    )
+        finally:
+            backend.release(cnxn)
+    for key in keys:
+        if snapshot is not None:
+            table = snapshot.load(
+                key, table_columns[key], fingerprint=fingerprints.get(key),
+                max_age_days=reconcile_days
+            )
+            if table is not None:
+                access_dict[key] = table
+                if stats is not None:
+                    stats[key] = {
+                        'rows': len(table.index), 'bytes': 0,
+                        'cached': True, 'delta': False,
+                        'read_seconds': 0.0, 'clean_seconds': 0.0,
+                    }
+                continue
+        read_dict[key] = None
+        if key in incremental:
+            table, watermark = snapshot.load_incremental(
+                key, table_columns[key], incremental[key], reconcile_days
+            )
+            if table is not None:
+                access_dict[key] = table
+                read_dict[key] = watermark
+
+    queries = {}
+    for key, watermark in read_dict.items():
+        if watermark is None:
+            queries[key] = (_access_query(key, table_columns[key]), None)
+        else:
+            queries[key] = (
+                _access_query(
+                    key, table_columns[key], after_col=incremental[key]
+                ),
+                [watermark]
+            )
+
+    for key, loaded in _read_access_tables(
+        backend, queries, watermark_cols=incremental,
+        concurrent=concurrent, chunksize=chunksize, max_bytes=max_bytes,
+        typed=typed
+    ):
+        watermark = read_dict[key]
+        if stats is not None:
+            stats[key] = {
+                'rows': loaded['rows'],
+                'bytes': loaded['bytes'],
+                'cached': watermark is not None,
+                'delta': watermark is not None,
+                'read_seconds': loaded['read_seconds'],
+                'clean_seconds': loaded['clean_seconds'],
+            }
+        if loaded['watermark'] is not None:
+            watermark = max(
+                loaded['watermark'], -1 if watermark is None else watermark
+            )
+        if read_dict[key] is None:
+            access_dict[key] = loaded['table']
+        elif len(loaded['table'].index) > 0:
+            access_dict[key] = pd.concat(
+                [access_dict[key], loaded['table']], ignore_index=True
+            )
+        if snapshot is not None:
+            snapshot.save(
+                key, access_dict[key], table_columns[key],
+                watermark_col=incremental.get(key), watermark=watermark,
+                full_read=read_dict[key] is None,
+                fingerprint=fingerprints.get(key)
+            )
+
+    return {key: access_dict[key] for key in keys}
+
+
+def _read_access_tables(
+    backend, queries, watermark_cols=None, concurrent=False,
+    chunksize=None, max_bytes=None, typed=False
+):
+    """Read and clean Access tables, yielding each table as soon as it is done
+
+    Parameters
+    ----------
+    backend : obs_storage.StorageBackend
+        Database holding the tables.
+    queries : dict of tuples
+        Key is the table key, value is the SQL statement and its parameters
+        (or None).
+    watermark_cols : dict of str, optional
+        Key is the table key, value is the column whose highest value is
+        returned as the watermark of the table. The default is None.
+    concurrent : bool, optional
+        Setting to True will run the queries in a thread pool, each on its
+        own connection (closed once its query is done, even with an
+        obs_storage.Session, which still counts it); otherwise the queries
+        run one after another on a single connection. The default is False.
+    chunksize : int, optional
+        Passed to _load_access_table. The default is None.
+    max_bytes : int, optional
+        Passed to _load_access_table. The default is None.
+    typed : bool, optional
+        Passed to _load_access_table. The default is False.
+
+    Yields
+    ------
+    (str, dict)
+        Table key and the table loaded by _load_access_table (read_seconds
+        includes opening its connection when concurrent)
+
+    """
+    if len(queries) == 0:
+        return
+    if watermark_cols is None:
+        watermark_cols = {}
+
+    if concurrent and len(queries) > 1:
+        # a session would keep the connection of each pool thread open
+        # until the session is closed; read on short-lived connections it
+        # still counts instead
+        if isinstance(backend, obs_storage.Session):
+            backend = backend.unshared()
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            futures = {
+                executor.submit(
+                    _load_access_table, None, query, params,
+                    watermark_col=watermark_cols.get(key),
+                    chunksize=chunksize, max_bytes=max_bytes, typed=typed,
+                    backend=backend
+                ): key
+                for key, (query, params) in queries.items()
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    else:
+        cnxn = backend.connect()
+        try:
+            for key, (query, params) in queries.items():
+                yield key, _load_access_table(
+                    cnxn, query, params,
+                    watermark_col=watermark_cols.get(key),
+                    chunksize=chunksize, max_bytes=max_bytes, typed=typed
+                )
+        finally:
+            backend.release(cnxn)
+
+
+def _load_access_table(
+    cnxn, query, params=None, watermark_col=None, chunksize=None,
+    max_bytes=None, typed=False, backend=None
+):
+    """Read and clean an Access table
+
+    Parameters
+    ----------
+    cnxn : DB-API connection or None
+        Connection to the database; if None, a connection to backend is
+        opened and released.
+    query : str
+        SQL statement.
+    params : list, optional
+        Parameters of the SQL statement. The default is None.
+    watermark_col : str, optional
+        Column whose highest value (before cleaning) is returned as the
+        watermark. The default is None.
+    chunksize : int, optional
+        If provided, the table is read this many rows at a time and each
+        chunk is cleaned with clean_access_table before the next one is
+        read. The default is None (the table is read at once).
+    max_bytes : int, optional
+        Memory ceiling for the cleaned rows held so far plus the uncleaned
+        chunk being read; only used with chunksize. The default is None (no
+        ceiling).
+    typed : bool, optional
+        Setting to True will read the rows with fetch_typed instead of
+        pandas.read_sql. The default is False.
+    backend : obs_storage.StorageBackend, optional
+        Database holding the table; used when cnxn is None. The default is
+        None.
+
+    Returns
+    -------
+    dict
+        'table' is the cleaned table, 'rows' and 'bytes' are the number and
+        in-memory size of the uncleaned rows, 'watermark' is the highest
+        value of watermark_col (None if not requested or no rows), and
+        'read_seconds' and 'clean_seconds' are the time spent reading and
+        cleaning
+
+    Raises
+    ------
+    AccessTableTooLarge
+        If the rows held while streaming the table exceed max_bytes
+
+    """
+    start = time.perf_counter()
+    release_cnxn = cnxn is None
+    if release_cnxn:
+        cnxn = backend.connect()
+
+    loaded = {
+        'rows': 0, 'bytes': 0, 'watermark': None,
+        'read_seconds': 0.0, 'clean_seconds': 0.0,
+    }
+    try:
+        if typed:
+            chunks = fetch_typed(cnxn, query, params, chunksize=chunksize)
+        elif chunksize is None:
+            chunks = [pd.read_sql(query, cnxn, params=params)]
+        else:
+            chunks = pd.read_sql(
+                query, cnxn, params=params, chunksize=chunksize
+            )
+
+        # a table read in one chunk is returned as is; otherwise the
+        # cleaned chunks are copied into per-column buffers as they arrive
+        first = None
+        buffers = None
+        for chunk in chunks:
+            clean_start = time.perf_counter()
+            chunk_bytes = int(chunk.memory_usage(deep=True).sum())
+            loaded['rows'] += len(chunk.index)
+            loaded['bytes'] += chunk_bytes
+            if watermark_col is not None and len(chunk.index) > 0:
+                chunk_watermark = int(chunk[watermark_col].max())
+                if (
+                    loaded['watermark'] is None
+                    or chunk_watermark > loaded['watermark']
+                ):
+                    loaded['watermark'] = chunk_watermark
+
+            chunk = clean_access_table(chunk)
+            if first is None and buffers is None:
+                first = chunk
+                held_bytes = int(chunk.memory_usage(deep=True).sum())
+            else:
+                if buffers is None:
+                    buffers = _ColumnBuffers()
+                    buffers.append(first)
+                    first = None
+                buffers.append(chunk)
+                held_bytes = buffers.nbytes
+            # the uncleaned chunk is still held while it is cleaned
+            if max_bytes is not None and held_bytes + chunk_bytes > max_bytes:
+                raise AccessTableTooLarge(
+                    f'Rows of "{query}" exceed {max_bytes} bytes'
+                )
+            loaded['clean_seconds'] += time.perf_counter() - clean_start
+        if first is None and buffers is None:
+            # chunked reads of an empty result may not yield any chunk
+            first = clean_access_table(pd.read_sql(query, cnxn, params=params))
+    finally:
+        if release_cnxn:
+            backend.release(cnxn)
+
+    clean_start = time.perf_counter()
+    if buffers is None:
+        loaded['table'] = first
+    else:
+        loaded['table'] = buffers.table()
+    loaded['clean_seconds'] += time.perf_counter() - clean_start
+    loaded['read_seconds'] = (
+        time.perf_counter() - start - loaded['clean_seconds']
+    )
+
+    return loaded
+
+
+class AccessTableTooLarge(Exception):
+    """A streamed Access table exceeded its memory ceiling (max_bytes)"""
+
+
+class _ColumnBuffers():
+    """Growable numpy buffers, one per column, holding cleaned chunks
+
+    Chunks are copied into the buffers as they arrive and the capacity is
+    doubled when it runs out, so a streamed table is held once rather than
+    as a list of chunks plus their concatenation.
+
+    Attributes
+    ----------
+    columns : list of str
+        Column names, in the order of the first chunk
+    length : int
+        Number of rows appended
+    nbytes : int
+        In-memory size of the rows appended (as measured on the chunks)
+
+    """
+    def __init__(self):
+        """Empty buffers; the columns are taken from the first chunk"""
+        self.columns = None
+        self.length = 0
+        self.nbytes = 0
+        self._capacity = 0
+        self._buffers = {}
+        # pandas extension types (e.g. Int64) are buffered as objects and
+        # restored by self.table
+        self._extension_dtypes = {}
+
+    def append(self, chunk):
+        """Copy a cleaned chunk into the buffers
+
+        Parameters
+        ----------
+        chunk : pandas.DataFrame
+            Cleaned rows with the same columns as the previous chunks
+
+        Returns
+        -------
+        None.
+        """
+        rows = len(chunk.index)
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            for col in self.columns:
+                if pd.api.types.is_extension_array_dtype(chunk[col]):
+                    self._extension_dtypes[col] = chunk[col].dtype
+        if self.length + rows > self._capacity:
+            self._grow(max(self.length + rows, 2 * self._capacity))
+
+        for col in self.columns:
+            if col in self._extension_dtypes:
+                values = chunk[col].to_numpy(dtype=object)
+            else:
+                values = chunk[col].to_numpy()
+            buffer = self._buffers.get(col)
+            if buffer is None:
+                buffer = np.empty(self._capacity, dtype=values.dtype)
+            elif buffer.dtype != values.dtype:
+                buffer = buffer.astype(
+                    _common_dtype(buffer.dtype, values.dtype)
+                )
+            buffer[self.length:self.length + rows] = values
+            self._buffers[col] = buffer
+        self.length += rows
+        self.nbytes += int(chunk.memory_usage(deep=True).sum())
+
+    def table(self):
+        """Move the buffered rows into a DataFrame
+
+        Each buffer is freed as soon as its column is copied, so the table
+        is never held twice.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Appended rows with a RangeIndex
+        """
+        table = pd.DataFrame(index=pd.RangeIndex(self.length))
+        for col in self.columns:
+            values = self._buffers.pop(col)[:self.length]
+            if col in self._extension_dtypes:
+                values = pd.array(values, dtype=self._extension_dtypes[col])
+            table[col] = values
+        self.length = 0
+        self.nbytes = 0
+        self._capacity = 0
+
+        return table
+
+    def _grow(self, capacity):
+        """Reallocate every buffer with room for capacity rows"""
+        for col, buffer in self._buffers.items():
+            grown = np.empty(capacity, dtype=buffer.dtype)
+            grown[:self.length] = buffer[:self.length]
+            self._buffers[col] = grown
+        self._capacity = capacity
+
+
+def _common_dtype(dtype, other):
+    """Type of a column holding values of both types, as pandas.concat does
+
+    Numbers are promoted (e.g. int64 and float64 to float64); any other mix
+    of types is held as objects.
+    """
+    if dtype.kind in 'iuf' and other.kind in 'iuf':
+        return np.result_type(dtype, other)
+
+    return np.dtype(object)
+
+
+def fetch_typed(cnxn, query, params=None, chunksize=None, schema=None):
+    """Read a query, decoding each column straight into a numpy array
+
+    Rows are fetched with the DB-API cursor and transposed into columns;
+    declared columns are converted once into their numpy type so pandas
+    never has to infer types or re-parse values.
+
+    Parameters
+    ----------
+    cnxn : DB-API connection
+        Connection to the database.
+    query : str
+        SQL statement.
+    params : list, optional
+        Parameters of the SQL statement. The default is None.
+    chunksize : int, optional
+        If provided, rows are fetched and decoded this many at a time. The
+        default is None (all rows at once).
+    schema : dict of str, optional
+        Numpy type of each column (see ACCESS_SCHEMA). The default is None,
+        which uses ACCESS_SCHEMA.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Decoded rows; at least one (possibly empty) DataFrame is yielded
+
+    """
+    if schema is None:
+        schema = ACCESS_SCHEMA
+
+    cursor = cnxn.cursor()
+    if params:
+        cursor.execute(query, params)
+    else:
+        cursor.execute(query)
+    col_names = [col[0] for col in cursor.description]
+
+    yielded = False
+    while True:
+        if chunksize is None:
+            rows = cursor.fetchall()
+        else:
+            rows = cursor.fetchmany(chunksize)
+        if len(rows) == 0 and yielded:
+            break
+
+        if len(rows) > 0:
+            col_values = list(zip(*rows))
+        else:
+            col_values = [()] * len(col_names)
+        yield pd.DataFrame(
+            {
+                col_name: _decode_column(values, schema.get(col_name))
+                for col_name, values in zip(col_names, col_values)
+            },
+            columns=col_names
         )
-    if screening:
-        access_dict['screening'] = pd.read_sql(
-            "Select * From [OBS Screening log]", cnxn
+        yielded = True
+        if chunksize is None:
+            break
+    cursor.close()
+
+
+def _decode_column(values, dtype=None):
+    """Decode the values of a column into a numpy (or pandas) array
+
+    Parameters
+    ----------
+    values : tuple
+        Values of the column as returned by the cursor.
+    dtype : str, optional
+        Numpy type, or 'obs_id' for OBS enrolment IDs. The default is None,
+        which keeps the values as Python objects.
+
+    Returns
+    -------
+    numpy.ndarray or pandas.arrays.IntegerArray
+        Decoded column; missing OBS IDs are masked, missing dates are NaT,
+        and missing flags are False
+
+    """
+    if dtype is None:
+        return np.array(values, dtype=object)
+    if dtype == 'obs_id':
+        return _decode_obs_ids(values)
+
+    return np.array(values, dtype=dtype)
+
+
+def _decode_obs_ids(values):
+    """Parse OBS enrolment IDs into integers without regular expressions
+
+    The IDs are viewed as a matrix of unicode code points and the digits of
+    each row are accumulated column by column.
+
+    Parameters
+    ----------
+    values : tuple of str
+        OBS enrolment IDs (e.g. 'OBS912-00001'); None for missing IDs.
+
+    Returns
+    -------
+    pandas.arrays.IntegerArray
+        IDs with their non-digit characters removed (e.g. 91200001)
+
+    Raises
+    ------
+    ValueError
+        If an ID that is not missing contains no digits
+
+    """
+    missing = np.array([value is None for value in values], dtype=bool)
+    id_str = np.array(
+        ['' if value is None else str(value) for value in values], dtype='U'
+    )
+    width = id_str.dtype.itemsize // 4
+    code_points = id_str.view(np.uint32).reshape(len(id_str), width)
+
+    is_digit = (code_points >= ord('0')) & (code_points <= ord('9'))
+    ids = np.zeros(len(id_str), dtype=np.int64)
+    for col in range(width):
+        ids = np.where(
+            is_digit[:, col],
+            ids * 10 + (code_points[:, col].astype(np.int64) - ord('0')),
+            ids
         )
-    cnxn.close()
 
-    for key, value in access_dict.items():
-        access_dict[key] = clean_access_table(value)
+    if np.any(~is_digit.any(axis=1) & ~missing):
+        raise ValueError('OBSEnrolmentID contains no digits')
+
+    return pd.arrays.IntegerArray(ids, missing)
+
+
+def _access_query(key, columns=None, after_col=None):
+    """Build the SELECT statement for an Access table
 
-    return access_dict
+    Parameters
+    ----------
+    key : str
+        Key of the table in ACCESS_TABLES (e.g. 'followup').
+    columns : list of str, optional
+        Columns to select. The default is None, which selects every column.
+    after_col : str, optional
+        If provided, only select rows where this column is greater than a
+        query parameter. The default is None.
+
+    Returns
+    -------
+    str
+        SQL statement selecting the columns from the table.
+
+    """
+    if columns:
+        col_sql = ', '.join(f'[{col}]' for col in columns)
+    else:
+        col_sql = '*'
+
+    query = f'Select {col_sql} From [{ACCESS_TABLES[key]}]'
+    if after_col is not None:
+        query = query + f' Where [{after_col}] > ?'
+
+    return query
+
+
+def _access_fingerprint(cnxn, key, col):
+    """Fingerprint an Access table by its row count and highest value of col
+
+    Parameters
+    ----------
+    cnxn : DB-API connection
+        Connection to the database.
+    key : str
+        Key of the table in ACCESS_TABLES (e.g. 'followup').
+    col : str
+        Column that grows with every insert (e.g. an autonumber).
+
+    Returns
+    -------
+    list
+        Row count and highest value of col (as str, or None if the table is
+        empty), comparable with a fingerprint read back from JSON.
+
+    """
+    cursor = cnxn.cursor()
+    try:
+        cursor.execute(
+            f'Select Count(*), Max([{col}]) From [{ACCESS_TABLES[key]}]'
+        )
+        count, highest = cursor.fetchone()
+    finally:
+        cursor.close()
+
+    return [int(count), None if highest is None else str(highest)]
 
 
 def clean_access_table(access_table):
@@ -82,10 +842,16 @@ def clean_access_table(access_table):
         access_table[access_table['OBSEnrolmentID'].isna()].index
     )
 
-    access_table['OBSEnrolmentID'] = (
-        access_table['OBSEnrolmentID'].replace('[^0-9]', '', regex=True)
-        .astype(int)
-    )
+    if pd.api.types.is_integer_dtype(access_table['OBSEnrolmentID']):
+        # already parsed by fetch_typed
+        access_table['OBSEnrolmentID'] = (
+            access_table['OBSEnrolmentID'].astype(int)
+        )
+    else:
+        access_table['OBSEnrolmentID'] = (
+            access_table['OBSEnrolmentID'].replace('[^0-9]', '', regex=True)
+            .astype(int)
+        )
     access_table = access_table.rename(
         columns={'OBSEnrolmentID': 'obs_study_id'}
     )
@@ -131,8 +897,8 @@ def access_exclude(
 
     Returns
     -------
-    access_excl : list
-        OBS subjects to be excluded
+    access_excl : numpy.ndarray of int64
+        OBS subjects to be excluded, sorted and without duplicates
 
     """
 
@@ -147,47 +913,462 @@ def access_exclude(
         'Neonatal death': excl_neonatal_death
     }
 
-    access_excl = []
+    access_excl = [np.empty(0, dtype='int64')]
     for key, value in excl_type_dict.items():
         if value:
-            access_excl.extend(
-                followup.loc[followup[key] == 1, 'obs_study_id'].tolist()
+            access_excl.append(
+                followup.loc[followup[key] == 1, 'obs_study_id']
+                .to_numpy(dtype='int64')
             )
 
     if excl_previous:
-        access_excl.extend(enrolment.loc[
+        access_excl.append(enrolment.loc[
                 enrolment['Previous OBS participant'], 'obs_study_id'
-        ].tolist())
+        ].to_numpy(dtype='int64'))
 
     if excl_multiple:
-        access_excl.extend(followup.loc[
+        access_excl.append(followup.loc[
                 followup['TwinBDelivery'].notnull(), 'obs_study_id'
-        ].tolist())
+        ].to_numpy(dtype='int64'))
 
-    access_excl = list(set(access_excl))
+    # sorted unique IDs, ready for hashed (isin) or binary search lookups
+    access_excl = np.unique(np.concatenate(access_excl))
 
     return access_excl
 
 
-def redcap_data(api_param, add_param=None):
+class RedcapClient():
+    """REDCap API client for one project token
+
+    Requests are sent through a pooled keep-alive session that negotiates
+    gzip, so repeated exports reuse the TCP/TLS connection to the server.
+
+    Attributes
+    ----------
+    token : str
+        API token of the REDCap project
+    url : str
+        URL of the REDCap API
+    timeout : float or (float, float)
+        Connect and read timeouts (seconds) of each request
+    session : requests.Session
+        Pooled session the requests are sent through
+    request_count : int
+        Number of requests sent
+    bytes_received : int
+        Number of (decompressed) response bytes received
+    cache : obs_cache.ResponseCache or None
+        Cache of the responses
+    export_format : str
+        Format of the record exports of the project; one of REDCAP_FORMATS
+    throttle : obs_throttle.Throttle or None
+        Pacing, retries and hedging of the requests
+    latencies : obs_throttle.LatencyStats
+        Seconds until the response of each request sent (the whole body,
+        or its headers for streamed responses)
+
+    """
+    def __init__(
+        self, token, url=None, timeout=None, pool_size=4, cache=None,
+        export_format='csv', throttle=None
+    ):
+        """Client with a keep-alive session
+
+        Parameters
+        ----------
+        token : str
+            API token of the REDCap project
+        url : str, optional
+            URL of the REDCap API. The default is None (REDCAP_API_URL).
+        timeout : float or (float, float), optional
+            Connect and read timeouts (seconds). The default is None
+            (REDCAP_TIMEOUT).
+        pool_size : int, optional
+            Number of connections kept alive for concurrent requests. The
+            default is 4.
+        cache : obs_cache.ResponseCache, optional
+            Cache of the responses. The default is None (no cache).
+        export_format : str, optional
+            Format of the record exports; one of REDCAP_FORMATS. The default
+            is 'csv'.
+        throttle : obs_throttle.Throttle, optional
+            Pacing, retries and hedging of the requests; may be shared by
+            the clients of a server. The default is None (requests are sent
+            once, as they come).
+        """
+        self.token = token
+        self.url = REDCAP_API_URL if url is None else url
+        self.timeout = REDCAP_TIMEOUT if timeout is None else timeout
+        self.cache = cache
+        self.export_format = export_format
+        self.throttle = throttle
+        self.latencies = obs_throttle.LatencyStats()
+        self.request_count = 0
+        self.bytes_received = 0
+        # the counts are updated from the threads of hedged requests and
+        # concurrent exports
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self._adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size
+        )
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+    @property
+    def connection_count(self):
+        """Number of connections opened to the REDCap server"""
+        pools = self._adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    @property
+    def reused_count(self):
+        """Number of requests sent on a connection kept alive"""
+        return self.request_count - self.connection_count
+
+    @property
+    def offline(self):
+        """True if responses may only come from self.cache"""
+        return self.cache is not None and self.cache.offline
+
+    def post(self, data):
+        """Send a request to the REDCap API
+
+        The response is returned from self.cache if it has it.
+
+        Parameters
+        ----------
+        data : dict
+            Request parameters; the token is added
+
+        Returns
+        -------
+        bytes
+            Decompressed response body
+
+        Raises
+        ------
+        requests.HTTPError
+            If REDCap returns an error status
+        LookupError
+            If self.cache is offline and does not have the response
+        """
+        if self.cache is not None:
+            content = self.cache.get(self.token, data)
+            if content is not None:
+                return content
+
+        response = self._send(data)
+        with self._lock:
+            self.bytes_received += len(response.content)
+        if self.cache is not None:
+            self.cache.put(self.token, data, response.content)
+
+        return response.content
+
+    @contextlib.contextmanager
+    def stream(self, data):
+        """Send a request to the REDCap API and read the response as it arrives
+
+        The body is decompressed while it is read instead of being held in
+        memory first; responses of a read-through cache are read from the
+        cache (or requested in full so they can be cached), and responses
+        that may be hedged by self.throttle are requested in full.
+
+        Parameters
+        ----------
+        data : dict
+            Request parameters; the token is added
+
+        Yields
+        ------
+        RedcapBody
+            Readable binary response body; the connection is given back to
+            the pool on exit
+
+        Raises
+        ------
+        requests.HTTPError
+            If REDCap returns an error status
+        LookupError
+            If self.cache is offline and does not have the response
+        """
+        if (
+            (self.cache is not None and self.cache.mode != 'off')
+            or (self.throttle is not None and self.throttle.hedge_after)
+        ):
+            yield RedcapBody(io.BytesIO(self.post(data)).read)
+            return
+
+        response = self._send(data, stream=True)
+        try:
+            yield RedcapBody(
+                lambda size: response.raw.read(size, decode_content=True),
+                client=self
+            )
+        finally:
+            response.close()
+
+    def _send(self, data, stream=False):
+        """Send a request through self.throttle
+
+        Exports (requests without an action other than 'export') are
+        idempotent and may be hedged unless streamed.
+
+        Returns
+        -------
+        requests.Response
+            Successful response
+        """
+        def request():
+            start = time.perf_counter()
+            response = self.session.post(
+                self.url, {**data, 'token': self.token},
+                timeout=self.timeout, stream=stream
+            )
+            with self._lock:
+                self.request_count += 1
+            if not response.ok:
+                response.close()
+            response.raise_for_status()
+            self.latencies.record(time.perf_counter() - start)
+            return response
+
+        if self.throttle is None:
+            return request()
+        return self.throttle.send(
+            request,
+            idempotent=not stream and data.get('action', 'export') == 'export'
+        )
+
+    def close(self):
+        """Close the pooled connections
+
+        Returns
+        -------
+        None.
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RedcapBody(io.RawIOBase):
+    """Binary file-like body of a REDCap response
+
+    Attributes
+    ----------
+    bytes_read : int
+        Number of (decompressed) bytes read so far
+
+    """
+    def __init__(self, read, client=None):
+        """Body read through a function
+
+        Parameters
+        ----------
+        read : callable
+            Returns up to the given number of bytes (all of them for None);
+            b'' at the end
+        client : RedcapClient, optional
+            Client whose bytes_received is updated. The default is None.
+        """
+        super().__init__()
+        self._read = read
+        self._client = client
+        self._buffer = b''
+        self._buffer_pos = 0
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._buffer_pos < len(self._buffer):
+            end = self._buffer_pos + len(buffer)
+            data = self._buffer[self._buffer_pos:end]
+            self._buffer_pos += len(data)
+        else:
+            data = self._read_body(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        data = self._buffer[self._buffer_pos:] + self._read_body(None)
+        self._buffer_pos = len(self._buffer)
+        return data
+
+    def peek_line(self):
+        """First line of the unread body, without consuming it
+
+        Returns
+        -------
+        bytes
+            Line without its line break
+        """
+        blocks = [self._buffer[self._buffer_pos:]]
+        while b'\n' not in blocks[-1]:
+            data = self._read_body(REDCAP_READ_SIZE)
+            if len(data) == 0:
+                break
+            blocks.append(data)
+        self._buffer = b''.join(blocks)
+        self._buffer_pos = 0
+        return self._buffer.split(b'\n', 1)[0]
+
+    def _read_body(self, size):
+        """Read from the response, counting the bytes"""
+        data = self._read(size)
+        self.bytes_read += len(data)
+        if self._client is not None:
+            with self._client._lock:
+                self._client.bytes_received += len(data)
+        return data
+
+
+def redcap_client(
+    api_param, timeout=None, cache=None, export_format=None, url=None,
+    throttle=None
+):
+    """Get the shared REDCap client of a project token
+
+    Parameters
+    ----------
+    api_param : str or RedcapClient
+        API token for associated REDCap data; a client is returned as is
+    timeout : float or (float, float), optional
+        Connect and read timeouts (seconds) of the client. The default is
+        None, which leaves the timeouts of an existing client unchanged.
+    cache : obs_cache.ResponseCache, optional
+        Response cache of the client. The default is None, which leaves the
+        cache of an existing client unchanged.
+    export_format : str, optional
+        Format of the record exports of the client; one of REDCAP_FORMATS.
+        The default is None, which leaves the format of an existing client
+        unchanged (or is 'csv' for a new client).
+    url : str, optional
+        URL of the REDCap API of the client. The default is None, which
+        leaves the URL of an existing client unchanged (or is REDCAP_API_URL
+        for a new client).
+    throttle : obs_throttle.Throttle, optional
+        Pacing, retries and hedging of the requests of the client. The
+        default is None, which leaves the throttle of an existing client
+        unchanged.
+
+    Returns
+    -------
+    RedcapClient
+    """
+    if isinstance(api_param, RedcapClient):
+        return api_param
+
+    client = _REDCAP_CLIENTS.get(api_param)
+    if client is None:
+        client = RedcapClient(
+            api_param, url=url, timeout=timeout, cache=cache,
+            throttle=throttle
+        )
+        _REDCAP_CLIENTS[api_param] = client
+    else:
+        if timeout is not None:
+            client.timeout = timeout
+        if cache is not None:
+            client.cache = cache
+        if url is not None:
+            client.url = url
+        if throttle is not None:
+            client.throttle = throttle
+    if export_format is not None:
+        client.export_format = export_format
+
+    return client
+
+
+def redcap_clients():
+    """Shared REDCap clients created by redcap_client
+
+    Returns
+    -------
+    list of RedcapClient
+    """
+    return list(_REDCAP_CLIENTS.values())
+
+
+def redcap_data(api_param, add_param=None, stats=None, dtype=str):
     """Get data from AHRC REDCap
 
     Parameters
     ----------
-    api_param : str
-        API token for associated REDCap data.
+    api_param : str or RedcapClient
+        API token for associated REDCap data, or the client of that token.
     add_param : dict, optional
-        Add or overwrite request parameters. The default is None.
+        Add or overwrite request parameters; 'format' is one of
+        REDCAP_FORMATS and defaults to the export_format of the client. The
+        default is None.
+    stats : dict, optional
+        Filled with the 'bytes' of the response and the 'rows' exported.
+        The default is None.
+    dtype : type or dict or tuple, optional
+        Type of the columns as accepted by pandas.read_csv, or REDCAP_DTYPES
+        style hints. The default is str.
 
     Returns
     -------
     rc_data : pandas.DataFrame
         REDCap data.
 
+    """
+    rc_chunks = list(
+        redcap_chunks(api_param, add_param, stats=stats, dtype=dtype)
+    )
+    if len(rc_chunks) == 1:
+        return rc_chunks[0]
+    return pd.concat(rc_chunks, ignore_index=True)
+
+
+def redcap_chunks(
+    api_param, add_param=None, chunksize=None, stats=None, dtype=str
+):
+    """Get data from AHRC REDCap, parsed while the response is read
+
+    The response is decompressed and parsed in REDCAP_READ_SIZE blocks, so
+    the raw export is never held in memory next to the DataFrame.
+
+    Parameters
+    ----------
+    api_param : str or RedcapClient
+        API token for associated REDCap data, or the client of that token.
+    add_param : dict, optional
+        Add or overwrite request parameters; see redcap_data. The default is
+        None.
+    chunksize : int, optional
+        Number of rows per DataFrame. The default is None (one DataFrame).
+    stats : dict, optional
+        Filled with the 'bytes' of the response and the 'rows' exported once
+        every DataFrame has been read. The default is None.
+    dtype : type or dict or tuple, optional
+        Type of the columns as accepted by pandas.read_csv, or REDCAP_DTYPES
+        style hints. The default is str.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Exported rows; at least one (possibly empty) DataFrame is yielded
+
+    Raises
+    ------
+    ValueError
+        If the export format is not one of REDCAP_FORMATS
+
     """
     api_req_data = {
         'content': 'record',
-        'format': 'csv',
         'type': 'flat',
         'rawOrLabel': 'raw',
         'rawOrLabelHeaders': 'raw',
@@ -196,69 +1377,727 @@ def redcap_data(api_param, add_param=None):
         'returnFormat': 'json',
         'exportDataAccessGroups': 'true',
     }
-    api_req_data.update({'token': api_param})
     if add_param is not None:
         api_req_data.update(add_param)
 
-    req = requests.post(
-        'https://redcap.smh.ca/redcap/api/', api_req_data
-    ).content
+    client = redcap_client(api_param)
+    fmt = api_req_data.setdefault('format', client.export_format)
+    if fmt not in REDCAP_FORMATS:
+        raise ValueError(
+            f'Unknown REDCap export format "{fmt}"; expected one of '
+            + ', '.join(REDCAP_FORMATS)
+        )
+    columns = [
+        value for name, value in api_req_data.items()
+        if name.startswith('fields[')
+    ]
+
+    rows = 0
+    with client.stream(api_req_data) as body:
+        for rc_data in _read_export(body, fmt, dtype, chunksize, columns):
+            rows += len(rc_data.index)
+            yield rc_data
+
+        if stats is not None:
+            stats['bytes'] = body.bytes_read
+            stats['rows'] = rows
+
+
+def _read_export(body, fmt, dtype=str, chunksize=None, columns=None):
+    """Parse a REDCap record export
+
+    Parameters
+    ----------
+    body : RedcapBody
+        Response body.
+    fmt : str
+        Export format; one of REDCAP_FORMATS.
+    dtype : type or dict or tuple, optional
+        Type of the columns; see redcap_data. The default is str.
+    chunksize : int, optional
+        Number of rows per DataFrame. The default is None (one DataFrame).
+    columns : list of str, optional
+        Columns of an empty export. The default is None (no columns).
+
+    Yields
+    ------
+    pandas.DataFrame
+        Exported rows; at least one (possibly empty) DataFrame is yielded
+
+    """
+    first_line = body.peek_line().strip()
+    if first_line in (b'', b'[]'):
+        # nothing exported (e.g. no record modified since dateRangeBegin or
+        # matching filterLogic); keep the requested fields as columns
+        yield _redcap_types(
+            pd.DataFrame(columns=columns or [], dtype=str), dtype
+        )
+        return
 
-    rc_data = pd.read_csv(
-        io.StringIO(req.decode('utf-8')),
+    if fmt == 'json':
+        # a list of records whose values are all strings ('' if missing)
+        rc_data = pd.DataFrame.from_records(json.load(body))
+        rc_data = rc_data.replace('', np.nan)
+        step = len(rc_data.index) if chunksize is None else chunksize
+        for start in range(0, max(len(rc_data.index), 1), step):
+            yield _redcap_types(
+                rc_data.iloc[start:start + step].reset_index(drop=True),
+                dtype
+            )
+        return
+
+    header = next(csv.reader([first_line.decode('utf-8')]))
+    col_dtypes = redcap_dtypes(header, dtype)
+    rc_chunks = pd.read_csv(
+        body,
         sep=',',
         error_bad_lines=False,
         index_col=False,
-        dtype=str
+        dtype={
+            col: col_dtype for col, col_dtype in col_dtypes.items()
+            if col_dtype != 'datetime64[ns]'
+        },
+        chunksize=chunksize
     )
+    if chunksize is None:
+        rc_chunks = [rc_chunks]
+    for rc_data in rc_chunks:
+        yield _redcap_types(rc_data, dtype)
+
+
+def redcap_dtypes(columns, dtype=None):
+    """Types of exported REDCap columns
+
+    Parameters
+    ----------
+    columns : list of str
+        Names of the exported columns.
+    dtype : type or dict or tuple, optional
+        Type of every column, type of each column, or (column name pattern,
+        type) hints. The default is None, which uses REDCAP_DTYPES.
+
+    Returns
+    -------
+    dict
+        Key is the column name, value is its type; columns without a type
+        are left out (and parsed as str)
+
+    """
+    if dtype is None:
+        dtype = REDCAP_DTYPES
+    if isinstance(dtype, dict):
+        return {col: dtype[col] for col in columns if col in dtype}
+    if not isinstance(dtype, tuple):
+        return {col: dtype for col in columns}
+
+    col_dtypes = {}
+    for col in columns:
+        col_dtypes[col] = str
+        for pattern, col_dtype in dtype:
+            if re.search(pattern, col):
+                col_dtypes[col] = col_dtype
+                break
+    return col_dtypes
+
+
+def _redcap_types(rc_data, dtype):
+    """Convert columns read as str to their REDCap type"""
+    for col, col_dtype in redcap_dtypes(rc_data.columns, dtype).items():
+        if col_dtype == 'datetime64[ns]':
+            rc_data[col] = pd.to_datetime(rc_data[col], errors='coerce')
+        elif col_dtype is not str and rc_data[col].dtype != col_dtype:
+            rc_data[col] = rc_data[col].astype(col_dtype)
     return rc_data
 
 
-def redcap_lsq_summary(api_param, version):
+def redcap_incremental(
+    api_param, add_param, key, cache_dir, reconcile_days=7, refresh=False,
+    id_col='obs_study_id', stats=None
+):
+    """Get REDCap data through a locally cached view
+
+    Only records modified since the previous export of the view are
+    requested (dateRangeBegin); they replace their rows in the view.
+
+    Parameters
+    ----------
+    api_param : str or RedcapClient
+        API token for associated REDCap data, or the client of that token.
+    add_param : dict
+        Add or overwrite request parameters (see redcap_data); must export
+        id_col
+    key : str
+        Key of the cached view (e.g. 'lsq1_summary')
+    cache_dir : str
+        Directory containing the cached views
+    reconcile_days : int or float, optional
+        Number of days after which the view is exported in full again so
+        deleted records are dropped. The default is 7.
+    refresh : bool, optional
+        Export the view in full. The default is False.
+    id_col : str, optional
+        Record ID column. The default is 'obs_study_id'.
+    stats : dict, optional
+        Filled with the 'bytes' and 'rows' of the export, whether it was a
+        'full' export and the 'view_rows'. The default is None.
+
+    Returns
+    -------
+    rc_data : pandas.DataFrame
+        REDCap data of every record.
+
+    """
+    client = redcap_client(api_param)
+    if stats is None:
+        stats = {}
+    views = obs_cache.RedcapView(cache_dir)
+    view, watermark = None, None
+    if not refresh:
+        view, watermark = views.load(
+            key, client.token, add_param, reconcile_days
+        )
+
+    # REDCap compares dateRangeBegin with its own clock; the overlap covers
+    # clock skew and exports still running, and re-exported records are
+    # merged idempotently
+    export_start = time.time() - REDCAP_WATERMARK_OVERLAP
+    new_watermark = time.strftime(
+        '%Y-%m-%d %H:%M:%S', time.localtime(export_start)
+    )
+    if view is not None and client.offline:
+        # offline reruns use the view as of the last online run
+        stats.update({'bytes': 0, 'rows': 0, 'full': False})
+        stats['view_rows'] = len(view.index)
+        return view
+    if view is None:
+        rc_data = redcap_data(client, add_param, stats=stats)
+        stats['full'] = True
+    else:
+        delta = redcap_data(
+            client, {**add_param, 'dateRangeBegin': watermark}, stats=stats
+        )
+        stats['full'] = False
+        if len(delta.index) > 0:
+            view = view[~view[id_col].isin(delta[id_col])]
+            rc_data = pd.concat([view, delta], ignore_index=True)
+        else:
+            rc_data = view.reset_index(drop=True)
+
+    views.save(
+        key, client.token, add_param, rc_data, new_watermark,
+        full_export=stats['full']
+    )
+    stats['view_rows'] = len(rc_data.index)
+
+    return rc_data
+
+
+def redcap_filter(
+    complete_field=None, obs_ids=None, id_col='obs_study_id'
+):
+    """REDCap filterLogic selecting completed forms and/or records
+
+    Parameters
+    ----------
+    complete_field : str, optional
+        Form completion field (e.g. 'lifestyle_questionnaire_1_complete');
+        only records where the form is complete ('2') are selected. The
+        default is None.
+    obs_ids : list of str, optional
+        Only these records are selected; must not be empty. The default is
+        None.
+    id_col : str, optional
+        Record ID field. The default is 'obs_study_id'.
+
+    Returns
+    -------
+    str or None
+        filterLogic request parameter, or None if nothing is filtered
+
+    Raises
+    ------
+    ValueError
+        If obs_ids is empty; no filterLogic selects no records, so callers
+        skip the export instead
+
+    """
+    if obs_ids is not None and len(obs_ids) == 0:
+        raise ValueError('No records to select: obs_ids is empty')
+    predicates = []
+    if complete_field is not None:
+        predicates.append(f'[{complete_field}] = "2"')
+    if obs_ids is not None:
+        predicates.append(
+            '('
+            + ' or '.join(f'[{id_col}] = "{obs_id}"' for obs_id in obs_ids)
+            + ')'
+        )
+    if len(predicates) == 0:
+        return None
+
+    return ' and '.join(predicates)
+
+
+def redcap_metadata(
+    api_param, cache_dir=None, max_age_days=1, refresh=False, stats=None
+):
+    """Get the data dictionary (content=metadata) of a REDCap project
+
+    Parameters
+    ----------
+    api_param : str or RedcapClient
+        API token for associated REDCap data, or the client of that token.
+    cache_dir : str, optional
+        Directory of cached data dictionaries (see obs_cache.RedcapMetadata).
+        The default is None (always exported).
+    max_age_days : int or float, optional
+        Number of days a cached data dictionary is used before it is
+        exported again. The default is 1.
+    refresh : bool, optional
+        Export the data dictionary even if it is cached. The default is
+        False.
+    stats : dict, optional
+        Filled with 'cached' (True if no request was sent) and 'changed'
+        (True if the export differs from the cached data dictionary). The
+        default is None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per field, with 'field_name', 'form_name' and 'field_type'
+        among the columns (all str)
+
+    """
+    if stats is None:
+        stats = {}
+    client = redcap_client(api_param)
+    cache = None if cache_dir is None else obs_cache.RedcapMetadata(cache_dir)
+
+    if cache is not None and not refresh:
+        metadata = cache.load(client.token, max_age_days)
+        if metadata is not None:
+            stats.update({'cached': True, 'changed': False})
+            return metadata
+
+    content = client.post(
+        {'content': 'metadata', 'format': 'csv', 'returnFormat': 'json'}
+    )
+    stats['cached'] = False
+    stats['changed'] = True if cache is None else cache.save(
+        client.token, content
+    )
+    return pd.read_csv(io.BytesIO(content), index_col=False, dtype=str)
+
+
+def lsq_form(version):
+    """REDCap instrument of an LSQ
+
+    Parameters
+    ----------
+    version : int or str
+        Version of the LSQ (e.g. 2, '2' or 'lsq2').
+
+    Returns
+    -------
+    str
+        Instrument name (e.g. 'lifestyle_questionnaire_2')
+
+    """
+    return 'lifestyle_questionnaire_' + re.sub(r'^[a-zA-Z]*', '', str(version))
+
+
+class RedcapFields():
+    """Field planner of a REDCap project
+
+    Resolves instrument-level requests (e.g. the completion fields of an
+    LSQ) to field lists and checks that requested fields can be exported,
+    so that missing fields are reported before any record is exported.
+
+    Attributes
+    ----------
+    metadata : pandas.DataFrame
+        Data dictionary of the project (see redcap_metadata)
+    record_id : str
+        Record ID field (the first field of the project)
+    forms : dict of lists
+        Key is the instrument, value is its fields
+
+    Examples
+    --------
+    >>> lsq2_fields = RedcapFields(redcap_metadata(token))
+    >>> lsq2_fields.completion('lifestyle_questionnaire_2')
+    ['obs_study_id', 'lifestyle_questionnaire_2_timestamp',
+     'lifestyle_questionnaire_2_complete']
+    >>> lsq2_fields.validate(obs_lsq_epds.Lsq2Epds.epds_fields)
+    """
+    def __init__(self, metadata):
+        """Planner of the fields in a data dictionary
+
+        Parameters
+        ----------
+        metadata : pandas.DataFrame
+            Data dictionary of the project (see redcap_metadata)
+        """
+        self.metadata = metadata
+        self.record_id = metadata['field_name'].iloc[0]
+        self.forms = {}
+        for field, form in zip(metadata['field_name'], metadata['form_name']):
+            self.forms.setdefault(form, []).append(field)
+
+        field_types = dict(zip(metadata['field_name'], metadata['field_type']))
+        # descriptive fields hold text and are never exported
+        self._fields = {
+            field for field, field_type in field_types.items()
+            if field_type != 'descriptive'
+        }
+        # checkboxes are exported as one field per choice (field___code)
+        self._checkboxes = {
+            field for field, field_type in field_types.items()
+            if field_type == 'checkbox'
+        }
+        # REDCap adds the completion status (and survey timestamp) of each
+        # instrument
+        for form in self.forms:
+            self._fields.update([form + '_complete', form + '_timestamp'])
+
+    def completion(self, form, id_col='obs_study_id'):
+        """OBS ID, survey timestamp and completion status of an instrument
+
+        Parameters
+        ----------
+        form : str
+            Instrument name (e.g. 'lifestyle_questionnaire_2')
+        id_col : str, optional
+            Field identifying the subjects, which need not be the record ID
+            of the project. The default is 'obs_study_id'.
+
+        Returns
+        -------
+        list of str
+
+        Raises
+        ------
+        KeyError
+            If the project has no such instrument, or id_col is not in the
+            project
+        """
+        if form not in self.forms:
+            raise KeyError(f'REDCap instrument {form} not in the project')
+        return self.validate(
+            [id_col, form + '_timestamp', form + '_complete']
+        )
+
+    def validate(self, fields):
+        """Check that fields can be exported from the project
+
+        Parameters
+        ----------
+        fields : list of str
+            Requested fields
+
+        Returns
+        -------
+        list of str
+            Fields without duplicates, in the order requested
+
+        Raises
+        ------
+        KeyError
+            If any field is not in the project; every missing field is
+            listed
+        """
+        missing = [
+            field for field in fields
+            if field not in self._fields
+            and field.split('___')[0] not in self._checkboxes
+        ]
+        if len(missing) > 0:
+            raise KeyError(
+                'REDCap fields not in the project: ' + ', '.join(missing)
+            )
+        return list(dict.fromkeys(fields))
+
+
+def redcap_lsq_summary(
+    api_param, version, cache_dir=None, reconcile_days=7, refresh=False,
+    stats=None, complete_only=False, obs_ids=None, fields=None,
+    metadata=None
+):
     """Get REDCap LSQ summary data
 
 
     Parameters
     ----------
-    api_param : str
-        API token for associated REDCap data.
+    api_param : str or RedcapClient
+        API token for associated REDCap data, or the client of that token.
     version : int or str
         Version of LSQ requesting (e.g. '1' for LSQ1).
+    cache_dir : str, optional
+        Directory of cached REDCap views; if given, only records modified
+        since the previous run are exported (see redcap_incremental). The
+        default is None, which exports every record.
+    reconcile_days : int or float, optional
+        Number of days after which the cached view is exported in full
+        again. The default is 7.
+    refresh : bool, optional
+        Export every record even if there is a cached view. The default is
+        False.
+    stats : dict, optional
+        Filled with the export statistics (see redcap_incremental); 'full'
+        is always True without cache_dir. The default is None.
+    complete_only : bool, optional
+        Only export records that completed the LSQ; filtered by REDCap
+        (filterLogic), so lsq_complete has nothing left to remove. The
+        default is False.
+    obs_ids : list of str, optional
+        Only export these records; if empty, no request is sent and an
+        empty frame is returned. The default is None (i.e. all records).
+    fields : list of str, optional
+        Fields exported in addition to the summary fields (e.g. the EPDS
+        items; see RedcapPlanner). The default is None.
+    metadata : RedcapFields, optional
+        Field planner of the project; the fields are checked before the
+        export. The default is None (not checked).
 
     Returns
     -------
     lsq_summary : pandas.DataFrame
         REDCap LSQ summary data.
 
-    """
+    Raises
+    ------
+    KeyError
+        If metadata is given and a field is not in the project
 
-    lsq_summary = redcap_data(
-        api_param,
-        {
-            'fields[0]' : 'obs_study_id',
-            'fields[1]' : (
-                 'lifestyle_questionnaire_'
-                 + re.sub(r'^[a-zA-Z]*', '', str(version))
-                 + '_timestamp'
-            ),
-            'fields[2]' : (
-                'lifestyle_questionnaire_'
-                + re.sub(r'^[a-zA-Z]*', '', str(version))
-                + '_complete'
-            ),
-        }
+    """
+    form = lsq_form(version)
+    lsq_num = form.rsplit('_', 1)[-1]
+    if metadata is None:
+        summary_fields = list(dict.fromkeys(
+            ['obs_study_id', form + '_timestamp', form + '_complete']
+            + list(fields or [])
+        ))
+    else:
+        summary_fields = metadata.validate(
+            metadata.completion(form) + list(fields or [])
+        )
+    if obs_ids is not None and len(obs_ids) == 0:
+        # nothing to export
+        if stats is not None:
+            stats.update({'bytes': 0, 'rows': 0, 'full': False})
+        return pd.DataFrame(columns=summary_fields, dtype=str)
+    summary_param = {
+        f'fields[{i}]': field for i, field in enumerate(summary_fields)
+    }
+    filter_logic = redcap_filter(
+        form + '_complete' if complete_only else None, obs_ids
     )
+    if filter_logic is not None:
+        summary_param['filterLogic'] = filter_logic
+
+    if cache_dir is None:
+        lsq_summary = redcap_data(api_param, summary_param, stats=stats)
+        if stats is not None:
+            stats['full'] = True
+    else:
+        lsq_summary = redcap_incremental(
+            api_param, summary_param, f'lsq{lsq_num}_summary', cache_dir,
+            reconcile_days=reconcile_days, refresh=refresh, stats=stats
+        )
 
     return lsq_summary
 
 
-def lsq_complete(lsq):
+class RedcapPlanner():
+    """Run-scoped plan of the REDCap exports of the LSQ projects
+
+    Consumers register the fields they need from a project before the
+    exports start; each project is then exported once with the union of
+    the fields (see redcap_lsq_summary) and every consumer gets its slice
+    of the shared frame. Concurrent requests for the same project wait for
+    the export already in flight instead of sending another one.
+
+    Attributes
+    ----------
+    export_param : dict
+        Keyword arguments of redcap_lsq_summary used for every export
+        (e.g. cache_dir, complete_only)
+    metadata : dict of RedcapFields
+        Key is the project, value is its field planner; fields of these
+        projects are checked when they are registered
+    metadata_param : dict or None
+        Keyword arguments of redcap_metadata used to export the data
+        dictionary of projects missing from metadata
+    fields : dict of lists
+        Key is the project (e.g. 'lsq2'), value is the fields registered by
+        its consumers in addition to the summary fields
+    export_count : int
+        Number of exports sent
+    request_count : int
+        Number of frames requested by consumers
+
+    Examples
+    --------
+    >>> planner = RedcapPlanner(complete_only=True)
+    >>> planner.add('lsq2', obs_lsq_epds.Lsq2Epds.epds_fields)
+    >>> lsq2_summary = planner.export(config_api.redcap_api['lsq2'], 'lsq2')
+    >>> lsq2_epds = planner.frame(
+    ...     'lsq2', obs_lsq_epds.Lsq2Epds.epds_fields, ['91200001']
+    ... )
+    """
+    def __init__(self, metadata=None, metadata_param=None, **export_param):
+        """Plan with no registered fields
+
+        Parameters
+        ----------
+        metadata : dict of RedcapFields, optional
+            Key is the project, value is its field planner. The default is
+            None (fields are not checked).
+        metadata_param : dict, optional
+            Keyword arguments of redcap_metadata (e.g. cache_dir). If
+            provided, self.export gets the data dictionary of a project
+            missing from metadata right before its records, on the same
+            thread, and checks the registered fields against it before the
+            records are exported. The default is None.
+        **export_param
+            Keyword arguments of redcap_lsq_summary used for every export
+        """
+        self.export_param = export_param
+        self.metadata = {} if metadata is None else metadata
+        self.metadata_param = metadata_param
+        self.fields = {}
+        self.export_count = 0
+        self.request_count = 0
+        self._frames = {}
+        self._lock = threading.Lock()
+        self._project_locks = {}
+
+    def add(self, project, fields):
+        """Register fields a consumer needs from a project
+
+        Parameters
+        ----------
+        project : str
+            Project, as passed to redcap_lsq_summary as version (e.g.
+            'lsq2')
+        fields : list of str
+            Fields needed by the consumer
+
+        Returns
+        -------
+        None.
+
+        Raises
+        ------
+        RuntimeError
+            If the project has already been exported
+        KeyError
+            If a field is not in the project (see self.metadata)
+        """
+        if project in self._frames:
+            raise RuntimeError(f'REDCap project {project} already exported')
+        if project in self.metadata:
+            fields = self.metadata[project].validate(fields)
+        project_fields = self.fields.setdefault(project, [])
+        project_fields.extend(
+            field for field in fields if field not in project_fields
+        )
+
+    def export(self, api_param, project, stats=None):
+        """Export a project once with every registered field
+
+        Parameters
+        ----------
+        api_param : str or RedcapClient
+            API token of the project, or the client of that token.
+        project : str
+            Project (e.g. 'lsq2')
+        stats : dict, optional
+            Filled with the export statistics (see redcap_incremental) by
+            the call that sends the export. The default is None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Summary and registered fields of the project; shared by every
+            consumer, so it must not be modified
+
+        Raises
+        ------
+        KeyError
+            If a registered field is not in the project (see self.metadata
+            and self.metadata_param)
+        """
+        with self._lock:
+            self.request_count += 1
+            project_lock = self._project_locks.setdefault(
+                project, threading.Lock()
+            )
+        with project_lock:
+            if project not in self._frames:
+                if (
+                    self.metadata_param is not None
+                    and project not in self.metadata
+                ):
+                    self.metadata[project] = RedcapFields(
+                        redcap_metadata(api_param, **self.metadata_param)
+                    )
+                self._frames[project] = redcap_lsq_summary(
+                    api_param, project, stats=stats,
+                    fields=self.fields.get(project),
+                    metadata=self.metadata.get(project), **self.export_param
+                )
+                with self._lock:
+                    self.export_count += 1
+
+        return self._frames[project]
+
+    def frame(self, project, fields, obs_ids=None):
+        """Slice of an exported project for one consumer
+
+        Parameters
+        ----------
+        project : str
+            Project (e.g. 'lsq2')
+        fields : list of str
+            Fields needed by the consumer
+        obs_ids : list of str, optional
+            Only these records. The default is None (i.e. all records).
+
+        Returns
+        -------
+        pandas.DataFrame
+            Copy of the fields (and records) of the project
+
+        Raises
+        ------
+        KeyError
+            If the project has not been exported yet
+        """
+        with self._lock:
+            self.request_count += 1
+        project_frame = self._frames[project]
+        if obs_ids is not None:
+            project_frame = project_frame[
+                project_frame['obs_study_id'].isin(obs_ids)
+            ]
+
+        return project_frame.loc[:, fields].reset_index(drop=True)
+
+
+def lsq_complete(lsq, stats=None):
     """Clean LSQ dataframe
 
+    Also drops incomplete LSQs left by an export that was not (or could not
+    be) filtered by REDCap.
+
     Parameters
     ----------
     lsq : pandas.DataFrame
         LSQ data derived from redcap_data()
+    stats : dict, optional
+        Filled with the number of 'rows_checked' and 'rows_kept'. The
+        default is None.
 
     Returns
     -------
@@ -280,37 +2119,143 @@ def lsq_complete(lsq):
             )
             break
 
+    if stats is not None:
+        stats['rows_checked'] = len(lsq.index)
+        stats['rows_kept'] = len(complete_lsq.index)
     return complete_lsq
 
 
-def redcap_clinic(api_param):
+def redcap_clinic(
+    api_param, batch_size=200, max_workers=4, max_bytes=8 * 2 ** 20,
+    stats=None, dtype=str
+):
     """Get AHRC REDCap clinic data
 
     Parameters
     ----------
-    api_param : str
-        API token for associated REDCap data.
+    api_param : str or RedcapClient
+        API token for associated REDCap data, or the client of that token.
+    batch_size : int, optional
+        Largest number of records exported per request. The default is 200.
+    max_workers : int, optional
+        Number of requests sent at the same time. The default is 4.
+    max_bytes : int, optional
+        Target size (bytes) of each response; the batch size is adjusted
+        to the bytes per record seen so far. The default is 8 MiB. None only
+        shrinks batches rejected by the server.
+    stats : dict, optional
+        Filled with the number of 'records', 'requests' and 'splits'
+        (batches halved after the server rejected them) and the final
+        'batch_size'. The default is None.
+    dtype : type or dict or tuple, optional
+        Type of the clinic columns; see redcap_data (e.g. REDCAP_DTYPES for
+        typed columns). The default is str.
 
     Returns
     -------
     complete_lsq : pandas.DataFrame
         DataFrame only containing REDCap clinic data.
 
+    Raises
+    ------
+    requests.HTTPError
+        If a request fails for a reason other than its size, or a single
+        record cannot be exported
+
     Notes
     -----
         Clinical data requires special treament due to export size
-        restrictions. Creates post request for each obs id and merges.
+        restrictions. Records are exported in batches of obs ids
+        (records[0..n]) on a bounded worker pool; a batch that fails with a
+        server error or timeout is split in half and retried, and later
+        batches are made smaller.
 
     """
-
-    rc_data = redcap_data(api_param, {'fields[0]': 'obs_id'})
+    client = redcap_client(api_param)
+    rc_data = redcap_data(client, {'fields[0]': 'obs_id'})
 
     obs_id_lst = list(rc_data['obs_id'].unique())
+    if stats is None:
+        stats = {}
+    stats.update(
+        {'records': len(obs_id_lst), 'requests': 1, 'splits': 0}
+    )
+
+    # batches are (position of first obs id, obs ids)
+    retry = deque()
+    next_pos = 0
+    cur_batch_size = max_batch_size = batch_size
+    clinic_dfs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        while next_pos < len(obs_id_lst) or retry or futures:
+            while len(futures) < max_workers and (
+                retry or next_pos < len(obs_id_lst)
+            ):
+                if retry:
+                    batch = retry.popleft()
+                else:
+                    batch = (
+                        next_pos,
+                        obs_id_lst[next_pos:next_pos + cur_batch_size]
+                    )
+                    next_pos += len(batch[1])
+                batch_stats = {}
+                future = executor.submit(
+                    redcap_data, client,
+                    {
+                        f'records[{i}]': obs_id
+                        for i, obs_id in enumerate(batch[1])
+                    },
+                    batch_stats, dtype
+                )
+                futures[future] = (batch, batch_stats)
+                stats['requests'] += 1
 
-    clinic_df_lst = []
-    for obs_id in obs_id_lst:
-        rc_data = redcap_data(api_param, {'records[0]': obs_id})
-        clinic_df_lst.append(rc_data)
-    merge_rc = pd.concat(clinic_df_lst)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                (pos, batch_ids), batch_stats = futures.pop(future)
+                try:
+                    clinic_dfs[pos] = future.result()
+                except (requests.HTTPError, requests.Timeout) as error:
+                    if len(batch_ids) == 1 or not _export_too_large(error):
+                        raise
+                    half = len(batch_ids) // 2
+                    retry.append((pos, batch_ids[:half]))
+                    retry.append((pos + half, batch_ids[half:]))
+                    # the server's limit is below this batch for the rest
+                    # of the export
+                    max_batch_size = min(max_batch_size, half)
+                    cur_batch_size = min(cur_batch_size, max_batch_size)
+                    stats['splits'] += 1
+                    continue
+
+                if max_bytes is not None and batch_stats['bytes'] > 0:
+                    bytes_per_record = batch_stats['bytes'] / len(batch_ids)
+                    cur_batch_size = max(
+                        1,
+                        min(max_batch_size, int(max_bytes / bytes_per_record))
+                    )
+
+    stats['batch_size'] = cur_batch_size
+    if len(clinic_dfs) == 0:
+        return pd.DataFrame(dtype=str)
+    merge_rc = pd.concat(
+        [clinic_dfs[pos] for pos in sorted(clinic_dfs)], ignore_index=True
+    )
 
     return merge_rc
+
+
+def _export_too_large(error):
+    """True if a failed REDCap export may succeed with fewer records
+
+    REDCap reports exports over its size or time limits as server errors
+    (e.g. PHP out of memory) or by not answering before the read timeout.
+    """
+    if isinstance(error, requests.Timeout):
+        return True
+    return error.response is not None and (
+        error.response.status_code == 413
+        or error.response.status_code >= 500
+    )
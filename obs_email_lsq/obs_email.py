@@ -4,9 +4,9 @@ import time
 import datetime
 import config
 import win32com.client
-import pyodbc
 import pandas as pd
 import numpy as np
+import obs_storage
 
 
 def send_email(
@@ -86,16 +86,21 @@ class ObsParticipants():
     status_priorities: dict
         key is LSQ version, value is associated inferior LSQs
     access_table: pandas.dataframe
-        Tables from access that have been cleaned and modified.
+        Tables from access that have been cleaned and modified; 'obs_id'
+        holds the OBS ID of each row as an integer, which exclusions are
+        matched on
     id_enrol: list of strings
         List of unique IDs of subjects enrolled in OBS
     access_patient_info: pandas.dataframe
         Contains 'obs_study_id', 'PatientID', 'PatientFirstName',
         'PatientSurname' from Access
-    id_excl: list of strings
-        List of subjects to exclude
+    id_excl: array-like of int
+        OBS IDs of subjects to exclude (see obs_data.access_exclude)
     access_wo_excl: pandas.dataframe
         Access table without the ids to be excluded (id_excl).
+    access_not_returned: dict of numpy.ndarray
+        Key is the LSQ number (e.g. '1'), value is the OBS IDs of subjects
+        who have been given that LSQ and have not returned it
     emails_link_pwd_dict:
         key is OBS ID, value is lsq links and associated passwords
 
@@ -131,6 +136,9 @@ class ObsParticipants():
         """
         cls.access_table = cls._clean_access_table(enrolment, followup)
         cls.id_enrol = list(cls.access_table['obs_study_id'].unique())
+        cls.access_not_returned = cls._find_access_not_returned(
+            cls.access_table
+        )
 
         cls.access_patient_info = cls.access_table.loc[
             :, [
@@ -141,12 +149,57 @@ class ObsParticipants():
             subset='obs_study_id', keep='last'
         ).set_index('obs_study_id').to_dict('index')
 
+    @ classmethod
+    def _find_access_not_returned(cls, access_table):
+        """Find given, not returned OBS IDs of every LSQ
+
+        The Given and Returned columns of all LSQs are reduced to one flag
+        per subject in a single groupby over the follow-up log.
+
+        Parameters
+        ----------
+        access_table : pandas.dataframe
+            Access table (see _clean_access_table); one row per follow-up
+            entry, with 'LSQ(X)Given' and 'LSQ(X)Returned' columns
+
+        Returns
+        -------
+        dict of numpy.ndarray
+            Key is the LSQ number, value is the OBS IDs (unique, in order of
+            first appearance) of subjects who have been given that LSQ and
+            have not returned it according to Access
+
+        """
+        lsq_nums = [
+            match.group(1) for match in (
+                re.match(r'^LSQ\((\d+)\)Given$', col)
+                for col in access_table.columns
+            )
+            if match and f'LSQ({match.group(1)})Returned' in access_table
+        ]
+        lsq_cols = [
+            f'LSQ({lsq_num}){event}'
+            for lsq_num in lsq_nums for event in ['Given', 'Returned']
+        ]
+        # any row of a subject marks the LSQ as given/returned
+        flags = (access_table[lsq_cols] > 0).groupby(
+            access_table['obs_study_id'], sort=False
+        ).any()
+
+        return {
+            lsq_num: flags.index[
+                flags[f'LSQ({lsq_num})Given']
+                & ~flags[f'LSQ({lsq_num})Returned']
+            ].to_numpy()
+            for lsq_num in lsq_nums
+        }
+
     @ classmethod
     def _clean_access_table(cls, enrolment, followup):
         """Modifies access tables
 
         Combines 'enrolment' and 'followup' tables; changes column types;
-        removes older subjects; adds LMP column
+        removes older subjects; adds LMP and obs_id (integer OBS ID) columns
 
         Parameters
         ----------
@@ -169,10 +222,11 @@ class ObsParticipants():
             followup, on='obs_study_id'
         )
 
-        # change column types
+        # change column types; the integer OBS ID is kept for exclusions
         access_table['EDC'] = pd.to_datetime(
             access_table['EDC'], format='%Y-%m-%d'
         )
+        access_table['obs_id'] = access_table['obs_study_id'].astype('int64')
         access_table['obs_study_id'] = access_table['obs_study_id'].astype(str)
         access_table['PatientID'] = (
             access_table['PatientID'].astype(str).str.replace(r'\.0', '')
@@ -194,8 +248,9 @@ class ObsParticipants():
 
         Parameters
         ----------
-        id_exclude : list of str
-            IDs to be removed from access table
+        id_exclude : array-like of int
+            IDs to be removed from access table (e.g. the sorted array
+            returned by obs_data.access_exclude)
 
         Returns
         -------
@@ -203,14 +258,11 @@ class ObsParticipants():
         """
         cls.id_excl = id_exclude
 
-        id_enrol_wo_excl = [
-            obs_id
-            for obs_id in cls.id_enrol
-            if int(obs_id) not in id_exclude
-        ]
-        cls.access_wo_excl = cls.access_table[
-            cls.access_table['obs_study_id'].isin(id_enrol_wo_excl)
-        ]
+        # anti-join on the integer OBS IDs (obs_id column)
+        excluded = cls.access_table['obs_id'].isin(
+            np.asarray(id_exclude, dtype='int64')
+        )
+        cls.access_wo_excl = cls.access_table[~excluded]
 
     @ classmethod
     def set_emails_link_pwd(cls, path_contact, path_link):
@@ -256,7 +308,7 @@ class Lsq(ObsParticipants):
     ----------
     lsq_num: int
         Number associated with particular LSQ; should be 1, 2, or 3
-    id_access_not_returned: list
+    id_access_not_returned: numpy.ndarray
         OBS IDs of subjects who have been given an LSQ but have not returned
         it
     redcap_lsq_comp: pandas.dataframe
@@ -309,37 +361,32 @@ class Lsq(ObsParticipants):
         """Find given, not returned OBS IDs
 
         Find the OBS IDs of subjects who have been given an LSQ and have not
-        completed that LSQ according to Access; set as class attribute
+        completed that LSQ according to Access; computed for every LSQ at
+        once by set_access_table (see access_not_returned)
 
         Returns
         -------
-        id_access_not_returned: list
+        id_access_not_returned: numpy.ndarray
             Subjects who have been given an LSQ but have not completed it
 
         """
-        access_given = self.access_table.loc[
-            self.access_table[f'LSQ({self.lsq_num})Given'] > 0,
-            'obs_study_id'
-        ].tolist()
-        access_returned = self.access_table.loc[
-            self.access_table[f'LSQ({self.lsq_num})Returned'] > 0,
-            'obs_study_id'
-        ].tolist()
-        id_access_not_returned = [
-            str(obs_id)
-            for obs_id in access_given
-            if obs_id not in access_returned
-        ]
-
-        return id_access_not_returned
+        return self.access_not_returned[self.lsq_num]
 
-    def update_access_returned(self,  path_access):
+    def update_access_returned(
+        self, path_access=None, backend=None, journal=None
+    ):
         """Update Access database with subjects who recently completed LSQ
 
         Parameters
         ----------
-        path_access: str
-            Path to the Access database
+        path_access: str, optional
+            Path to the Access database; used when backend is None
+        backend: obs_storage.StorageBackend, optional
+            Database holding OBSFollowupLog. The default is None, which
+            updates the Access database at path_access.
+        journal: obs_journal.FollowupJournal, optional
+            Journal the updates are recorded in and applied from. The default
+            is None, which writes the updates to the database immediately.
 
         Returns
         -------
@@ -355,14 +402,20 @@ class Lsq(ObsParticipants):
             self._execute_sql_access(
                     ids_updating=self.update_access_comp,
                     lsq_ver_tmpl='LSQ({})Returned',
-                    path_access=path_access
+                    path_access=path_access, backend=backend,
+                    journal=journal
             )
 
-    def _execute_sql_access(self, ids_updating, lsq_ver_tmpl, path_access):
+    def _execute_sql_access(
+        self, ids_updating, lsq_ver_tmpl, path_access=None, backend=None,
+        batch_size=None, journal=None
+    ):
         """Put REDCap data into Access database
 
         Cleans and formats data from REDCap and imports into
-        Access database
+        Access database. The INSERT statement is prepared once and the rows
+        are sent with executemany, committing once per batch; a failed batch
+        is rolled back. With a journal, the rows are only recorded in it.
 
         Parameters
         ----------
@@ -371,44 +424,64 @@ class Lsq(ObsParticipants):
         lsq_ver_tmpl : str
             String associated with a column in the Access database (e.g.
             'LSQ({})Returned')
-        path_access : str
-            Path to Access database
+        path_access : str, optional
+            Path to Access database; used when backend is None
+        backend : obs_storage.StorageBackend, optional
+            Database holding OBSFollowupLog. The default is None, which
+            updates the Access database at path_access.
+        batch_size : int, optional
+            Number of rows committed at a time. The default is None, which
+            commits all rows in a single transaction.
+        journal : obs_journal.FollowupJournal, optional
+            Journal the rows are recorded in instead of being written to the
+            database; they are applied when the journal is flushed. The
+            default is None.
 
         Returns
         -------
         None.
         """
-        conn = pyodbc.connect(
-            (
-                r'DRIVER={Microsoft Access Driver '
-                r'(*.mdb, *.accdb)}; DBQ=' + path_access +
-                r';;UID="";PWD="";'
-            )
-        )
-        cursor = conn.cursor()
+        if backend is None:
+            backend = obs_storage.AccessBackend(path_access)
 
+        # set data to be put into Access
+        lsq_ver = lsq_ver_tmpl.format(self.lsq_num)
+        rows = []
         for obs_id, date_compl in dict(ids_updating.values.tolist()).items():
-
-            # set data to be put into Access
-            patient_id = self.access_patient_info[obs_id]['PatientID']
-            patient_first_name = (
-                self.access_patient_info[obs_id]['PatientFirstName']
-            )
-            patient_surname = (
-                self.access_patient_info[obs_id]['PatientSurname']
-            )
-            obs_access_id = re.sub('^912', '912-', obs_id)
-            lsq_ver = lsq_ver_tmpl.format(self.lsq_num)
-            # put data into Access
-            cursor.execute(
-                'INSERT INTO OBSFollowupLog (PatientID, OBSEnrolmentID, '
-                'PatientFirstName, PatientSurname, OBSVisitDate, '
-                f'\"{lsq_ver}\") VALUES (?, ?, ?, ?, ?, ?)',
-                patient_id, obs_access_id, patient_first_name,
-                patient_surname, date_compl, 1
-            )
-            conn.commit()
-        conn.close()
+            rows.append((
+                self.access_patient_info[obs_id]['PatientID'],
+                re.sub('^912', '912-', obs_id),
+                self.access_patient_info[obs_id]['PatientFirstName'],
+                self.access_patient_info[obs_id]['PatientSurname'],
+                date_compl,
+                1
+            ))
+        if len(rows) == 0:
+            return
+        if journal is not None:
+            journal.record(lsq_ver, rows)
+            return
+        if batch_size is None:
+            batch_size = len(rows)
+
+        # put data into Access
+        conn = backend.connect()
+        try:
+            cursor = conn.cursor()
+            if backend.fast_executemany:
+                cursor.fast_executemany = True
+            for start in range(0, len(rows), batch_size):
+                try:
+                    cursor.executemany(
+                        obs_storage.FOLLOWUP_INSERT.format(lsq_ver),
+                        rows[start:start + batch_size]
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        finally:
+            backend.release(conn)
 
     def _clean_redcap_lsq_comp(self, redcap_lsq_compl):
         """Remove superflous columns from REDCap LSQ completed
@@ -708,18 +781,25 @@ class Lsq(ObsParticipants):
                 if obs_id not in high_pri
             ]
 
-    def send_lsq_emails(self, delay_sec=0):
+    def send_lsq_emails(self, delay_sec=0, journal=None):
         """Send LSQ link and password emails
 
         Parameters
         ----------
         delay_sec : int, optional
             Time to delay between emails. The default is 0.
+        journal : obs_journal.FollowupJournal, optional
+            Journal the Access update of each subject (as made by
+            update_access_status) is recorded in once both of their emails
+            have been sent, so a run that stops mid-send never records a
+            subject who was not emailed. The default is None (Access is
+            updated separately with update_access_status).
 
         Returns
         -------
         None.
         """
+        date_sent = datetime.date.today().strftime('%Y-%m-%d')
         for lsq_status, obs_ids in self.lsq_status.items():
             for obs_id in obs_ids:
                 email_address = self.emails_link_pwd_dict[obs_id]['E-mail']
@@ -755,15 +835,29 @@ class Lsq(ObsParticipants):
                 send_email(email_address, lsq_link_subject, lsq_link_body)
                 time.sleep(delay_sec)
 
-    def update_access_status(self, path_access):
+                if journal is not None:
+                    self._execute_sql_access(
+                        ids_updating=pd.DataFrame([[str(obs_id), date_sent]]),
+                        lsq_ver_tmpl=lsq_status, journal=journal
+                    )
+
+    def update_access_status(
+        self, path_access=None, backend=None, journal=None
+    ):
         """Update Access database with subjects who were sent LSQs
 
         Parameters
         ----------
         redcap_lsq_compl: list of strings
             All subjects how have completed the associated LSQ.
-        path_access: str
-            Path to the Access database
+        path_access: str, optional
+            Path to the Access database; used when backend is None
+        backend: obs_storage.StorageBackend, optional
+            Database holding OBSFollowupLog. The default is None, which
+            updates the Access database at path_access.
+        journal: obs_journal.FollowupJournal, optional
+            Journal the updates are recorded in and applied from. The default
+            is None, which writes the updates to the database immediately.
 
         """
         for lsq_ver in [
@@ -784,5 +878,6 @@ class Lsq(ObsParticipants):
                 self._execute_sql_access(
                         ids_updating=lsq_ver_for_execution,
                         lsq_ver_tmpl=lsq_ver,
-                        path_access=path_access
+                        path_access=path_access, backend=backend,
+                        journal=journal
                 )
@@ -0,0 +1,331 @@
+"""Write-behind journal of OBSFollowupLog updates"""
+
+import os
+import json
+import uuid
+import datetime
+import threading
+import obs_storage
+
+
+class FollowupJournal():
+    """Append-only local journal of OBSFollowupLog INSERTs
+
+    Writes are appended to a JSON lines file before they are sent to the
+    database, then applied in batches by self.flush (or by a background
+    flusher started with self.start) and marked as applied. Writes that were
+    not applied when a run stopped are loaded again by the next journal on
+    the same file.
+
+    The background flusher connects to the backend from its own thread, so
+    with an obs_storage.Session it uses a session connection of its own
+    (counted in connect_count and kept until the session is closed).
+
+    Applying is idempotent: rows already in OBSFollowupLog (same
+    OBSEnrolmentID, OBSVisitDate and LSQ status column set) are skipped, so
+    replaying writes that were committed but not yet marked as applied does
+    not duplicate them.
+
+    Attributes
+    ----------
+    path : str
+        Path to the journal file
+    backend : obs_storage.StorageBackend
+        Database holding OBSFollowupLog
+    batch_size : int
+        Number of rows committed at a time
+    flush_interval : int or float
+        Seconds between flushes of the background flusher
+    applied_count : int
+        Number of rows inserted into OBSFollowupLog by this journal
+    skipped_count : int
+        Number of journalled rows that were already in OBSFollowupLog
+
+    Examples
+    --------
+    >>> journal = FollowupJournal('journal.jsonl', backend)
+    >>> journal.start()
+    >>> journal.record('LSQ(1)Given', rows)
+    >>> journal.stop()
+    """
+    def __init__(self, path, backend, batch_size=500, flush_interval=5):
+        """Journal on a file; unapplied writes in the file are loaded
+
+        Parameters
+        ----------
+        path : str
+            Path to the journal file; created if it does not exist
+        backend : obs_storage.StorageBackend
+            Database holding OBSFollowupLog
+        batch_size : int, optional
+            Number of rows committed at a time. The default is 500.
+        flush_interval : int or float, optional
+            Seconds between flushes of the background flusher. The default
+            is 5.
+        """
+        self.path = path
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.applied_count = 0
+        self.skipped_count = 0
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._error = None
+
+        path_dir = os.path.dirname(path)
+        if path_dir:
+            os.makedirs(path_dir, exist_ok=True)
+        self._pending = self._read_pending()
+
+    def pending(self):
+        """Journalled writes that have not been applied yet
+
+        Returns
+        -------
+        list of dicts
+            Each with 'id', 'column' (LSQ status column, e.g.
+            'LSQ(1)Given') and 'row' (values of
+            obs_storage.FOLLOWUP_INSERT)
+        """
+        with self._lock:
+            return list(self._pending)
+
+    def record(self, column, rows):
+        """Append writes to the journal
+
+        The journal file is flushed to disk before returning; the rows are
+        applied to the database by the next flush.
+
+        Parameters
+        ----------
+        column : str
+            LSQ status column set by the rows (e.g. 'LSQ(1)Given')
+        rows : list of tuples
+            Values of obs_storage.FOLLOWUP_INSERT (PatientID,
+            OBSEnrolmentID, PatientFirstName, PatientSurname, OBSVisitDate,
+            LSQ status)
+
+        Returns
+        -------
+        None.
+        """
+        entries = [
+            {'id': uuid.uuid4().hex, 'column': column, 'row': list(row)}
+            for row in rows
+        ]
+        if len(entries) == 0:
+            return
+        with self._lock:
+            self._append([{'write': entry} for entry in entries])
+            self._pending.extend(entries)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Apply pending writes to the database in batches
+
+        Each batch is committed in one transaction and then marked as applied
+        in the journal; the journal file is emptied once every write has
+        been applied.
+
+        Returns
+        -------
+        int
+            Number of rows inserted into OBSFollowupLog
+        """
+        with self._flush_lock:
+            pending = self.pending()
+            if len(pending) == 0:
+                return 0
+
+            inserted = 0
+            cnxn = self.backend.connect()
+            try:
+                for start in range(0, len(pending), self.batch_size):
+                    batch = pending[start:start + self.batch_size]
+                    try:
+                        batch_inserted = _apply_batch(
+                            cnxn, batch, self.backend.fast_executemany
+                        )
+                        cnxn.commit()
+                    except Exception:
+                        cnxn.rollback()
+                        raise
+                    inserted += batch_inserted
+                    self.applied_count += batch_inserted
+                    self.skipped_count += len(batch) - batch_inserted
+                    self._mark_applied(batch)
+            finally:
+                self.backend.release(cnxn)
+
+            return inserted
+
+    def start(self):
+        """Start the background flusher
+
+        Returns
+        -------
+        None.
+        """
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name='FollowupJournal', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background flusher after applying every pending write
+
+        Returns
+        -------
+        None.
+
+        Raises
+        ------
+        Exception
+            The error that stopped the background flusher; unapplied writes
+            stay in the journal
+        """
+        if self._thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        self.flush()
+
+    def _run(self):
+        """Flush every self.flush_interval seconds until stopped"""
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                self._error = error
+                return
+            if self._stopping:
+                return
+
+    def _mark_applied(self, batch):
+        """Record that writes were applied; empty the journal if none remain"""
+        applied_ids = {entry['id'] for entry in batch}
+        with self._lock:
+            self._pending = [
+                entry for entry in self._pending
+                if entry['id'] not in applied_ids
+            ]
+            if len(self._pending) == 0:
+                path_tmp = self.path + '.tmp'
+                open(path_tmp, 'w').close()
+                os.replace(path_tmp, self.path)
+            else:
+                self._append([{'applied': sorted(applied_ids)}])
+
+    def _append(self, records):
+        """Append records to the journal file and flush them to disk"""
+        with open(self.path, 'a') as journal_file:
+            for record in records:
+                journal_file.write(json.dumps(record, default=_json_value))
+                journal_file.write('\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def _read_pending(self):
+        """Writes in the journal file that were not marked as applied"""
+        if not os.path.exists(self.path):
+            return []
+
+        writes = {}
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a write cut short by a crash was never applied
+                    continue
+                if 'write' in record:
+                    writes[record['write']['id']] = record['write']
+                for applied_id in record.get('applied', []):
+                    writes.pop(applied_id, None)
+
+        return list(writes.values())
+
+
+def _apply_batch(cnxn, batch, fast_executemany=False):
+    """INSERT the journalled rows not already in OBSFollowupLog
+
+    Parameters
+    ----------
+    cnxn : DB-API connection
+        Connection to the database holding OBSFollowupLog
+    batch : list of dicts
+        Journal entries (see FollowupJournal.pending)
+    fast_executemany : bool, optional
+        Use pyodbc's fast_executemany. The default is False.
+
+    Returns
+    -------
+    int
+        Number of rows inserted
+    """
+    cursor = cnxn.cursor()
+    if fast_executemany:
+        cursor.fast_executemany = True
+
+    by_column = {}
+    for entry in batch:
+        by_column.setdefault(entry['column'], []).append(tuple(entry['row']))
+
+    inserted = 0
+    for column, rows in by_column.items():
+        first_date = min(_visit_date(row[4]) for row in rows)
+        cursor.execute(
+            'SELECT OBSEnrolmentID, OBSVisitDate FROM OBSFollowupLog '
+            f'WHERE [{column}] <> 0 AND OBSVisitDate >= ?',
+            (first_date,)
+        )
+        existing = {
+            (obs_id, _visit_date(visit_date))
+            for obs_id, visit_date in cursor.fetchall()
+        }
+
+        new_rows = []
+        for row in rows:
+            key = (row[1], _visit_date(row[4]))
+            if key not in existing:
+                existing.add(key)
+                new_rows.append(row)
+        if len(new_rows) > 0:
+            cursor.executemany(
+                obs_storage.FOLLOWUP_INSERT.format(column), new_rows
+            )
+            inserted += len(new_rows)
+
+    return inserted
+
+
+def _visit_date(value):
+    """Date of an OBSVisitDate value (str, date or datetime)"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def _json_value(value):
+    """JSON value of numpy scalars (e.g. a PatientID read by pandas)"""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
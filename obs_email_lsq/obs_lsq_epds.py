@@ -1,5 +1,6 @@
 """Process the LSQ data for Edinburgh Postnatal Depression Scale issues"""
 
+import pandas as pd
 import obs_data
 
 
@@ -14,7 +15,14 @@ class Lsq2Epds():
         OBS IDs who need to be followed up based on their EPDS
 
     """
-    def __init__(self, obs_ids, api_param, cut_off):
+    # REDCap fields of the EPDS items
+    epds_fields = [
+        'obs_study_id', 'lwk_funny', 'lwk_lookfo', 'lwk_blame', 'lwk_anxio',
+        'lwk_scare', 'lwk_top', 'lwk_sleep', 'lwk_miser', 'lwk_cryin',
+        'lwk_harm',
+    ]
+
+    def __init__(self, obs_ids, api_param, cut_off, redcap_lsq2=None):
         """Process EPDS data from LSQ2
 
         Get EPDS data from REDCap API, do the EPDS calculations, and determine
@@ -24,26 +32,40 @@ class Lsq2Epds():
         ----------
         obs_ids : list of str
             OBS IDs to evaluate if they need to be followed up
-        api_param : str
-            API associated with LSQ
+        api_param : str or obs_data.RedcapClient
+            API associated with LSQ, or the REDCap client of that API
         cut_off : int
             EPDS cut off where values greater than or equal to will need to
             be followed up; passed to self._get_lsq2_ids
+        redcap_lsq2 : pandas.dataframe, optional
+            LSQ2 EPDS data already downloaded with self.redcap_epds (e.g.
+            concurrently with other REDCap exports). The default is None,
+            which downloads the EPDS data of obs_ids with api_param.
         """
-
-        self.redcap_lsq2 = self._redcap_lsq2_epds(api_param)
-        self.redcap_lsq2 = self._lsq2_epds(self.redcap_lsq2)
+        if redcap_lsq2 is None:
+            redcap_lsq2 = self.redcap_epds(api_param, obs_ids=obs_ids)
+        self.redcap_lsq2 = self._lsq2_epds(redcap_lsq2)
         self.fu_ids = self._get_lsq2_ids(
             obs_ids, self.redcap_lsq2, cut_off
         )
 
-    def _redcap_lsq2_epds(self, api_param):
+    @staticmethod
+    def redcap_epds(api_param, obs_ids=None, complete_only=False, stats=None):
         """Download LSQ2 EPDS data from REDCap
 
         Parameters
         ----------
-        api_param : str
-            API associated with LSQ
+        api_param : str or obs_data.RedcapClient
+            API associated with LSQ, or the REDCap client of that API
+        obs_ids : list of str, optional
+            Only download these subjects (records[]); nothing is requested
+            if it is empty. The default is None (i.e. all subjects).
+        complete_only : bool, optional
+            Only download subjects who completed LSQ2; filtered by REDCap.
+            The default is False.
+        stats : dict, optional
+            Filled with the 'bytes' and 'rows' downloaded. The default is
+            None.
 
         Returns
         -------
@@ -51,21 +73,24 @@ class Lsq2Epds():
             Dataframe containing LSQ2 EPDS data
 
         """
+        epds_param = {
+            f'fields[{i}]': field
+            for i, field in enumerate(Lsq2Epds.epds_fields)
+        }
+        if obs_ids is not None:
+            if len(obs_ids) == 0:
+                return pd.DataFrame(
+                    columns=list(epds_param.values()), dtype=str
+                )
+            epds_param.update({
+                f'records[{i}]': obs_id for i, obs_id in enumerate(obs_ids)
+            })
+        if complete_only:
+            epds_param['filterLogic'] = obs_data.redcap_filter(
+                'lifestyle_questionnaire_2_complete'
+            )
         redcap_lsq2_epds = obs_data.redcap_data(
-            api_param,
-            {
-                'fields[0]': 'obs_study_id',
-                'fields[1]': 'lwk_funny',
-                'fields[2]': 'lwk_lookfo',
-                'fields[3]': 'lwk_blame',
-                'fields[4]': 'lwk_anxio',
-                'fields[5]': 'lwk_scare',
-                'fields[6]': 'lwk_top',
-                'fields[7]': 'lwk_sleep',
-                'fields[8]': 'lwk_miser',
-                'fields[9]': 'lwk_cryin',
-                'fields[10]': 'lwk_harm',
-            }
+            api_param, epds_param, stats=stats
         )
 
         return redcap_lsq2_epds
@@ -181,7 +206,14 @@ class Lsq3Epds():
     fu_ids : list of str
         OBS IDs who need to be followed up based on their EPDS
     """
-    def __init__(self, obs_ids, api_param, cut_off):
+    # REDCap fields of the EPDS items
+    epds_fields = [
+        'obs_study_id', 'lweek_laugh', 'lweek_enjoy', 'lweek_blame',
+        'lweek_anxious', 'lweek_panic', 'lweek_top', 'lweek_unhappy',
+        'lweek_miserable', 'lweek_crying', 'lweek_harming',
+    ]
+
+    def __init__(self, obs_ids, api_param, cut_off, redcap_lsq3=None):
         """Process EPDS data from LSQ3
 
         Get EPDS data from REDCap API, do the EPDS calculations, and determine
@@ -191,25 +223,40 @@ class Lsq3Epds():
         ----------
         obs_ids : list of str
             OBS IDs to evaluate if they need to be followed up
-        api_param : str
-            API associated with LSQ
+        api_param : str or obs_data.RedcapClient
+            API associated with LSQ, or the REDCap client of that API
         cut_off : int
             EPDS cut off where values greater than or equal to will need to
             be followed up; passed to self._get_lsq3_ids
+        redcap_lsq3 : pandas.dataframe, optional
+            LSQ3 EPDS data already downloaded with self.redcap_epds (e.g.
+            concurrently with other REDCap exports). The default is None,
+            which downloads the EPDS data of obs_ids with api_param.
         """
-        self.redcap_lsq3 = self._redcap_lsq3_epds(api_param)
-        self.redcap_lsq3 = self._lsq3_epds(self.redcap_lsq3)
+        if redcap_lsq3 is None:
+            redcap_lsq3 = self.redcap_epds(api_param, obs_ids=obs_ids)
+        self.redcap_lsq3 = self._lsq3_epds(redcap_lsq3)
         self.fu_ids = self._get_lsq3_ids(
             obs_ids, self.redcap_lsq3, cut_off
         )
 
-    def _redcap_lsq3_epds(self, api_param):
+    @staticmethod
+    def redcap_epds(api_param, obs_ids=None, complete_only=False, stats=None):
         """Download LSQ3 EPDS data from REDCap
 
         Parameters
         ----------
-        api_param : str
-            API associated with LSQ
+        api_param : str or obs_data.RedcapClient
+            API associated with LSQ, or the REDCap client of that API
+        obs_ids : list of str, optional
+            Only download these subjects (records[]); nothing is requested
+            if it is empty. The default is None (i.e. all subjects).
+        complete_only : bool, optional
+            Only download subjects who completed LSQ3; filtered by REDCap.
+            The default is False.
+        stats : dict, optional
+            Filled with the 'bytes' and 'rows' downloaded. The default is
+            None.
 
         Returns
         -------
@@ -217,21 +264,24 @@ class Lsq3Epds():
             Dataframe containing LSQ3 EPDS data
 
         """
+        epds_param = {
+            f'fields[{i}]': field
+            for i, field in enumerate(Lsq3Epds.epds_fields)
+        }
+        if obs_ids is not None:
+            if len(obs_ids) == 0:
+                return pd.DataFrame(
+                    columns=list(epds_param.values()), dtype=str
+                )
+            epds_param.update({
+                f'records[{i}]': obs_id for i, obs_id in enumerate(obs_ids)
+            })
+        if complete_only:
+            epds_param['filterLogic'] = obs_data.redcap_filter(
+                'lifestyle_questionnaire_3_complete'
+            )
         redcap_lsq3_epds = obs_data.redcap_data(
-            api_param,
-            {
-                'fields[0]': 'obs_study_id',
-                'fields[1]': 'lweek_laugh',
-                'fields[2]': 'lweek_enjoy',
-                'fields[3]': 'lweek_blame',
-                'fields[4]': 'lweek_anxious',
-                'fields[5]': 'lweek_panic',
-                'fields[6]': 'lweek_top',
-                'fields[7]': 'lweek_unhappy',
-                'fields[8]': 'lweek_miserable',
-                'fields[9]': 'lweek_crying',
-                'fields[10]': 'lweek_harming'
-            }
+            api_param, epds_param, stats=stats
         )
 
         return redcap_lsq3_epds
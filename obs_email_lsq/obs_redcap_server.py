@@ -0,0 +1,406 @@
+"""Local stand-in for the REDCap API
+
+Serves record exports of fixture projects over HTTP with the parameters
+used by obs_data (fields[], records[], filterLogic, dateRangeBegin, format),
+and their data dictionaries (content=metadata), so the REDCap client code
+can be run and load tested without the network. Latency, throttling and
+server errors can be injected.
+"""
+
+import re
+import gzip
+import json
+import time
+import random
+import threading
+import http.server
+import urllib.parse
+import pandas as pd
+
+
+# column of a fixture project holding the time a record was last modified
+# ('%Y-%m-%d %H:%M:%S'); used for dateRangeBegin and never exported
+MODIFIED_COL = '_modified'
+
+
+class RedcapServer():
+    """REDCap API stand-in on a local port
+
+    Attributes
+    ----------
+    projects : dict of pandas.DataFrame
+        Key is the API token, value is the records of the project (one row
+        per record, every value str); see MODIFIED_COL
+    metadata : dict of pandas.DataFrame
+        Key is the API token, value is the data dictionary of the project
+        (field_name, form_name, field_type, ...)
+    latency : float
+        Seconds every response is delayed by
+    jitter : float
+        Largest number of seconds added at random to the latency
+    error_rate : float
+        Fraction of requests answered with error_status
+    error_status : int
+        HTTP status of injected errors
+    max_rate : float or None
+        Requests per second accepted before answering 429 (Too Many
+        Requests); None for no limit
+    request_count : int
+        Number of requests received
+    error_count : int
+        Number of injected errors
+    throttled_count : int
+        Number of requests answered 429
+
+    Examples
+    --------
+    >>> with RedcapServer({'TOKEN': records}, latency=0.05) as server:
+    ...     client = obs_data.redcap_client('TOKEN', url=server.url)
+    ...     lsq_summary = obs_data.redcap_lsq_summary(client, 1)
+    """
+    def __init__(
+        self, projects, latency=0, jitter=0, error_rate=0, error_status=500,
+        max_rate=None, seed=None, host='127.0.0.1', port=0, metadata=None
+    ):
+        """Server of fixture projects; not listening until started
+
+        Parameters
+        ----------
+        projects : dict of pandas.DataFrame
+            Key is the API token, value is the records of the project
+        latency : float, optional
+            Seconds every response is delayed by. The default is 0.
+        jitter : float, optional
+            Largest number of seconds added at random to the latency. The
+            default is 0.
+        error_rate : float, optional
+            Fraction of requests answered with error_status. The default is
+            0.
+        error_status : int, optional
+            HTTP status of injected errors. The default is 500.
+        max_rate : float, optional
+            Requests per second accepted before answering 429. The default
+            is None (no limit).
+        seed : int, optional
+            Seed of the injected jitter and errors. The default is None.
+        host : str, optional
+            Address the server listens on. The default is '127.0.0.1'.
+        port : int, optional
+            Port the server listens on. The default is 0 (any free port).
+        metadata : dict of pandas.DataFrame, optional
+            Key is the API token, value is the data dictionary of the
+            project. The default is None, which describes the fields of
+            each project as text fields (see project_metadata).
+        """
+        self.projects = {
+            token: records.astype(str).where(records.notna(), '')
+            for token, records in projects.items()
+        }
+        self.metadata = {
+            token: project_metadata(records)
+            for token, records in self.projects.items()
+        }
+        self.metadata.update(metadata or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_rate = max_rate
+        self.request_count = 0
+        self.error_count = 0
+        self.throttled_count = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = max_rate
+        self._refilled = time.monotonic()
+        self._address = (host, port)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """URL of the API; available once started"""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/'
+
+    def start(self):
+        """Listen for requests in a background thread
+
+        Returns
+        -------
+        RedcapServer
+            self
+        """
+        self._server = http.server.ThreadingHTTPServer(
+            self._address, _handler(self)
+        )
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='RedcapServer',
+            daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop listening
+
+        Returns
+        -------
+        None.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def update(self, token, records):
+        """Add or replace records of a project, marking them as modified now
+
+        Parameters
+        ----------
+        token : str
+            API token of the project
+        records : pandas.DataFrame
+            Records with the record ID as their first column
+
+        Returns
+        -------
+        None.
+        """
+        project = self.projects[token]
+        id_col = project.columns[0]
+        records = records.astype(str).where(records.notna(), '')
+        records[MODIFIED_COL] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            project = project[~project[id_col].isin(records[id_col])]
+            self.projects[token] = pd.concat(
+                [project, records], ignore_index=True
+            ).fillna('')
+
+    def respond(self, form):
+        """Status, content type and body of an API request
+
+        Parameters
+        ----------
+        form : dict of lists
+            Request parameters as parsed by urllib.parse.parse_qs
+
+        Returns
+        -------
+        (int, str, bytes)
+        """
+        with self._lock:
+            self.request_count += 1
+            throttled = not self._take_token()
+            if throttled:
+                self.throttled_count += 1
+            failed = not throttled and self._random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if throttled:
+            return 429, 'application/json', b'{"error": "Too many requests"}'
+        if failed:
+            return (
+                self.error_status, 'application/json',
+                b'{"error": "Injected error"}'
+            )
+
+        param = {name: values[0] for name, values in form.items()}
+        project = self.projects.get(param.get('token'))
+        if project is None:
+            return 403, 'application/json', b'{"error": "Invalid token"}'
+        if param.get('content') == 'metadata':
+            return (
+                200, 'text/csv',
+                self.metadata[param['token']].to_csv(index=False).encode(
+                    'utf-8'
+                )
+            )
+        if param.get('content') != 'record':
+            return 400, 'application/json', b'{"error": "Unsupported content"}'
+        try:
+            records = export_records(project, param)
+        except (KeyError, SyntaxError, ValueError) as error:
+            return (
+                400, 'application/json',
+                json.dumps({'error': str(error)}).encode('utf-8')
+            )
+
+        if param.get('format', 'xml') == 'json':
+            return (
+                200, 'application/json',
+                records.to_json(orient='records').encode('utf-8')
+            )
+        if param.get('format', 'xml') == 'csv':
+            if len(records.index) == 0:
+                return 200, 'text/csv', b'\n'
+            return 200, 'text/csv', records.to_csv(index=False).encode('utf-8')
+        return 400, 'application/json', b'{"error": "Unsupported format"}'
+
+    def _take_token(self):
+        """Token bucket of max_rate requests per second; call with the lock"""
+        if self.max_rate is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_rate,
+            self._tokens + (now - self._refilled) * self.max_rate
+        )
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def export_records(project, param):
+    """Records of a project selected by REDCap export parameters
+
+    Parameters
+    ----------
+    project : pandas.DataFrame
+        Records of the project, every value str
+    param : dict of str
+        Request parameters (fields[n], records[n], filterLogic,
+        dateRangeBegin)
+
+    Returns
+    -------
+    pandas.DataFrame
+        Selected records and fields
+
+    Raises
+    ------
+    KeyError
+        If a requested field is not in the project
+    """
+    records = project
+    record_ids = [
+        value for name, value in param.items() if name.startswith('records[')
+    ]
+    if len(record_ids) > 0:
+        records = records[records[records.columns[0]].isin(record_ids)]
+    if param.get('dateRangeBegin') and MODIFIED_COL in records.columns:
+        records = records[records[MODIFIED_COL] >= param['dateRangeBegin']]
+    if param.get('filterLogic'):
+        records = records[filter_mask(records, param['filterLogic'])]
+
+    fields = [
+        value for name, value in param.items() if name.startswith('fields[')
+    ]
+    if len(fields) == 0:
+        fields = [col for col in records.columns if col != MODIFIED_COL]
+    missing = [field for field in fields if field not in records.columns]
+    if len(missing) > 0:
+        raise KeyError('Unknown fields: ' + ', '.join(missing))
+
+    return records.loc[:, fields]
+
+
+def project_metadata(records):
+    """Data dictionary describing the fields of fixture records
+
+    Instruments are named after the completion status columns
+    (<form>_complete); every other field is a text field of the first
+    instrument.
+
+    Parameters
+    ----------
+    records : pandas.DataFrame
+        Records of the project, with the record ID as the first column
+
+    Returns
+    -------
+    pandas.DataFrame
+        'field_name', 'form_name', 'field_type' and 'field_label' of each
+        field
+    """
+    forms = [
+        col[:-len('_complete')] for col in records.columns
+        if col.endswith('_complete')
+    ] or ['form_1']
+    fields = [
+        col for col in records.columns
+        if col != MODIFIED_COL
+        and not any(col in (form + '_complete', form + '_timestamp')
+                    for form in forms)
+    ]
+    return pd.DataFrame({
+        'field_name': fields,
+        'form_name': forms[0],
+        'field_type': 'text',
+        'field_label': fields,
+    })
+
+
+def filter_mask(records, filter_logic):
+    """Evaluate REDCap filterLogic on records
+
+    Supports field comparisons (=, <>, !=, <, <=, >, >=) with quoted values
+    joined by and/or and grouped with parentheses, e.g.
+    '[lifestyle_questionnaire_1_complete] = "2" and ([obs_study_id] =
+    "91200001" or [obs_study_id] = "91200002")'.
+
+    Parameters
+    ----------
+    records : pandas.DataFrame
+        Records of the project, every value str
+    filter_logic : str
+        filterLogic request parameter
+
+    Returns
+    -------
+    pandas.Series of bool
+    """
+    expr = re.sub(r'\[(\w+)\]', r'`\1`', filter_logic)
+    expr = re.sub(r'<>', '!=', expr)
+    expr = re.sub(r'(?<![<>!=])=(?!=)', '==', expr)
+    if len(records.index) == 0:
+        return pd.Series([], dtype=bool, index=records.index)
+    return records.eval(expr, engine='python').astype(bool)
+
+
+def _handler(server):
+    """HTTP request handler class answering with server.respond"""
+    class RedcapHandler(http.server.BaseHTTPRequestHandler):
+        """Answer API POSTs, gzipped if the client accepts it"""
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = urllib.parse.parse_qs(
+                self.rfile.read(length).decode('utf-8'),
+                keep_blank_values=True
+            )
+            status, content_type, body = server.respond(form)
+            headers = {'Content-Type': content_type}
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, compresslevel=1)
+                headers['Content-Encoding'] = 'gzip'
+            if status == 429:
+                headers['Retry-After'] = '1'
+            headers['Content-Length'] = str(len(body))
+
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return RedcapHandler
@@ -0,0 +1,430 @@
+"""Storage backends holding the OBS database tables"""
+
+import abc
+import datetime
+import sqlite3
+import threading
+
+
+# INSERT of a row into OBSFollowupLog setting the LSQ status column in braces
+# (e.g. 'LSQ(1)Given')
+FOLLOWUP_INSERT = (
+    'INSERT INTO OBSFollowupLog (PatientID, OBSEnrolmentID, PatientFirstName, '
+    'PatientSurname, OBSVisitDate, "{}") VALUES (?, ?, ?, ?, ?, ?)'
+)
+
+
+# parse the column types declared by SqliteBackend.create_tables; applied by
+# the connections of SqliteBackend only (not registered with sqlite3, which
+# would apply them to every SQLite connection of the process)
+SQLITE_CONVERTERS = {
+    'DATETIME': datetime.datetime.fromisoformat,
+    'BOOLEAN': lambda value: value not in (0, '0', ''),
+}
+
+
+class StorageBackend(abc.ABC):
+    """Database holding the OBS tables ('OBS Enrolment Log', 'OBSFollowupLog',
+    'OBS Screening log')
+
+    Backends return DB-API connections that accept the same SQL (bracketed
+    table/column names and '?' parameters).
+
+    Attributes
+    ----------
+    name : str
+        Name of the backend as used in config.DATABASE_BACKEND
+    path : str
+        Path to the database file
+    fast_executemany : bool
+        If True, cursors send executemany parameters as a single array
+        (pyodbc's fast_executemany); only for drivers that support it
+
+    """
+    name = None
+
+    def __init__(self, path, fast_executemany=False):
+        """Database stored in a file
+
+        Parameters
+        ----------
+        path : str
+            Path to the database file
+        fast_executemany : bool, optional
+            Use pyodbc's fast_executemany for bulk writes. The default is
+            False since the Access ODBC driver does not support parameter
+            arrays.
+        """
+        self.path = path
+        self.fast_executemany = fast_executemany
+
+    @abc.abstractmethod
+    def connect(self):
+        """Open a new connection to the database
+
+        Returns
+        -------
+        DB-API connection
+        """
+
+    def release(self, cnxn):
+        """Give back a connection returned by self.connect
+
+        Parameters
+        ----------
+        cnxn : DB-API connection
+            Connection returned by self.connect
+
+        Returns
+        -------
+        None.
+        """
+        cnxn.close()
+
+
+class AccessBackend(StorageBackend):
+    """Microsoft Access database read through the Access ODBC driver"""
+    name = 'access'
+
+    def connect(self):
+        """Open a new ODBC connection to the Access database
+
+        Returns
+        -------
+        pyodbc.Connection
+        """
+        # imported here so the other backends work without an ODBC driver
+        # manager (e.g. libodbc on Linux)
+        import pyodbc
+
+        return pyodbc.connect(
+            (
+                r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)}; DBQ='
+                + self.path +
+                r';;UID="";PWD="";'
+            )
+        )
+
+
+class SqliteBackend(StorageBackend):
+    """Embedded SQLite database with the same tables as the Access database
+
+    Intended for running and load testing the read and write paths without
+    Windows or the Access ODBC driver.
+    """
+    name = 'sqlite'
+
+    def connect(self):
+        """Open a new connection to the SQLite database
+
+        Returns
+        -------
+        sqlite3.Connection
+        """
+        # connections are used by one thread at a time, but a Session closes
+        # them from the thread that closes the session
+        return sqlite3.connect(
+            self.path, check_same_thread=False, factory=_SqliteConnection
+        )
+
+    def create_tables(self, tables, schema=None, key='ID'):
+        """Create tables that do not exist yet
+
+        Parameters
+        ----------
+        tables : dict of lists
+            Key is the table name, value is its column names.
+        schema : dict of str, optional
+            Numpy type of each column (see obs_data.ACCESS_SCHEMA); dates and
+            flags are declared so they are read back as datetime and bool.
+            The default is None (all columns are TEXT).
+        key : str, optional
+            Autonumber column added to every table. The default is 'ID'.
+
+        Returns
+        -------
+        None.
+        """
+        if schema is None:
+            schema = {}
+        sql_types = {
+            'datetime64[ns]': 'DATETIME',
+            'bool': 'BOOLEAN',
+            'int64': 'INTEGER',
+        }
+
+        cnxn = self.connect()
+        try:
+            for table, columns in tables.items():
+                col_sql = [f'[{key}] INTEGER PRIMARY KEY AUTOINCREMENT']
+                col_sql.extend(
+                    f'[{col}] {sql_types.get(schema.get(col), "TEXT")}'
+                    for col in columns if col != key
+                )
+                cnxn.execute(
+                    f'CREATE TABLE IF NOT EXISTS [{table}] '
+                    f'({", ".join(col_sql)})'
+                )
+            cnxn.commit()
+        finally:
+            cnxn.close()
+
+
+class _SqliteConnection(sqlite3.Connection):
+    """SQLite connection converting the values of DATETIME and BOOLEAN columns
+
+    Result columns are matched by name with the columns declared in the
+    database (see SqliteBackend.create_tables) and converted with
+    SQLITE_CONVERTERS.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.row_factory = self._convert_row
+        # converters of each result column, keyed by the column names
+        self._row_converters = {}
+
+    def _convert_row(self, cursor, row):
+        """Row factory applying the converters of the result columns"""
+        names = tuple(col[0] for col in cursor.description)
+        converters = self._row_converters.get(names)
+        if converters is None:
+            declared = self._declared_types()
+            converters = [
+                SQLITE_CONVERTERS.get(declared.get(name)) for name in names
+            ]
+            self._row_converters[names] = converters
+        if not any(converters):
+            return row
+
+        return tuple(
+            value if convert is None or value is None else convert(value)
+            for convert, value in zip(converters, row)
+        )
+
+    def _declared_types(self):
+        """Declared type of every column with a type in SQLITE_CONVERTERS"""
+        cursor = self.cursor()
+        cursor.row_factory = None
+        try:
+            tables = [
+                row[0] for row in cursor.execute(
+                    "Select name From sqlite_master Where type = 'table'"
+                ).fetchall()
+            ]
+            declared = {}
+            for table in tables:
+                for col in cursor.execute(
+                    f'PRAGMA table_info("{table}")'
+                ).fetchall():
+                    if col[2].upper() in SQLITE_CONVERTERS:
+                        declared[col[1]] = col[2].upper()
+        finally:
+            cursor.close()
+
+        return declared
+
+
+class Session(StorageBackend):
+    """Run-scoped connections to a storage backend
+
+    A session can be passed wherever a backend is expected (e.g.
+    obs_data.access_data and obs_email.Lsq); connections it hands out are
+    kept open and reused until the session is closed, so a run connects to
+    the database once per thread instead of once per read or write.
+
+    Attributes
+    ----------
+    backend : StorageBackend
+        Backend the connections are opened with
+    connect_count : int
+        Number of connections opened by the session, including the
+        short-lived ones of self.unshared()
+
+    Examples
+    --------
+    >>> with Session(AccessBackend(config.ACCESS_PATH)) as session:
+    ...     access_dict = obs_data.access_data(backend=session)
+    >>> session.connect_count
+    1
+    """
+    def __init__(self, backend):
+        """Session on a backend; no connection is opened until needed
+
+        Parameters
+        ----------
+        backend : StorageBackend
+            Backend the connections are opened with
+        """
+        super().__init__(backend.path, backend.fast_executemany)
+        self.name = backend.name
+        self.backend = backend
+        self.connect_count = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cnxns = []
+
+    def open(self):
+        """Open the connection of the calling thread
+
+        Returns
+        -------
+        Session
+            self
+        """
+        self._closed = False
+        self.connect()
+        return self
+
+    def connect(self):
+        """Connection of the calling thread; opened on first use
+
+        Returns
+        -------
+        DB-API connection
+
+        Raises
+        ------
+        RuntimeError
+            If the session has been closed
+        """
+        if self._closed:
+            raise RuntimeError('Session is closed')
+        cnxn = getattr(self._local, 'cnxn', None)
+        if cnxn is None:
+            cnxn = self.backend.connect()
+            self._local.cnxn = cnxn
+            with self._lock:
+                self._cnxns.append(cnxn)
+                self.connect_count += 1
+
+        return cnxn
+
+    def unshared(self):
+        """Backend opening short-lived connections counted by the session
+
+        For work on threads that should not keep a session connection open
+        until the session is closed (e.g. a thread pool); its connections
+        are closed as soon as they are released.
+
+        Returns
+        -------
+        StorageBackend
+        """
+        return _UnsharedBackend(self)
+
+    def release(self, cnxn):
+        """Keep the connection open for the rest of the session
+
+        Parameters
+        ----------
+        cnxn : DB-API connection
+            Connection returned by self.connect
+
+        Returns
+        -------
+        None.
+        """
+
+    def close(self):
+        """Close every connection opened by the session
+
+        Returns
+        -------
+        None.
+        """
+        with self._lock:
+            cnxns, self._cnxns = self._cnxns, []
+            self._closed = True
+        for cnxn in cnxns:
+            self.backend.release(cnxn)
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _UnsharedBackend(StorageBackend):
+    """Short-lived connections of a Session's backend (see Session.unshared)
+
+    Attributes
+    ----------
+    session : Session
+        Session counting the connections
+    """
+    def __init__(self, session):
+        super().__init__(session.path, session.fast_executemany)
+        self.name = session.name
+        self.session = session
+
+    def connect(self):
+        """Open a new connection, counted in the session's connect_count
+
+        Returns
+        -------
+        DB-API connection
+
+        Raises
+        ------
+        RuntimeError
+            If the session has been closed
+        """
+        if self.session._closed:
+            raise RuntimeError('Session is closed')
+        cnxn = self.session.backend.connect()
+        with self.session._lock:
+            self.session.connect_count += 1
+
+        return cnxn
+
+    def release(self, cnxn):
+        """Close a connection returned by self.connect
+
+        Parameters
+        ----------
+        cnxn : DB-API connection
+            Connection returned by self.connect
+
+        Returns
+        -------
+        None.
+        """
+        self.session.backend.release(cnxn)
+
+
+BACKENDS = {
+    AccessBackend.name: AccessBackend,
+    SqliteBackend.name: SqliteBackend,
+}
+
+
+def get_backend(name, path):
+    """Get a storage backend by name
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend; a key of BACKENDS (e.g. 'access' or 'sqlite')
+    path : str
+        Path to the database file
+
+    Returns
+    -------
+    StorageBackend
+
+    Raises
+    ------
+    ValueError
+        If there is no backend with that name
+
+    """
+    if name not in BACKENDS:
+        raise ValueError(
+            f'Unknown storage backend "{name}"; expected one of '
+            + ', '.join(BACKENDS)
+        )
+
+    return BACKENDS[name](path)
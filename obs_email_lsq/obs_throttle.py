@@ -0,0 +1,441 @@
+"""Pacing, retries and hedging of REDCap API requests"""
+
+import time
+import random
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import (
+    ThreadPoolExecutor, wait, FIRST_COMPLETED
+)
+import numpy as np
+import requests
+
+
+# HTTP statuses telling the client to send fewer requests at a time
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+# HTTP statuses worth sending the same request again for; REDCap answers
+# exports over its memory limit with 500, which fails again
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class AimdLimiter():
+    """Adaptive limit on the number of requests in flight
+
+    The limit grows additively (by about one per round trip of requests)
+    while responses are fine and is cut multiplicatively when the server
+    signals overload (429, 5xx, timeouts, or latency over a target). Cuts
+    are made once per round trip: signals of requests sent before the last
+    cut are ignored.
+
+    Attributes
+    ----------
+    limit : float
+        Current number of requests allowed in flight
+    min_limit : int
+        Smallest limit
+    max_limit : int
+        Largest limit
+    decrease : float
+        Factor the limit is multiplied by on overload
+    latency_target : float or None
+        Seconds above which a response counts as overload; None to only use
+        errors
+    in_flight : int
+        Number of requests in flight
+    decrease_count : int
+        Number of cuts of the limit
+
+    """
+    def __init__(
+        self, limit=4, min_limit=1, max_limit=16, decrease=0.5,
+        latency_target=None
+    ):
+        """Limiter starting at a limit
+
+        Parameters
+        ----------
+        limit : int, optional
+            Initial number of requests allowed in flight. The default is 4.
+        min_limit : int, optional
+            Smallest limit. The default is 1.
+        max_limit : int, optional
+            Largest limit. The default is 16.
+        decrease : float, optional
+            Factor the limit is multiplied by on overload. The default is
+            0.5.
+        latency_target : float, optional
+            Seconds above which a response counts as overload. The default
+            is None (only errors).
+        """
+        self.limit = float(min(max(limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.decrease_count = 0
+        self._cond = threading.Condition()
+        self._decreased_at = 0.0
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Wait until a request may be sent and hold its slot
+
+        Yields
+        ------
+        float
+            Time (time.monotonic) the request was let through; pass it to
+            self.on_success or self.on_overload
+        """
+        with self._cond:
+            while self.in_flight >= max(int(self.limit), self.min_limit):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield time.monotonic()
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, started, latency):
+        """Grow the limit after a response, unless it was too slow
+
+        Parameters
+        ----------
+        started : float
+            Time yielded by self.slot
+        latency : float
+            Seconds the request took
+
+        Returns
+        -------
+        None.
+        """
+        if self.latency_target is not None and latency > self.latency_target:
+            self.on_overload(started)
+            return
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_overload(self, started):
+        """Cut the limit after an overload signal
+
+        Parameters
+        ----------
+        started : float
+            Time yielded by self.slot
+
+        Returns
+        -------
+        None.
+        """
+        with self._cond:
+            if started < self._decreased_at:
+                # already cut for this round trip
+                return
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self._decreased_at = time.monotonic()
+            self.decrease_count += 1
+
+
+class LatencyStats():
+    """Latencies of the most recent requests
+
+    Attributes
+    ----------
+    count : int
+        Number of latencies recorded
+
+    """
+    def __init__(self, size=1000):
+        """Window of recent latencies
+
+        Parameters
+        ----------
+        size : int, optional
+            Number of recent latencies kept. The default is 1000.
+        """
+        self.count = 0
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        """Add the latency (seconds) of a request
+
+        Returns
+        -------
+        None.
+        """
+        with self._lock:
+            self._latencies.append(latency)
+            self.count += 1
+
+    def percentiles(self, q=(50, 95, 99)):
+        """Latency percentiles of the recent requests
+
+        Parameters
+        ----------
+        q : tuple of float, optional
+            Percentiles. The default is (50, 95, 99).
+
+        Returns
+        -------
+        dict of float
+            Key is the percentile, value is the latency (seconds); empty if
+            nothing was recorded
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+        if len(latencies) == 0:
+            return {}
+        return dict(zip(q, np.percentile(latencies, q).tolist()))
+
+
+class Throttle():
+    """Paced, retried and hedged sending of requests
+
+    Requests wait for a slot of an AimdLimiter; ones that fail with a
+    retryable status or a connection error are sent again after an
+    exponential backoff with full jitter (or the server's Retry-After).
+    Idempotent requests still unanswered after hedge_after are sent a
+    second time and the first response is used.
+
+    Attributes
+    ----------
+    limiter : AimdLimiter
+        Limit of the requests in flight
+    retries : int
+        Number of times a failed request is sent again
+    backoff : float
+        Seconds of the first backoff; doubled for each retry
+    max_backoff : float
+        Largest backoff (seconds)
+    hedge_after : float or str or None
+        Seconds, or a latency percentile (e.g. 'p95'), after which an
+        idempotent request is hedged; None to never hedge
+    latencies : LatencyStats
+        Latencies of the requests sent
+    retry_count : int
+        Number of requests sent again after failing
+    hedge_count : int
+        Number of hedged requests sent
+    hedge_win_count : int
+        Number of hedged requests answered before the request they hedged
+
+    Examples
+    --------
+    >>> throttle = Throttle(AimdLimiter(max_limit=8), hedge_after='p95')
+    >>> client = obs_data.RedcapClient(token, throttle=throttle)
+    """
+    def __init__(
+        self, limiter=None, retries=3, backoff=1, max_backoff=60,
+        hedge_after=None, seed=None
+    ):
+        """Throttle of a REDCap server
+
+        Parameters
+        ----------
+        limiter : AimdLimiter, optional
+            Limit of the requests in flight. The default is None (an
+            AimdLimiter with its defaults).
+        retries : int, optional
+            Number of times a failed request is sent again. The default is 3.
+        backoff : float, optional
+            Seconds of the first backoff. The default is 1.
+        max_backoff : float, optional
+            Largest backoff (seconds). The default is 60.
+        hedge_after : float or str, optional
+            Seconds, or a latency percentile (e.g. 'p95'), after which an
+            idempotent request is hedged. The default is None (no hedging).
+        seed : int, optional
+            Seed of the backoff jitter. The default is None.
+        """
+        self.limiter = AimdLimiter() if limiter is None else limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.latencies = LatencyStats()
+        self.retry_count = 0
+        self.hedge_count = 0
+        self.hedge_win_count = 0
+        self._random = random.Random(seed)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def send(self, request, idempotent=True):
+        """Send a request, retrying and hedging it as needed
+
+        Parameters
+        ----------
+        request : callable
+            Sends the request and returns its response; raises
+            requests.HTTPError for error statuses
+        idempotent : bool, optional
+            If True, the request may be hedged. The default is True.
+
+        Returns
+        -------
+        Return value of request
+
+        Raises
+        ------
+        requests.RequestException
+            The error of the last attempt
+        """
+        attempt = 0
+        while True:
+            try:
+                hedge_delay = self.hedge_delay() if idempotent else None
+                if hedge_delay is None:
+                    return self._timed(request)
+                return self._hedged(request, hedge_delay)
+            except requests.RequestException as error:
+                if attempt >= self.retries or not is_retryable(error):
+                    raise
+                time.sleep(self.backoff_delay(attempt, error))
+                attempt += 1
+                with self._lock:
+                    self.retry_count += 1
+
+    def hedge_delay(self):
+        """Seconds after which a request is hedged; None for no hedging"""
+        if self.hedge_after is None:
+            return None
+        if not isinstance(self.hedge_after, str):
+            return self.hedge_after
+        # percentile of the latencies, once there are enough of them
+        if self.latencies.count < 20:
+            return None
+        q = float(self.hedge_after.lstrip('p'))
+        return self.latencies.percentiles((q,))[q]
+
+    def backoff_delay(self, attempt, error=None):
+        """Seconds to wait before sending a failed request again
+
+        Parameters
+        ----------
+        attempt : int
+            Number of retries already made
+        error : requests.RequestException, optional
+            Error of the failed request; its Retry-After header is a lower
+            bound. The default is None.
+
+        Returns
+        -------
+        float
+        """
+        delay = self._random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt)
+        )
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers['Retry-After']))
+            except (KeyError, ValueError):
+                pass
+        return delay
+
+    def close(self):
+        """Stop the threads sending hedged requests
+
+        Returns
+        -------
+        None.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _timed(self, request):
+        """Send a request in a slot of the limiter, timing it"""
+        with self.limiter.slot() as started:
+            start = time.perf_counter()
+            try:
+                response = request()
+            except requests.RequestException as error:
+                if is_overload(error):
+                    self.limiter.on_overload(started)
+                raise
+            latency = time.perf_counter() - start
+            self.latencies.record(latency)
+            self.limiter.on_success(started, latency)
+            return response
+
+    def _hedged(self, request, delay):
+        """Send a request, and again if it is not answered after delay
+
+        The response that is not used is closed once it arrives (if it has
+        a close method, e.g. a requests.Response), so its connection goes
+        back to the pool.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * self.limiter.max_limit,
+                    thread_name_prefix='Throttle'
+                )
+        primary = self._executor.submit(self._timed, request)
+        done, pending = wait([primary], timeout=delay)
+        if len(done) == 0:
+            hedge = self._executor.submit(self._timed, request)
+            with self._lock:
+                self.hedge_count += 1
+            pending = {primary, hedge}
+        else:
+            hedge = None
+
+        error = None
+        while len(done) > 0 or len(pending) > 0:
+            if len(done) == 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            future = done.pop()
+            if future.exception() is None:
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_win_count += 1
+                for loser in done | pending:
+                    loser.add_done_callback(_close_result)
+                return future.result()
+            if error is None:
+                error = future.exception()
+        raise error
+
+
+def _close_result(future):
+    """Close the result of a finished request that is not used"""
+    if future.exception() is None:
+        close = getattr(future.result(), 'close', None)
+        if callable(close):
+            close()
+
+
+def is_overload(error):
+    """True if a failed request tells the client to slow down"""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    response = getattr(error, 'response', None)
+    return (
+        response is not None and response.status_code in OVERLOAD_STATUSES
+    )
+
+
+def is_retryable(error):
+    """True if a failed request may succeed when sent again
+
+    Timeouts are not retried: REDCap times out on exports too large for it,
+    which obs_data.redcap_clinic splits instead.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        # the request never reached REDCap
+        return True
+    if isinstance(error, requests.Timeout):
+        return False
+    if isinstance(error, requests.ConnectionError):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code in RETRY_STATUSES
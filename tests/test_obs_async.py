@@ -0,0 +1,109 @@
+"""Tests for obs_async module"""
+
+import time
+import threading
+import pytest
+import obs_data
+import obs_async
+
+
+def slow_export(client, delay):
+    """Stand in for a REDCap export taking delay seconds"""
+    time.sleep(delay)
+    return client.token
+
+
+def tracked_export(client, events, barrier=None):
+    """Stand in for a REDCap export recording when it starts and finishes
+
+    With a barrier, the export waits until every party has started.
+    """
+    events.append(('start', client.token))
+    if barrier is None:
+        time.sleep(0.05)
+    else:
+        barrier.wait(timeout=5)
+    events.append(('finish', client.token))
+    return client.token
+
+
+def failed_export(client):
+    """Stand in for a REDCap export that fails"""
+    raise ValueError(client.token)
+
+
+@pytest.fixture
+def clients():
+    """REDCap clients of three projects on two hosts"""
+    clients = {
+        'lsq1': obs_data.RedcapClient('T1', url='https://redcap.a/api/'),
+        'lsq2': obs_data.RedcapClient('T2', url='https://redcap.a/api/'),
+        'lsq3': obs_data.RedcapClient('T3', url='https://redcap.b/api/'),
+    }
+    yield clients
+    for client in clients.values():
+        client.close()
+
+
+def test_gather_exports(clients):
+    """Test obs_async.gather_exports runs exports concurrently"""
+    aio = obs_async.AsyncRedcap(max_per_host=4)
+    # every export waits for the others to start, so they must overlap
+    events = []
+    barrier = threading.Barrier(len(clients))
+    actual = obs_async.gather_exports(
+        {
+            name: (tracked_export, client, events, barrier)
+            for name, client in clients.items()
+        },
+        aio=aio
+    )
+
+    assert actual == {'lsq1': 'T1', 'lsq2': 'T2', 'lsq3': 'T3'}
+    assert [event for event, _ in events[:3]] == ['start'] * 3
+    assert aio.peak == {'redcap.a': 2, 'redcap.b': 1}
+    assert set(aio.timings) == {'lsq1', 'lsq2', 'lsq3'}
+
+
+def test_gather_exports_limit(clients):
+    """Test obs_async.AsyncRedcap per-host concurrency limit"""
+    aio = obs_async.AsyncRedcap(max_per_host=1)
+    events = []
+    obs_async.gather_exports(
+        {
+            name: (tracked_export, client, events)
+            for name, client in clients.items()
+        },
+        aio=aio
+    )
+
+    assert aio.peak == {'redcap.a': 1, 'redcap.b': 1}
+    # the exports of redcap.a run one after the other
+    host_a = [event for event in events if event[1] in ('T1', 'T2')]
+    assert [event for event, _ in host_a] == [
+        'start', 'finish', 'start', 'finish'
+    ]
+    assert host_a[0][1] == host_a[1][1]
+
+
+def test_gather_exports_error(clients):
+    """Test obs_async.gather_exports raises the error of an export"""
+    with pytest.raises(ValueError, match='T2'):
+        obs_async.gather_exports({
+            'lsq1': (slow_export, clients['lsq1'], 0),
+            'lsq2': (failed_export, clients['lsq2']),
+        })
+
+
+def test_gather_exports_reuse(clients):
+    """Test obs_async.AsyncRedcap can run several gather_exports"""
+    aio = obs_async.AsyncRedcap(max_per_host=1)
+    for _ in range(2):
+        actual = obs_async.gather_exports(
+            {
+                name: (slow_export, client, 0.01)
+                for name, client in clients.items()
+            },
+            aio=aio
+        )
+        assert actual == {'lsq1': 'T1', 'lsq2': 'T2', 'lsq3': 'T3'}
@@ -0,0 +1,204 @@
+"""Tests for obs_cache module"""
+
+import os
+import pytest
+import pandas as pd
+import obs_cache
+
+
+def make_access_file(tmp_path):
+    """Create a fake Access database file"""
+    path_access = tmp_path / 'Research Database.accdb'
+    path_access.write_bytes(b'access database contents')
+    return str(path_access)
+
+
+def test_AccessSnapshot_load_save(tmp_path):
+    """Test obs_cache.AccessSnapshot.load and obs_cache.AccessSnapshot.save"""
+    path_access = make_access_file(tmp_path)
+    table = pd.DataFrame(
+        {'obs_study_id': [91200001, 91200002], 'PatientID': ['1', '2']}
+    )
+
+    snapshot = obs_cache.AccessSnapshot(str(tmp_path / 'cache'), path_access)
+    assert snapshot.load('followup', ['OBSEnrolmentID']) is None
+    assert snapshot.save('followup', table, ['OBSEnrolmentID'])
+
+    snapshot = obs_cache.AccessSnapshot(str(tmp_path / 'cache'), path_access)
+    assert snapshot.load('followup', ['OBSEnrolmentID']).equals(table)
+    # different column projection
+    assert snapshot.load('followup', None) is None
+
+    # explicit refresh
+    snapshot = obs_cache.AccessSnapshot(
+        str(tmp_path / 'cache'), path_access, refresh=True
+    )
+    assert snapshot.load('followup', ['OBSEnrolmentID']) is None
+
+
+def test_AccessSnapshot_invalidation(tmp_path):
+    """Test obs_cache.AccessSnapshot invalidation by mtime and checksum"""
+    path_access = make_access_file(tmp_path)
+    table = pd.DataFrame({'obs_study_id': [91200001]})
+
+    for checksum in [False, True]:
+        obs_cache.AccessSnapshot(
+            str(tmp_path / 'cache'), path_access, checksum=checksum
+        ).save('enrolment', table)
+
+    # touching the database only invalidates the modification time check
+    file_stat = os.stat(path_access)
+    os.utime(path_access, (file_stat.st_atime, file_stat.st_mtime + 10))
+    assert obs_cache.AccessSnapshot(
+        str(tmp_path / 'cache'), path_access
+    ).load('enrolment') is None
+    assert obs_cache.AccessSnapshot(
+        str(tmp_path / 'cache'), path_access, checksum=True
+    ).load('enrolment').equals(table)
+
+    # changing the contents invalidates the checksum check
+    with open(path_access, 'ab') as access_file:
+        access_file.write(b'new row')
+    assert obs_cache.AccessSnapshot(
+        str(tmp_path / 'cache'), path_access, checksum=True
+    ).load('enrolment') is None
+
+
+def test_AccessSnapshot_fingerprint(tmp_path):
+    """Test obs_cache.AccessSnapshot validation by table fingerprint"""
+    path_access = make_access_file(tmp_path)
+    table = pd.DataFrame({'obs_study_id': [91200001]})
+
+    obs_cache.AccessSnapshot(str(tmp_path / 'cache'), path_access).save(
+        'enrolment', table, fingerprint=[1, 'OBS912-00001']
+    )
+
+    # changes elsewhere in the database do not invalidate the snapshot
+    with open(path_access, 'ab') as access_file:
+        access_file.write(b'new follow-up row')
+    snapshot = obs_cache.AccessSnapshot(str(tmp_path / 'cache'), path_access)
+    assert snapshot.load(
+        'enrolment', fingerprint=[1, 'OBS912-00001']
+    ).equals(table)
+    assert snapshot.load('enrolment') is None
+
+    # a new row of the table does
+    assert snapshot.load(
+        'enrolment', fingerprint=[2, 'OBS912-00002']
+    ) is None
+
+    # so does age
+    assert snapshot.load(
+        'enrolment', fingerprint=[1, 'OBS912-00001'], max_age_days=0
+    ) is None
+
+
+def test_RedcapView_load_save(tmp_path):
+    """Test obs_cache.RedcapView.load and obs_cache.RedcapView.save"""
+    view = pd.DataFrame(
+        {'obs_study_id': ['91200001', '91200002'], 'complete': ['2', None]}
+    )
+    params = {'fields[0]': 'obs_study_id', 'fields[1]': 'complete'}
+
+    views = obs_cache.RedcapView(str(tmp_path / 'redcap'))
+    assert views.load('lsq1_summary', 'TOKEN', params, 7) == (None, None)
+    views.save('lsq1_summary', 'TOKEN', params, view, '2020-01-31 12:00:00')
+
+    views = obs_cache.RedcapView(str(tmp_path / 'redcap'))
+    actual, watermark = views.load('lsq1_summary', 'TOKEN', params, 7)
+    assert actual.equals(view.fillna(float('nan')))
+    assert watermark == '2020-01-31 12:00:00'
+    # token is not stored
+    with open(views.meta_path) as meta_file:
+        assert 'TOKEN' not in meta_file.read()
+    # other project, other parameters or stale full export
+    assert views.load('lsq1_summary', 'OTHER', params, 7) == (None, None)
+    assert views.load(
+        'lsq1_summary', 'TOKEN', {'fields[0]': 'obs_study_id'}, 7
+    ) == (None, None)
+    assert views.load('lsq1_summary', 'TOKEN', params, -1) == (None, None)
+
+    # delta exports keep the time of the last full export
+    views.save(
+        'lsq1_summary', 'TOKEN', params, view, '2020-02-07 12:00:00',
+        full_export=False
+    )
+    assert views.load('lsq1_summary', 'TOKEN', params, 7)[1] == (
+        '2020-02-07 12:00:00'
+    )
+
+
+def test_RedcapMetadata(tmp_path):
+    """Test obs_cache.RedcapMetadata.load and obs_cache.RedcapMetadata.save"""
+    content = (
+        b'field_name,form_name,field_type\n'
+        b'obs_study_id,lifestyle_questionnaire_2,text\n'
+    )
+    metadata = obs_cache.RedcapMetadata(str(tmp_path / 'redcap'))
+    assert metadata.load('TOKEN') is None
+    assert metadata.save('TOKEN', content)
+    assert not metadata.save('TOKEN', content)
+    assert metadata.save('TOKEN', content + b'lwk_funny,lsq,radio\n')
+
+    metadata = obs_cache.RedcapMetadata(str(tmp_path / 'redcap'))
+    actual = metadata.load('TOKEN', max_age_days=1)
+    assert actual['field_name'].tolist() == ['obs_study_id', 'lwk_funny']
+    assert metadata.load('OTHER') is None
+    assert metadata.load('TOKEN', max_age_days=-1) is None
+    # token is not stored
+    for name in os.listdir(metadata.cache_dir):
+        assert 'TOKEN' not in name
+    with open(metadata.meta_path) as meta_file:
+        assert 'TOKEN' not in meta_file.read()
+
+
+def test_ResponseCache(tmp_path):
+    """Test obs_cache.ResponseCache read-through and offline modes"""
+    cache_dir = str(tmp_path / 'responses')
+    params = {'content': 'record', 'fields[0]': 'obs_study_id'}
+
+    cache = obs_cache.ResponseCache(cache_dir, ttl=60)
+    assert cache.get('TOKEN', params) is None
+    cache.put('TOKEN', params, b'obs_study_id\n91200001\n')
+    assert cache.get('TOKEN', params) == b'obs_study_id\n91200001\n'
+    # parameter order does not matter, the project does
+    assert cache.get('TOKEN', dict(reversed(params.items()))) is not None
+    assert cache.get('OTHER', params) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+    # token is not stored
+    for name in os.listdir(cache_dir):
+        assert 'TOKEN' not in name
+
+    # stale responses are requested again, unless offline
+    path = cache._response_path(cache.key('TOKEN', params))
+    os.utime(path, (0, 0))
+    assert cache.get('TOKEN', params) is None
+    cache = obs_cache.ResponseCache(cache_dir, mode='offline', ttl=60)
+    assert cache.get('TOKEN', params) == b'obs_study_id\n91200001\n'
+    cache.put('TOKEN', {'content': 'metadata'}, b'field_name\n')
+    with pytest.raises(LookupError):
+        cache.get('TOKEN', {'content': 'metadata'})
+
+    cache = obs_cache.ResponseCache(cache_dir, mode='off')
+    assert cache.get('TOKEN', params) is None
+
+    with pytest.raises(ValueError):
+        obs_cache.ResponseCache(cache_dir, mode='write-only')
+
+
+def test_ResponseCache_evict(tmp_path):
+    """Test obs_cache.ResponseCache evicts the least recently used responses"""
+    cache = obs_cache.ResponseCache(str(tmp_path / 'responses'))
+    for record in range(3):
+        params = {'records[0]': str(record)}
+        cache.put('TOKEN', params, os.urandom(1000))
+        path = cache._response_path(cache.key('TOKEN', params))
+        os.utime(path, (record, record))
+    # read the oldest response
+    cache.get('TOKEN', {'records[0]': '0'})
+
+    size = os.path.getsize(path)
+    assert cache.evict(size * 2) == 1
+    assert cache.get('TOKEN', {'records[0]': '1'}) is None
+    assert cache.get('TOKEN', {'records[0]': '0'}) is not None
+    assert cache.get('TOKEN', {'records[0]': '2'}) is not None
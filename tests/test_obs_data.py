@@ -1,7 +1,17 @@
 """Tests for obs_data module"""
 
+import gzip
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import http.server
+import urllib.parse
 import obs_data
+import obs_storage
+import obs_cache
 import pandas as pd
+import requests
 import numpy as np
 import pytest
 
@@ -279,3 +289,775 @@ def test_access_exclude(
         excl_neonatal_death = excl_neonatal_death_bool
     )
     assert(set(actual) == set(expected_access_exclude))
+    assert actual.dtype == 'int64'
+    assert actual.tolist() == sorted(set(expected_access_exclude))
+
+
+@pytest.fixture
+def access_sqlite(tmp_path):
+    """Stand in for the Access database with a SQLite database"""
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'access.sqlite'))
+    cnxn = sqlite3.connect(backend.path, isolation_level=None)
+    pd.DataFrame(
+        {
+            'OBSEnrolmentID': ['OBS912-00001', 'OBS912-00002'],
+            'EDC': ['2020-01-01', '2020-02-01'],
+            'DIPLateEntry': [0, 0],
+            'DIPCurEnrol': [1, 1],
+            'Previous OBS participant': [0, 1],
+            'Unused': ['A', 'B'],
+        }
+    ).to_sql('OBS Enrolment Log', cnxn, index=False)
+    pd.DataFrame(
+        {
+            'ID': [1, 2, 3],
+            'OBSEnrolmentID': ['OBS912-00001', 'OBS912-00002', None],
+            'PatientID': ['1', '2', '3'],
+            'Unused': ['A', 'B', 'C'],
+        }
+    ).to_sql('OBSFollowupLog', cnxn, index=False)
+
+    yield backend, cnxn
+    cnxn.close()
+
+
+def test_access_data_columns(access_sqlite):
+    """Test obs_data.access_data column projection and stats"""
+    backend, _ = access_sqlite
+    stats = {}
+    actual = obs_data.access_data(
+        backend=backend,
+        columns={
+            'enrolment': ['OBSEnrolmentID', 'EDC'],
+            'followup': ['OBSEnrolmentID', 'PatientID'],
+        },
+        stats=stats
+    )
+
+    assert list(actual['enrolment'].columns) == ['obs_study_id', 'EDC']
+    assert list(actual['followup'].columns) == ['obs_study_id', 'PatientID']
+    assert actual['followup']['obs_study_id'].tolist() == [91200001, 91200002]
+    assert stats['enrolment']['rows'] == 2
+    assert stats['followup']['rows'] == 3
+    assert stats['followup']['bytes'] > 0
+
+
+def test_access_data_cache(access_sqlite, tmp_path):
+    """Test obs_data.access_data snapshots"""
+    backend, cnxn = access_sqlite
+    columns = {'followup': ['OBSEnrolmentID', 'PatientID']}
+
+    def read_followup(stats, refresh=False):
+        return obs_data.access_data(
+            backend=backend, enrolment=False, columns=columns, stats=stats,
+            cache_dir=str(tmp_path / 'cache'), refresh=refresh
+        )['followup']
+
+    stats = {}
+    expected = read_followup(stats)
+    assert not stats['followup']['cached']
+
+    actual = read_followup(stats)
+    assert stats['followup']['cached']
+    assert actual.equals(expected.reset_index(drop=True))
+
+    actual = read_followup(stats, refresh=True)
+    assert not stats['followup']['cached']
+
+    # changing the database makes the snapshot stale
+    cnxn.execute(
+        "INSERT INTO OBSFollowupLog (ID, OBSEnrolmentID, PatientID) "
+        "VALUES (4, 'OBS912-00004', '4')"
+    )
+    actual = read_followup(stats)
+    assert not stats['followup']['cached']
+    assert actual['obs_study_id'].tolist() == [91200001, 91200002, 91200004]
+
+
+def test_access_data_incremental(access_sqlite, tmp_path):
+    """Test obs_data.access_data delta reads of incremental tables"""
+    backend, cnxn = access_sqlite
+
+    def read_followup(stats, reconcile_days=7):
+        return obs_data.access_data(
+            backend=backend, enrolment=False,
+            columns={'followup': ['OBSEnrolmentID', 'PatientID']},
+            stats=stats, cache_dir=str(tmp_path / 'cache'),
+            incremental={'followup': 'ID'}, reconcile_days=reconcile_days
+        )['followup']
+
+    stats = {}
+    read_followup(stats)
+    assert not stats['followup']['delta']
+
+    cnxn.execute(
+        "INSERT INTO OBSFollowupLog (ID, OBSEnrolmentID, PatientID) "
+        "VALUES (4, 'OBS912-00004', '4')"
+    )
+    actual = read_followup(stats)
+    assert stats['followup']['delta']
+    assert stats['followup']['rows'] == 1
+    assert actual['obs_study_id'].tolist() == [91200001, 91200002, 91200004]
+    assert actual['ID'].tolist() == [1, 2, 4]
+
+    # snapshot is valid again until the database changes
+    actual = read_followup(stats)
+    assert stats['followup']['cached'] and not stats['followup']['delta']
+    assert actual['ID'].tolist() == [1, 2, 4]
+
+    # edits to existing rows are picked up by a full reconcile
+    cnxn.execute("UPDATE OBSFollowupLog SET PatientID = '22' WHERE ID = 2")
+    actual = read_followup(stats, reconcile_days=0)
+    assert not stats['followup']['cached']
+    assert actual['PatientID'].tolist() == ['1', '22', '4']
+
+
+def test_access_data_fingerprint(access_sqlite, tmp_path):
+    """Test obs_data.access_data snapshots validated per table"""
+    backend, cnxn = access_sqlite
+
+    def read_tables(stats, reconcile_days=7):
+        return obs_data.access_data(
+            backend=backend,
+            columns={
+                'enrolment': ['OBSEnrolmentID', 'EDC'],
+                'followup': ['OBSEnrolmentID', 'PatientID'],
+            },
+            stats=stats, cache_dir=str(tmp_path / 'cache'),
+            reconcile_days=reconcile_days,
+            fingerprint={'enrolment': 'OBSEnrolmentID', 'followup': 'ID'}
+        )
+
+    stats = {}
+    read_tables(stats)
+    assert not stats['enrolment']['cached']
+    assert not stats['followup']['cached']
+
+    # writing to the follow-up log leaves the enrolment snapshot valid
+    cnxn.execute(
+        "INSERT INTO OBSFollowupLog (ID, OBSEnrolmentID, PatientID) "
+        "VALUES (4, 'OBS912-00004', '4')"
+    )
+    actual = read_tables(stats)
+    assert stats['enrolment']['cached']
+    assert not stats['followup']['cached']
+    assert actual['followup']['obs_study_id'].tolist() == [
+        91200001, 91200002, 91200004
+    ]
+
+    actual = read_tables(stats)
+    assert stats['enrolment']['cached'] and stats['followup']['cached']
+
+    # edits that keep the fingerprint are picked up once the snapshot is old
+    cnxn.execute("UPDATE OBSFollowupLog SET PatientID = '22' WHERE ID = 2")
+    actual = read_tables(stats, reconcile_days=0)
+    assert not stats['followup']['cached']
+    assert actual['followup']['PatientID'].tolist() == ['1', '22', '4']
+
+
+def test_access_data_concurrent(access_sqlite):
+    """Test obs_data.access_data concurrent reads"""
+    backend, _ = access_sqlite
+    expected = obs_data.access_data(backend=backend)
+    stats = {}
+    actual = obs_data.access_data(
+        backend=backend, concurrent=True, stats=stats
+    )
+
+    assert list(actual) == ['enrolment', 'followup']
+    for key, table in expected.items():
+        assert actual[key].equals(table)
+        assert stats[key]['read_seconds'] >= 0
+        assert stats[key]['clean_seconds'] >= 0
+
+
+def test_access_data_session(access_sqlite):
+    """Test obs_data.access_data reads through a shared session"""
+    backend, _ = access_sqlite
+    expected = obs_data.access_data(backend=backend)
+    with obs_storage.Session(backend) as session:
+        actual = obs_data.access_data(backend=session)
+        obs_data.access_data(backend=session)
+
+    assert session.connect_count == 1
+    for key, table in expected.items():
+        assert actual[key].equals(table)
+
+    # concurrent reads do not leave a connection per pool thread open, but
+    # the session still counts them
+    with obs_storage.Session(backend) as session:
+        actual = obs_data.access_data(backend=session, concurrent=True)
+        assert session.connect_count == 1 + len(expected)
+        assert len(session._cnxns) == 1
+    for key, table in expected.items():
+        assert actual[key].equals(table)
+
+
+def test_access_data_chunksize(access_sqlite):
+    """Test obs_data.access_data streamed reads"""
+    backend, _ = access_sqlite
+    expected = obs_data.access_data(backend=backend)
+    stats = {}
+    actual = obs_data.access_data(
+        backend=backend, chunksize=1, stats=stats
+    )
+
+    for key, table in expected.items():
+        assert actual[key].reset_index(drop=True).equals(
+            table.reset_index(drop=True)
+        )
+    assert stats['followup']['rows'] == 3
+
+    with pytest.raises(obs_data.AccessTableTooLarge):
+        obs_data.access_data(backend=backend, chunksize=1, max_bytes=1)
+    # the uncleaned chunk being read counts toward the ceiling
+    cleaned = obs_data.access_data(backend=backend, enrolment=False)
+    with pytest.raises(obs_data.AccessTableTooLarge):
+        obs_data.access_data(
+            backend=backend, enrolment=False, chunksize=10,
+            max_bytes=int(cleaned['followup'].memory_usage(deep=True).sum())
+        )
+
+
+def test_ColumnBuffers():
+    """Test obs_data._ColumnBuffers against pandas.concat"""
+    chunks = [
+        pd.DataFrame({
+            'ID': [1, 2], 'obs_study_id': pd.array([1, None], dtype='Int64'),
+            'EDC': pd.to_datetime(['2020-01-01', '2020-02-01']),
+            'Unused': ['A', 'B'], 'NoUse': [True, False],
+        }),
+        pd.DataFrame({
+            'ID': [3.5], 'obs_study_id': pd.array([3], dtype='Int64'),
+            'EDC': pd.to_datetime(['2020-03-01']),
+            'Unused': [None], 'NoUse': [None],
+        }),
+        pd.DataFrame({
+            'ID': [4], 'obs_study_id': pd.array([4], dtype='Int64'),
+            'EDC': pd.to_datetime(['2020-04-01']),
+            'Unused': ['D'], 'NoUse': [False],
+        }, index=[7]),
+    ]
+
+    buffers = obs_data._ColumnBuffers()
+    for chunk in chunks:
+        buffers.append(chunk)
+    assert buffers.length == 4
+    actual = buffers.table()
+
+    expected = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_access_data_typed(access_sqlite):
+    """Test obs_data.access_data typed fetch path"""
+    backend, _ = access_sqlite
+    expected = obs_data.access_data(backend=backend)
+    for chunksize in [None, 1]:
+        actual = obs_data.access_data(
+            backend=backend, typed=True, chunksize=chunksize
+        )
+
+        assert actual['followup']['obs_study_id'].tolist() == (
+            expected['followup']['obs_study_id'].tolist()
+        )
+        assert actual['enrolment']['EDC'].dtype == 'datetime64[ns]'
+        assert actual['enrolment']['EDC'].tolist() == [
+            pd.Timestamp(2020, 1, 1), pd.Timestamp(2020, 2, 1)
+        ]
+        assert actual['enrolment']['DIPCurEnrol'].dtype == bool
+        assert actual['followup']['ID'].tolist() == [1, 2]
+
+
+def test_access_data_typed_cached(access_sqlite, tmp_path):
+    """Test obs_data.access_data typed fetches with snapshots, as in main"""
+    backend, cnxn = access_sqlite
+
+    def read_tables(stats):
+        return obs_data.access_data(
+            backend=backend,
+            columns={
+                'enrolment': ['OBSEnrolmentID', 'EDC', 'DIPCurEnrol'],
+                'followup': ['OBSEnrolmentID', 'PatientID'],
+            },
+            stats=stats, cache_dir=str(tmp_path / 'cache'),
+            incremental={'followup': 'ID'},
+            fingerprint={'enrolment': 'OBSEnrolmentID', 'followup': 'ID'},
+            chunksize=1, typed=True
+        )
+
+    stats = {}
+    expected = read_tables(stats)
+    cnxn.execute(
+        "INSERT INTO OBSFollowupLog (ID, OBSEnrolmentID, PatientID) "
+        "VALUES (4, 'OBS912-00004', '4')"
+    )
+    actual = read_tables(stats)
+
+    assert stats['enrolment']['cached'] and stats['followup']['delta']
+    assert actual['enrolment'].equals(expected['enrolment'])
+    assert actual['enrolment']['DIPCurEnrol'].dtype == bool
+    assert actual['followup']['obs_study_id'].tolist() == [
+        91200001, 91200002, 91200004
+    ]
+    assert actual['followup']['ID'].tolist() == [1, 2, 4]
+
+
+@pytest.fixture
+def redcap_server():
+    """Local keep-alive HTTP server standing in for the REDCap API"""
+    requests_received = []
+    # responder(form) returns the status and CSV body of a request; replaced
+    # by tests that need other exports
+    responder = [
+        lambda form: (
+            200,
+            b'obs_study_id,lifestyle_questionnaire_1_complete\n'
+            b'91200001,2\n'
+        )
+    ]
+
+    class RedcapHandler(http.server.BaseHTTPRequestHandler):
+        """Answer every POST with a gzipped CSV export"""
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers['Content-Length'])
+            form = urllib.parse.parse_qs(
+                self.rfile.read(length).decode('utf-8')
+            )
+            requests_received.append({
+                'form': form,
+                'accept_encoding': self.headers['Accept-Encoding'],
+            })
+            status, body = responder[0](form)
+            body = gzip.compress(body)
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RedcapHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield (
+        f'http://127.0.0.1:{server.server_port}/api/', requests_received,
+        responder
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def test_RedcapClient(redcap_server):
+    """Test obs_data.RedcapClient connection reuse through redcap_data"""
+    url, requests_received, _ = redcap_server
+    with obs_data.RedcapClient('TOKEN', url=url, timeout=5) as client:
+        for _ in range(3):
+            actual = obs_data.redcap_data(
+                client, {'fields[0]': 'obs_study_id'}
+            )
+
+        assert client.request_count == 3
+        assert client.connection_count == 1
+        assert client.reused_count == 2
+        assert client.bytes_received > 0
+
+    assert actual['obs_study_id'].tolist() == ['91200001']
+    assert requests_received[0]['form']['token'] == ['TOKEN']
+    assert requests_received[0]['form']['fields[0]'] == ['obs_study_id']
+    assert 'gzip' in requests_received[0]['accept_encoding']
+
+
+def test_redcap_client(redcap_server, monkeypatch):
+    """Test obs_data.redcap_client shares one client per token"""
+    url, _, _ = redcap_server
+    monkeypatch.setattr(obs_data, 'REDCAP_API_URL', url)
+    monkeypatch.setattr(obs_data, '_REDCAP_CLIENTS', {})
+
+    client = obs_data.redcap_client('TOKEN', timeout=5)
+    assert obs_data.redcap_client('TOKEN') is client
+    assert obs_data.redcap_client(client) is client
+    assert obs_data.redcap_client('OTHER') is not client
+    assert obs_data.redcap_clients()[0] is client
+
+    obs_data.redcap_lsq_summary('TOKEN', 1)
+    obs_data.redcap_lsq_summary('TOKEN', 1)
+    assert client.request_count == 2
+    assert client.connection_count == 1
+    for redcap_client in obs_data.redcap_clients():
+        redcap_client.close()
+
+
+def test_RedcapClient_cache(redcap_server, tmp_path):
+    """Test obs_data.RedcapClient with an obs_cache.ResponseCache"""
+    url, requests_received, _ = redcap_server
+    cache_dir = str(tmp_path / 'responses')
+    cache = obs_cache.ResponseCache(cache_dir)
+    params = {'fields[0]': 'obs_study_id'}
+    with obs_data.RedcapClient('TOKEN', url=url, cache=cache) as client:
+        expected = obs_data.redcap_data(client, params)
+        actual = obs_data.redcap_data(client, params)
+        assert client.request_count == 1
+        assert cache.hits == 1
+    assert actual.equals(expected)
+    assert len(requests_received) == 1
+
+    # offline runs never contact REDCap
+    cache = obs_cache.ResponseCache(cache_dir, mode='offline')
+    with obs_data.RedcapClient('TOKEN', url=url, cache=cache) as client:
+        assert obs_data.redcap_data(client, params).equals(expected)
+        with pytest.raises(LookupError):
+            obs_data.redcap_data(client, {'fields[0]': 'other'})
+        assert client.request_count == 0
+
+
+def test_redcap_lsq_summary_offline(redcap_server, tmp_path):
+    """Test obs_data.redcap_lsq_summary returns the view when offline"""
+    url, requests_received, _ = redcap_server
+    view_dir = str(tmp_path / 'redcap')
+    cache = obs_cache.ResponseCache(str(tmp_path / 'responses'))
+    with obs_data.RedcapClient('TOKEN', url=url, cache=cache) as client:
+        expected = obs_data.redcap_lsq_summary(client, 1, cache_dir=view_dir)
+
+    cache = obs_cache.ResponseCache(str(tmp_path / 'responses'), 'offline')
+    with obs_data.RedcapClient('TOKEN', url=url, cache=cache) as client:
+        stats = {}
+        actual = obs_data.redcap_lsq_summary(
+            client, 1, cache_dir=view_dir, stats=stats
+        )
+    assert actual.equals(expected)
+    assert not stats['full']
+    assert len(requests_received) == 1
+
+
+def test_redcap_lsq_summary_stats(redcap_server):
+    """Test obs_data.redcap_lsq_summary stats without a cached view"""
+    url, _, _ = redcap_server
+    stats = {}
+    with obs_data.RedcapClient('TOKEN', url=url) as client:
+        lsq_summary = obs_data.redcap_lsq_summary(client, 1, stats=stats)
+    obs_data.lsq_complete(lsq_summary, stats=stats)
+
+    assert stats['full']
+    assert stats['rows'] == 1
+    assert stats['rows_kept'] == 1
+
+
+def test_redcap_chunks(redcap_server):
+    """Test obs_data.redcap_chunks streaming export with type hints"""
+    url, _, responder = redcap_server
+    export = (
+        b'obs_study_id,lifestyle_questionnaire_1_timestamp,'
+        b'lifestyle_questionnaire_1_complete,lwk_funny\r\n'
+        + b''.join(
+            f'912{obs_id:05},2020-02-01 10:00:00,2,1\r\n'.encode('utf-8')
+            for obs_id in range(1, 6)
+        )
+        + b'91200006,[not completed],0,\r\n'
+    )
+    responder[0] = lambda form: (200, export)
+
+    stats = {}
+    with obs_data.RedcapClient('TOKEN', url=url) as client:
+        chunks = list(
+            obs_data.redcap_chunks(
+                client, chunksize=4, stats=stats,
+                dtype=obs_data.REDCAP_DTYPES
+            )
+        )
+        assert client.bytes_received == len(export)
+    assert [len(chunk.index) for chunk in chunks] == [4, 2]
+    assert stats == {'bytes': len(export), 'rows': 6}
+
+    actual = pd.concat(chunks, ignore_index=True)
+    assert str(actual['obs_study_id'].dtype) == 'Int64'
+    assert actual['obs_study_id'].tolist()[-1] == 91200006
+    assert actual['lifestyle_questionnaire_1_complete'].dtype == 'category'
+    missing = [False] * 5 + [True]
+    assert actual['lifestyle_questionnaire_1_timestamp'].isna().tolist() == (
+        missing
+    )
+    assert actual['lwk_funny'].isna().tolist() == missing
+
+    # default str columns, and typed columns of an empty export
+    with obs_data.RedcapClient('TOKEN', url=url) as client:
+        actual = obs_data.redcap_data(client)
+        assert actual['obs_study_id'].tolist()[0] == '91200001'
+        responder[0] = lambda form: (200, b'\n')
+        actual = obs_data.redcap_data(
+            client, {'fields[0]': 'obs_study_id'},
+            dtype=obs_data.REDCAP_DTYPES
+        )
+    assert actual.columns.tolist() == ['obs_study_id']
+    assert str(actual['obs_study_id'].dtype) == 'Int64'
+
+
+def test_redcap_data_json(redcap_server):
+    """Test obs_data.redcap_data JSON exports match CSV exports"""
+    url, requests_received, responder = redcap_server
+    exports = {
+        'csv': (
+            b'obs_study_id,lifestyle_questionnaire_1_complete,lwk_funny\n'
+            b'91200001,2,1\n'
+            b'91200002,0,\n'
+        ),
+        'json': (
+            b'[{"obs_study_id":"91200001",'
+            b'"lifestyle_questionnaire_1_complete":"2","lwk_funny":"1"},'
+            b'{"obs_study_id":"91200002",'
+            b'"lifestyle_questionnaire_1_complete":"0","lwk_funny":""}]'
+        ),
+    }
+    responder[0] = lambda form: (200, exports[form['format'][0]])
+
+    with obs_data.RedcapClient('TOKEN', url=url) as client:
+        for dtype in [str, obs_data.REDCAP_DTYPES]:
+            expected = obs_data.redcap_data(client, dtype=dtype)
+            client.export_format = 'json'
+            actual = obs_data.redcap_data(client, dtype=dtype)
+            client.export_format = 'csv'
+            pd.testing.assert_frame_equal(actual, expected)
+        assert requests_received[-1]['form']['format'] == ['json']
+
+        responder[0] = lambda form: (200, b'[]')
+        actual = obs_data.redcap_data(
+            client, {'format': 'json', 'fields[0]': 'obs_study_id'}
+        )
+        assert actual.columns.tolist() == ['obs_study_id']
+        assert len(actual.index) == 0
+
+        with pytest.raises(ValueError):
+            obs_data.redcap_data(client, {'format': 'xml'})
+
+
+def test_redcap_clinic(redcap_server):
+    """Test obs_data.redcap_clinic batched export"""
+    url, requests_received, responder = redcap_server
+    obs_ids = [str(obs_id) for obs_id in range(1, 11)]
+
+    def clinic_export(form):
+        """Export of the requested records; over 3 records is too large"""
+        records = [
+            form[f'records[{i}]'][0]
+            for i in range(len(form))
+            if f'records[{i}]' in form
+        ]
+        if len(records) == 0:
+            return 200, ('obs_id\n' + '\n'.join(obs_ids)).encode('utf-8')
+        if len(records) > 3:
+            return 500, b'Exceeded memory limit'
+        return 200, (
+            'obs_id,clinic_visit\n'
+            + ''.join(f'{obs_id},visit_{obs_id}\n' for obs_id in records)
+        ).encode('utf-8')
+    responder[0] = clinic_export
+
+    stats = {}
+    with obs_data.RedcapClient('TOKEN', url=url, timeout=5) as client:
+        actual = obs_data.redcap_clinic(
+            client, batch_size=8, max_workers=3, stats=stats
+        )
+
+    assert actual['obs_id'].tolist() == obs_ids
+    # typed columns are opt-in (dtype=REDCAP_DTYPES)
+    assert (actual.dtypes == object).all()
+    assert actual['clinic_visit'].tolist() == [
+        f'visit_{obs_id}' for obs_id in obs_ids
+    ]
+    assert stats['records'] == 10
+    assert stats['splits'] > 0
+    assert stats['batch_size'] <= 3
+    assert stats['requests'] == len(requests_received)
+
+    responder[0] = lambda form: (403, b'Invalid token')
+    with pytest.raises(requests.HTTPError):
+        obs_data.redcap_clinic(obs_data.RedcapClient('BAD', url=url))
+
+
+def test_redcap_lsq_summary_incremental(redcap_server, tmp_path):
+    """Test obs_data.redcap_lsq_summary with a cached view"""
+    url, requests_received, responder = redcap_server
+    exports = [
+        b'obs_study_id,lifestyle_questionnaire_1_timestamp,'
+        b'lifestyle_questionnaire_1_complete\n'
+        b'91200001,,0\n'
+        b'91200002,,0\n',
+        # record modified since the first export
+        b'obs_study_id,lifestyle_questionnaire_1_timestamp,'
+        b'lifestyle_questionnaire_1_complete\n'
+        b'91200002,2020-02-01 10:00:00,2\n',
+        # nothing modified
+        b'\n',
+    ]
+    responder[0] = lambda form: (200, exports[len(requests_received) - 1])
+
+    cache_dir = str(tmp_path / 'redcap')
+    with obs_data.RedcapClient('TOKEN', url=url, timeout=5) as client:
+        stats = {}
+        actual = obs_data.redcap_lsq_summary(
+            client, 1, cache_dir=cache_dir, stats=stats
+        )
+        assert stats['full']
+        assert 'dateRangeBegin' not in requests_received[0]['form']
+
+        actual = obs_data.redcap_lsq_summary(
+            client, 1, cache_dir=cache_dir, stats=stats
+        )
+        assert not stats['full']
+        assert stats['rows'] == 1
+        assert stats['view_rows'] == 2
+        assert 'dateRangeBegin' in requests_received[1]['form']
+        assert actual['obs_study_id'].tolist() == ['91200001', '91200002']
+        assert actual['lifestyle_questionnaire_1_complete'].tolist() == [
+            '0', '2'
+        ]
+
+        expected = actual
+        actual = obs_data.redcap_lsq_summary(
+            client, 1, cache_dir=cache_dir, stats=stats
+        )
+        assert stats['rows'] == 0
+        assert actual.equals(expected)
+
+        # full export on demand
+        exports.append(exports[0])
+        obs_data.redcap_lsq_summary(
+            client, 1, cache_dir=cache_dir, refresh=True, stats=stats
+        )
+        assert stats['full']
+        assert 'dateRangeBegin' not in requests_received[3]['form']
+
+
+def test_redcap_filter():
+    """Test obs_data.redcap_filter"""
+    assert obs_data.redcap_filter() is None
+    assert obs_data.redcap_filter('lifestyle_questionnaire_1_complete') == (
+        '[lifestyle_questionnaire_1_complete] = "2"'
+    )
+    assert obs_data.redcap_filter(
+        'lifestyle_questionnaire_1_complete', ['91200001', '91200002']
+    ) == (
+        '[lifestyle_questionnaire_1_complete] = "2" and '
+        '([obs_study_id] = "91200001" or [obs_study_id] = "91200002")'
+    )
+
+
+def test_redcap_lsq_summary_filter(redcap_server):
+    """Test obs_data.redcap_lsq_summary filtered by REDCap"""
+    url, requests_received, responder = redcap_server
+    # nothing matches the filter
+    responder[0] = lambda form: (200, b'\n')
+
+    with obs_data.RedcapClient('TOKEN', url=url, timeout=5) as client:
+        actual = obs_data.redcap_lsq_summary(
+            client, 'lsq2', complete_only=True, obs_ids=['91200001']
+        )
+
+    assert requests_received[0]['form']['filterLogic'] == [
+        '[lifestyle_questionnaire_2_complete] = "2" and '
+        '([obs_study_id] = "91200001")'
+    ]
+    assert list(actual.columns) == [
+        'obs_study_id', 'lifestyle_questionnaire_2_timestamp',
+        'lifestyle_questionnaire_2_complete'
+    ]
+    stats = {}
+    assert len(obs_data.lsq_complete(actual, stats=stats).index) == 0
+    assert stats == {'rows_checked': 0, 'rows_kept': 0}
+
+    # no records to export: no request is sent
+    with obs_data.RedcapClient('TOKEN', url=url, timeout=5) as client:
+        actual = obs_data.redcap_lsq_summary(
+            client, 'lsq2', complete_only=True, obs_ids=[]
+        )
+    assert len(requests_received) == 1
+    assert len(actual.index) == 0
+    assert list(actual.columns) == [
+        'obs_study_id', 'lifestyle_questionnaire_2_timestamp',
+        'lifestyle_questionnaire_2_complete'
+    ]
+
+
+def test_RedcapFields():
+    """Test obs_data.RedcapFields checkbox and descriptive fields"""
+    metadata = pd.DataFrame({
+        'field_name': ['obs_study_id', 'lsq_intro', 'lsq_diet', 'lwk_funny'],
+        'form_name': ['enrolment'] + ['lifestyle_questionnaire_1'] * 3,
+        'field_type': ['text', 'descriptive', 'checkbox', 'radio'],
+    })
+    lsq1_fields = obs_data.RedcapFields(metadata)
+    assert lsq1_fields.forms['lifestyle_questionnaire_1'] == [
+        'lsq_intro', 'lsq_diet', 'lwk_funny'
+    ]
+    assert lsq1_fields.validate(
+        ['obs_study_id', 'lsq_diet___1', 'lwk_funny', 'obs_study_id']
+    ) == ['obs_study_id', 'lsq_diet___1', 'lwk_funny']
+    with pytest.raises(KeyError) as error:
+        lsq1_fields.validate(['lsq_intro', 'lwk_funny___1', 'lwk_harm'])
+    assert 'lsq_intro, lwk_funny___1, lwk_harm' in str(error.value)
+    with pytest.raises(KeyError):
+        lsq1_fields.completion('lifestyle_questionnaire_2')
+
+    # the OBS ID is requested even when it is not the record ID
+    metadata = pd.DataFrame({
+        'field_name': ['record_id', 'obs_study_id', 'lwk_funny'],
+        'form_name': ['enrolment'] * 2 + ['lifestyle_questionnaire_1'],
+        'field_type': ['text', 'text', 'radio'],
+    })
+    assert obs_data.RedcapFields(metadata).completion(
+        'lifestyle_questionnaire_1'
+    )[0] == 'obs_study_id'
+    with pytest.raises(KeyError, match='obs_study_id'):
+        obs_data.RedcapFields(metadata.iloc[[0, 2]]).completion(
+            'lifestyle_questionnaire_1'
+        )
+    with pytest.raises(KeyError):
+        obs_data.redcap_lsq_summary('TOKEN', 2, metadata=lsq1_fields)
+
+
+def test_RedcapPlanner(redcap_server):
+    """Test obs_data.RedcapPlanner combined single-flight export"""
+    url, requests_received, responder = redcap_server
+
+    def lsq2_export(form):
+        """Export of LSQ2 summary and EPDS fields"""
+        time.sleep(0.1)
+        return 200, (
+            b'obs_study_id,lifestyle_questionnaire_2_timestamp,'
+            b'lifestyle_questionnaire_2_complete,lwk_funny,lwk_harm\n'
+            b'91200001,2020-01-31 10:00:00,2,1,4\n'
+            b'91200002,2020-01-31 11:00:00,2,2,3\n'
+        )
+    responder[0] = lsq2_export
+
+    planner = obs_data.RedcapPlanner(complete_only=True)
+    planner.add('lsq2', ['obs_study_id', 'lwk_funny'])
+    planner.add('lsq2', ['obs_study_id', 'lwk_harm'])
+    with obs_data.RedcapClient('TOKEN', url=url, timeout=5) as client:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            summaries = list(executor.map(
+                lambda _: planner.export(client, 'lsq2'), range(3)
+            ))
+
+    assert planner.export_count == 1
+    assert len(requests_received) == 1
+    assert summaries[0] is summaries[2]
+    form = requests_received[0]['form']
+    assert [form[f'fields[{i}]'][0] for i in range(5)] == [
+        'obs_study_id', 'lifestyle_questionnaire_2_timestamp',
+        'lifestyle_questionnaire_2_complete', 'lwk_funny', 'lwk_harm'
+    ]
+    assert 'filterLogic' in form
+
+    actual = planner.frame('lsq2', ['obs_study_id', 'lwk_harm'], ['91200002'])
+    assert actual.to_dict('list') == {
+        'obs_study_id': ['91200002'], 'lwk_harm': ['3']
+    }
+    assert planner.request_count == 4
+    with pytest.raises(RuntimeError):
+        planner.add('lsq2', ['lwk_top'])
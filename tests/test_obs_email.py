@@ -1,12 +1,15 @@
 """Tests for obs_email module"""
 
 import datetime
+import sqlite3
 import pandas as pd
 import obs_email
 import pytest
 import numpy as np
 from _pytest.monkeypatch import monkeypatch
 import pyodbc
+import obs_storage
+import obs_journal
 
 def test_ObsParticipants_set_access_table():
     """Test obs_email.ObsParticipants.set_access_table"""
@@ -66,9 +69,11 @@ def test_ObsParticipants_set_access_table():
             'LMP': [
                 datetime.date(year=2019, month=3, day=27),
                 datetime.date(year=2018, month=3, day=27)
-            ]
+            ],
+            'obs_id': [91200001, 91200003]
         }
     )
+    assert actual.access_table['obs_id'].dtype == 'int64'
     for col_name in actual.access_table.columns.values.tolist():
         assert all(
             actual.access_table[col_name] == (
@@ -79,7 +84,10 @@ def test_ObsParticipants_set_access_table():
 def test_ObsParticipants_remove_exclusion_ids():
     """Test obs_email.ObsParticipants.remove_exclusion_ids"""
     actual_df = pd.DataFrame(# expected_access_table
-        {'obs_study_id': ['91200001', '91200002', '91200003', '91200004']}
+        {
+            'obs_study_id': ['91200001', '91200002', '91200003', '91200004'],
+            'obs_id': [91200001, 91200002, 91200003, 91200004]
+        }
     )
     obs_email.ObsParticipants.access_table = actual_df
     obs_email.ObsParticipants.id_enrol = list(actual_df['obs_study_id'])
@@ -87,7 +95,10 @@ def test_ObsParticipants_remove_exclusion_ids():
     obs_email.ObsParticipants.remove_exclusion_ids([91200002, 91200004])
 
     expected_df = pd.DataFrame(# expected_access_table
-        {'obs_study_id': ['91200001', '91200003']}
+        {
+            'obs_study_id': ['91200001', '91200003'],
+            'obs_id': [91200001, 91200003]
+        }
     )
 
     assert obs_email.ObsParticipants.id_excl == [91200002, 91200004]
@@ -95,6 +106,14 @@ def test_ObsParticipants_remove_exclusion_ids():
         obs_email.ObsParticipants.access_wo_excl.reset_index(drop=True)
     )
 
+    # sorted array, as returned by obs_data.access_exclude
+    obs_email.ObsParticipants.remove_exclusion_ids(
+        np.array([91200002, 91200004, 91200009])
+    )
+    assert expected_df.equals(
+        obs_email.ObsParticipants.access_wo_excl.reset_index(drop=True)
+    )
+
 def test_ObsParticipants_set_emails_link_pwd():
     """Test obs_email.ObsParticipants.set_emails_link_pwd"""
     obs_email.ObsParticipants.id_excl = [91200002]
@@ -267,7 +286,11 @@ def test_Lsq_init(
     actual_lsq_1 = obs_email.Lsq(lsq_num_2, redcap_lsq_2)
 
     assert actual_lsq_1.lsq_num == expected_lsq_num_2
-    assert actual_lsq_1.id_access_not_returned == expected_id_access_not_returned_2
+    assert isinstance(actual_lsq_1.id_access_not_returned, np.ndarray)
+    assert (
+        actual_lsq_1.id_access_not_returned.tolist()
+        == expected_id_access_not_returned_2
+    )
     for col_name in actual_lsq_1.redcap_lsq_comp.columns.values.tolist():
         assert all(
             actual_lsq_1.redcap_lsq_comp[col_name] == (
@@ -275,6 +298,30 @@ def test_Lsq_init(
             )
         )
 
+def test_ObsParticipants_find_access_not_returned():
+    """Test obs_email.ObsParticipants._find_access_not_returned"""
+    access_table = pd.DataFrame(
+        {
+            # 91200002 returned LSQ1 at a later follow-up entry
+            'obs_study_id': [
+                '91200001', '91200002', '91200002', '91200003', '91200001'
+            ],
+            'LSQ(1)Given': [True, True, False, False, True],
+            'LSQ(1)Returned': [False, False, True, False, False],
+            'LSQ(2)Given': [False, True, False, True, np.nan],
+            'LSQ(2)Returned': [False, False, False, np.nan, False],
+        }
+    )
+
+    actual = obs_email.ObsParticipants._find_access_not_returned(
+        access_table
+    )
+
+    assert set(actual) == {'1', '2'}
+    assert actual['1'].tolist() == ['91200001']
+    assert actual['2'].tolist() == ['91200002', '91200003']
+
+
 @pytest.fixture
 def ObsParticipants_template():
     """Create obs_email.ObsParticipants template
@@ -465,21 +512,22 @@ def test_Lsq_update_access_returned(
     class MockPyodbcCursor:
         """Class to monkeypatch pyodbc.connect.cursor"""
         @staticmethod
-        def execute(
-            statement, patient_id, obs_access_id, patient_first_name,
-            patient_surname, date_compl, bool_val
-        ):
-            """Method to monkeypatch pyodbc.connect.cursor.execute"""
-            sql_syntax = {
-                'statement': statement,
-                'patient_id': patient_id,
-                'obs_access_id': obs_access_id,
-                'patient_first_name': patient_first_name,
-                'patient_surname': patient_surname,
-                'date_compl': date_compl,
-                'bool_val': bool_val
-            }
-            actual_sql_commands.append(sql_syntax)
+        def executemany(statement, rows):
+            """Method to monkeypatch pyodbc.connect.cursor.executemany"""
+            for (
+                patient_id, obs_access_id, patient_first_name,
+                patient_surname, date_compl, bool_val
+            ) in rows:
+                sql_syntax = {
+                    'statement': statement,
+                    'patient_id': patient_id,
+                    'obs_access_id': obs_access_id,
+                    'patient_first_name': patient_first_name,
+                    'patient_surname': patient_surname,
+                    'date_compl': date_compl,
+                    'bool_val': bool_val
+                }
+                actual_sql_commands.append(sql_syntax)
 
     class MockPyodbc:
         """Class to monkeypatch pyodbc.connect"""
@@ -492,6 +540,10 @@ def test_Lsq_update_access_returned(
             """Method to monkeypatch pyodbc.connect.cursor.commit"""
             pass  # need to override commit to do nothing for testing
         @staticmethod
+        def rollback():
+            """Method to monkeypatch pyodbc.connect.rollback"""
+            pass  # need to override rollback to do nothing for testing
+        @staticmethod
         def close():
             """Method to monkeypatch pyodbc.connect.cursor.close"""
             pass  # need to override close to do nothing for testing
@@ -1528,21 +1580,22 @@ def test_Lsq_update_access_status(
     class MockPyodbcCursor:
         """Class to monkeypatch pyodbc.connect.cursor"""
         @staticmethod
-        def execute(
-            statement, patient_id, obs_access_id, patient_first_name,
-            patient_surname, date_compl, bool_val
-        ):
-            """Method to monkeypatch pyodbc.connect.cursor.execute"""
-            sql_syntax = {
-                'statement': statement,
-                'patient_id': patient_id,
-                'obs_access_id': obs_access_id,
-                'patient_first_name': patient_first_name,
-                'patient_surname': patient_surname,
-                'date_compl': date_compl,
-                'bool_val': bool_val
-            }
-            actual_sql_commands.append(sql_syntax)
+        def executemany(statement, rows):
+            """Method to monkeypatch pyodbc.connect.cursor.executemany"""
+            for (
+                patient_id, obs_access_id, patient_first_name,
+                patient_surname, date_compl, bool_val
+            ) in rows:
+                sql_syntax = {
+                    'statement': statement,
+                    'patient_id': patient_id,
+                    'obs_access_id': obs_access_id,
+                    'patient_first_name': patient_first_name,
+                    'patient_surname': patient_surname,
+                    'date_compl': date_compl,
+                    'bool_val': bool_val
+                }
+                actual_sql_commands.append(sql_syntax)
     class MockPyodbc:
         """Class to monkeypatch pyodbc.connect"""
         @staticmethod
@@ -1554,6 +1607,10 @@ def test_Lsq_update_access_status(
             """Method to monkeypatch pyodbc.connect.cursor.commit"""
             pass # need to override commit to do nothing for testing
         @staticmethod
+        def rollback():
+            """Method to monkeypatch pyodbc.connect.rollback"""
+            pass # need to override rollback to do nothing for testing
+        @staticmethod
         def close():
             """Method to monkeypatch pyodbc.connect.cursor.close"""
             pass # need to override close to do nothing for testing
@@ -1574,7 +1631,7 @@ def test_Lsq_update_access_status(
         @classmethod
         def today(cls):
             return cls(2020, 1, 31)
-    datetime.date = NewDate
+    monkeypatch.setattr(datetime, 'date', NewDate)
 
     lsq_1.access_patient_info = access_patient_info_6
     lsq_1.lsq_status = lsq_status_6
@@ -1584,3 +1641,133 @@ def test_Lsq_update_access_status(
     print(expected_sql_commands_6)
 
     assert actual_sql_commands == expected_sql_commands_6
+
+
+def test_Lsq_execute_sql_access_rollback(Lsq_template, tmp_path):
+    """Test obs_data.Lsq._execute_sql_access rolls back a failed batch"""
+    lsq_1, _, _ = Lsq_template
+
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    conn = backend.connect()
+    conn.execute(
+        'CREATE TABLE OBSFollowupLog (PatientID TEXT, OBSEnrolmentID TEXT, '
+        'PatientFirstName TEXT, PatientSurname TEXT, OBSVisitDate TEXT, '
+        '"LSQ(1)Returned" BOOLEAN, UNIQUE (OBSEnrolmentID, OBSVisitDate))'
+    )
+    conn.commit()
+    lsq_1.access_patient_info = {
+        '91200001': {
+            'PatientID': '1',
+            'PatientFirstName': 'FN1',
+            'PatientSurname': 'SN1'
+        },
+        '91200002': {
+            'PatientID': '2',
+            'PatientFirstName': 'FN2',
+            'PatientSurname': 'SN2'
+        }
+    }
+
+    ids_updating = pd.DataFrame(
+        {'obs_study_id': ['91200001'], 'date': ['2020-01-31']}
+    )
+    lsq_1._execute_sql_access(ids_updating, 'LSQ({})Returned', backend=backend)
+
+    # second row of the batch violates the unique constraint
+    ids_updating = pd.DataFrame(
+        {
+            'obs_study_id': ['91200002', '91200001'],
+            'date': ['2020-01-31', '2020-01-31']
+        }
+    )
+    with pytest.raises(sqlite3.IntegrityError):
+        lsq_1._execute_sql_access(
+            ids_updating, 'LSQ({})Returned', backend=backend
+        )
+
+    actual = conn.execute(
+        'SELECT OBSEnrolmentID, "LSQ(1)Returned" FROM OBSFollowupLog'
+    ).fetchall()
+    conn.close()
+    assert actual == [('912-00001', True)]
+
+
+def test_Lsq_send_lsq_emails_journal(Lsq_template, tmp_path, monkeypatch):
+    """Test obs_email.Lsq.send_lsq_emails journals subjects once emailed"""
+    lsq_1, _, _ = Lsq_template
+
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    journal = obs_journal.FollowupJournal(
+        str(tmp_path / 'journal.jsonl'), backend
+    )
+    lsq_1.access_patient_info = {
+        obs_id: {
+            'PatientID': obs_id[-1],
+            'PatientFirstName': 'FN' + obs_id[-1],
+            'PatientSurname': 'SN' + obs_id[-1]
+        }
+        for obs_id in ['91200001', '91200002']
+    }
+    lsq_1.emails_link_pwd_dict = {
+        obs_id: {
+            'E-mail': f'fake_email_{obs_id[-1]}@gmail.com',
+            'lsq1_website': 'https://redcap.link/lsq1',
+            'lsq1_password': 'lsq1pss'
+        }
+        for obs_id in ['91200001', '91200002']
+    }
+    lsq_1.lsq_status = {
+        'LSQ(1)Followup3': [],
+        'LSQ(1)Followup2': [],
+        'LSQ(1)Followup1': ['91200001'],
+        'LSQ(1)Given': ['91200002']
+    }
+
+    # the run stops after the second subject's link email
+    sent = []
+    def mock_send_email(email_address, lsq_link_subject, lsq_link_body):
+        if len(sent) == 3:
+            raise RuntimeError('Outlook is not responding')
+        sent.append(email_address)
+    monkeypatch.setattr(obs_email, 'send_email', mock_send_email)
+
+    with pytest.raises(RuntimeError):
+        lsq_1.send_lsq_emails(journal=journal)
+
+    actual = obs_journal.FollowupJournal(
+        str(tmp_path / 'journal.jsonl'), backend
+    ).pending()
+    assert len(actual) == 1
+    assert actual[0]['column'] == 'LSQ(1)Followup1'
+    assert actual[0]['row'][:4] == ['1', '912-00001', 'FN1', 'SN1']
+    assert actual[0]['row'][4] == datetime.date.today().strftime('%Y-%m-%d')
+
+
+def test_Lsq_update_access_status_journal(Lsq_template, tmp_path):
+    """Test obs_data.Lsq.update_access_status records updates in a journal"""
+    lsq_1, _, _ = Lsq_template
+
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    journal = obs_journal.FollowupJournal(
+        str(tmp_path / 'journal.jsonl'), backend
+    )
+    lsq_1.access_patient_info = {
+        '91200001': {
+            'PatientID': '1',
+            'PatientFirstName': 'FN1',
+            'PatientSurname': 'SN1'
+        }
+    }
+    lsq_1.lsq_status = {
+        'LSQ(1)Followup3': [],
+        'LSQ(1)Followup2': [],
+        'LSQ(1)Followup1': ['91200001'],
+        'LSQ(1)Given': []
+    }
+    # backend has no OBSFollowupLog; rows are only journalled
+    lsq_1.update_access_status(backend=backend, journal=journal)
+
+    actual = journal.pending()
+    assert len(actual) == 1
+    assert actual[0]['column'] == 'LSQ(1)Followup1'
+    assert actual[0]['row'][:4] == ['1', '912-00001', 'FN1', 'SN1']
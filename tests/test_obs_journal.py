@@ -0,0 +1,130 @@
+"""Tests for obs_journal module"""
+
+import shutil
+import pytest
+import obs_storage
+import obs_journal
+
+
+@pytest.fixture
+def followup_sqlite(tmp_path):
+    """Stand in for the Access database with a SQLite database"""
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    backend.create_tables(
+        {
+            'OBSFollowupLog': [
+                'PatientID', 'OBSEnrolmentID', 'PatientFirstName',
+                'PatientSurname', 'OBSVisitDate', 'LSQ(1)Given',
+                'LSQ(1)Followup1'
+            ]
+        },
+        schema={
+            'OBSVisitDate': 'datetime64[ns]',
+            'LSQ(1)Given': 'bool',
+            'LSQ(1)Followup1': 'bool',
+        }
+    )
+    return backend
+
+
+def read_followup(backend):
+    """OBSEnrolmentID, OBSVisitDate and LSQ(1) statuses of OBSFollowupLog"""
+    cnxn = backend.connect()
+    actual = cnxn.execute(
+        'SELECT OBSEnrolmentID, OBSVisitDate, [LSQ(1)Given], '
+        '[LSQ(1)Followup1] FROM OBSFollowupLog ORDER BY ID'
+    ).fetchall()
+    backend.release(cnxn)
+    return [
+        (obs_id, str(visit_date)[:10], given, followup1)
+        for obs_id, visit_date, given, followup1 in actual
+    ]
+
+
+rows_given = [
+    ('1', '912-00001', 'FN1', 'SN1', '2020-01-31', 1),
+    ('2', '912-00002', 'FN2', 'SN2', '2020-01-31', 1),
+]
+rows_followup1 = [
+    ('3', '912-00003', 'FN3', 'SN3', '2020-01-31', 1),
+]
+
+
+def test_FollowupJournal_flush(followup_sqlite, tmp_path):
+    """Test obs_journal.FollowupJournal.record and flush"""
+    path = str(tmp_path / 'journal' / 'journal.jsonl')
+    journal = obs_journal.FollowupJournal(
+        path, followup_sqlite, batch_size=2
+    )
+    journal.record('LSQ(1)Given', rows_given)
+    journal.record('LSQ(1)Followup1', rows_followup1)
+    assert read_followup(followup_sqlite) == []
+    assert len(journal.pending()) == 3
+
+    # unapplied writes are loaded from the journal file
+    journal = obs_journal.FollowupJournal(
+        path, followup_sqlite, batch_size=2
+    )
+    assert len(journal.pending()) == 3
+    assert journal.flush() == 3
+    assert journal.pending() == []
+    assert journal.applied_count == 3
+    assert read_followup(followup_sqlite) == [
+        ('912-00001', '2020-01-31', True, None),
+        ('912-00002', '2020-01-31', True, None),
+        ('912-00003', '2020-01-31', None, True),
+    ]
+
+    journal = obs_journal.FollowupJournal(path, followup_sqlite)
+    assert journal.pending() == []
+    assert journal.flush() == 0
+
+
+def test_FollowupJournal_replay(followup_sqlite, tmp_path):
+    """Test obs_journal.FollowupJournal replay is idempotent"""
+    path = str(tmp_path / 'journal.jsonl')
+    journal = obs_journal.FollowupJournal(path, followup_sqlite)
+    journal.record('LSQ(1)Given', rows_given)
+    journal.record('LSQ(1)Followup1', rows_followup1)
+
+    # crash after the rows were committed but before they were marked
+    shutil.copy(path, path + '.crash')
+    journal.flush()
+    shutil.copy(path + '.crash', path)
+    # journal line cut short by the crash
+    with open(path, 'a') as journal_file:
+        journal_file.write('{"write": {"id": "cut')
+
+    journal = obs_journal.FollowupJournal(path, followup_sqlite)
+    assert len(journal.pending()) == 3
+    assert journal.flush() == 0
+    assert journal.skipped_count == 3
+    assert len(read_followup(followup_sqlite)) == 3
+
+
+def test_FollowupJournal_background(followup_sqlite, tmp_path):
+    """Test obs_journal.FollowupJournal background flusher"""
+    journal = obs_journal.FollowupJournal(
+        str(tmp_path / 'journal.jsonl'), followup_sqlite, flush_interval=60
+    )
+    journal.start()
+    journal.record('LSQ(1)Given', rows_given)
+    journal.stop()
+
+    assert journal.pending() == []
+    assert len(read_followup(followup_sqlite)) == 2
+
+
+def test_FollowupJournal_background_error(tmp_path):
+    """Test obs_journal.FollowupJournal keeps writes that fail to apply"""
+    # database without OBSFollowupLog
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    path = str(tmp_path / 'journal.jsonl')
+    journal = obs_journal.FollowupJournal(path, backend, flush_interval=60)
+    journal.start()
+    journal.record('LSQ(1)Given', rows_given)
+    with pytest.raises(Exception):
+        journal.stop()
+
+    journal = obs_journal.FollowupJournal(path, backend)
+    assert len(journal.pending()) == 2
@@ -70,3 +70,70 @@ def test_Lsq3Epds_init(monkeypatch):
 
     assert all(actual.redcap_lsq3['obs_study_id'] == ['10100001', '10100003'])
     assert actual.fu_ids == [['10100001', 30, 'Yes, quite often']]
+
+
+def test_Lsq2Epds_init_prefetched(monkeypatch):
+    """Test obs_lsq_epds.Lsq2Epds.__init__ with downloaded EPDS data"""
+    def mock_redcap_data(*args, **kwargs):
+        """REDCap must not be called"""
+        raise AssertionError('redcap_data called')
+    monkeypatch.setattr(obs_data, 'redcap_data', mock_redcap_data)
+
+    redcap_lsq2 = pd.DataFrame(
+        {
+            'obs_study_id': ['10100001'],
+            'lwk_funny': ['4'],
+            'lwk_lookfo': ['4'],
+            'lwk_blame': ['2'],
+            'lwk_anxio': ['4'],
+            'lwk_scare': ['1'],
+            'lwk_top': ['1'],
+            'lwk_sleep': ['1'],
+            'lwk_miser': ['2'],
+            'lwk_cryin': ['1'],
+            'lwk_harm': ['1']
+        }
+    )
+    actual = obs_lsq_epds.Lsq2Epds(
+        obs_ids = ['10100001'],
+        api_param = None,
+        cut_off = 10,
+        redcap_lsq2 = redcap_lsq2
+    )
+
+    assert actual.fu_ids == [['10100001', 30, 'Yes, quite often']]
+
+
+def test_Lsq3Epds_init_records(monkeypatch):
+    """Test obs_lsq_epds.Lsq3Epds.__init__ only downloads obs_ids"""
+    requested = []
+
+    def mock_redcap_data(api_param, add_param=None, stats=None):
+        """Record the request; return no subjects"""
+        requested.append(add_param)
+        return pd.DataFrame(
+            columns=[
+                value for name, value in add_param.items()
+                if name.startswith('fields[')
+            ],
+            dtype=str
+        )
+    monkeypatch.setattr(obs_data, 'redcap_data', mock_redcap_data)
+
+    actual = obs_lsq_epds.Lsq3Epds(
+        obs_ids = ['10100001', '10100002'],
+        api_param = None,
+        cut_off = 10
+    )
+    assert actual.fu_ids == []
+    assert requested[0]['records[0]'] == '10100001'
+    assert requested[0]['records[1]'] == '10100002'
+
+    # no subjects, no request
+    actual = obs_lsq_epds.Lsq3Epds(
+        obs_ids = [],
+        api_param = None,
+        cut_off = 10
+    )
+    assert actual.fu_ids == []
+    assert len(requested) == 1
@@ -0,0 +1,192 @@
+"""Tests for obs_redcap_server module"""
+
+import time
+import pandas as pd
+import pytest
+import requests
+import obs_data
+import obs_lsq_epds
+import obs_redcap_server
+
+
+@pytest.fixture
+def lsq2_project():
+    """Fixture LSQ2 project: two completed records and one incomplete"""
+    project = pd.DataFrame(
+        {
+            'obs_study_id': ['91200001', '91200002', '91200003'],
+            'lifestyle_questionnaire_2_timestamp': [
+                '2020-01-31 10:00:00', '2020-02-01 10:00:00',
+                '[not completed]'
+            ],
+            'lifestyle_questionnaire_2_complete': ['2', '2', '0'],
+            obs_redcap_server.MODIFIED_COL: ['2020-02-01 10:00:00'] * 3,
+        }
+    )
+    for field in obs_lsq_epds.Lsq2Epds.epds_fields[1:]:
+        project[field] = ['4', '1', '']
+    return project
+
+
+def test_RedcapServer_lsq_summary(lsq2_project):
+    """Test obs_redcap_server.RedcapServer fields[] and filterLogic"""
+    with obs_redcap_server.RedcapServer({'TOKEN': lsq2_project}) as server:
+        with obs_data.RedcapClient('TOKEN', url=server.url) as client:
+            actual = obs_data.redcap_lsq_summary(client, 2)
+            assert actual['obs_study_id'].tolist() == [
+                '91200001', '91200002', '91200003'
+            ]
+            assert actual.columns.tolist() == [
+                'obs_study_id', 'lifestyle_questionnaire_2_timestamp',
+                'lifestyle_questionnaire_2_complete'
+            ]
+
+            actual = obs_data.redcap_lsq_summary(
+                client, 2, complete_only=True, obs_ids=['91200002', '91200003']
+            )
+            assert actual['obs_study_id'].tolist() == ['91200002']
+
+            client.export_format = 'json'
+            actual = obs_data.redcap_lsq_summary(client, 2, complete_only=True)
+            assert actual['obs_study_id'].tolist() == ['91200001', '91200002']
+
+            with pytest.raises(requests.HTTPError):
+                obs_data.redcap_data(client, {'fields[0]': 'unknown'})
+        with obs_data.RedcapClient('OTHER', url=server.url) as client:
+            with pytest.raises(requests.HTTPError):
+                obs_data.redcap_data(client)
+
+
+def test_RedcapServer_records(lsq2_project):
+    """Test obs_redcap_server.RedcapServer records[] through Lsq2Epds"""
+    with obs_redcap_server.RedcapServer({'TOKEN': lsq2_project}) as server:
+        client = obs_data.RedcapClient('TOKEN', url=server.url)
+        actual = obs_lsq_epds.Lsq2Epds.redcap_epds(
+            client, obs_ids=['91200001', '91200003']
+        )
+        client.close()
+
+    assert actual['obs_study_id'].tolist() == ['91200001', '91200003']
+    assert actual['lwk_funny'].tolist()[0] == '4'
+    assert actual['lwk_funny'].isna().tolist() == [False, True]
+
+
+def test_RedcapServer_date_range(lsq2_project, tmp_path):
+    """Test obs_redcap_server.RedcapServer dateRangeBegin"""
+    cache_dir = str(tmp_path / 'redcap')
+    with obs_redcap_server.RedcapServer({'TOKEN': lsq2_project}) as server:
+        with obs_data.RedcapClient('TOKEN', url=server.url) as client:
+            obs_data.redcap_lsq_summary(client, 2, cache_dir=cache_dir)
+            server.update('TOKEN', pd.DataFrame({
+                'obs_study_id': ['91200003'],
+                'lifestyle_questionnaire_2_timestamp': ['2020-02-07 10:00:00'],
+                'lifestyle_questionnaire_2_complete': ['2'],
+            }))
+
+            stats = {}
+            actual = obs_data.redcap_lsq_summary(
+                client, 2, cache_dir=cache_dir, stats=stats
+            )
+
+    assert not stats['full']
+    assert stats['rows'] == 1
+    assert actual['lifestyle_questionnaire_2_complete'].tolist() == [
+        '2', '2', '2'
+    ]
+
+
+def test_RedcapServer_injection(lsq2_project):
+    """Test obs_redcap_server.RedcapServer latency, errors and throttling"""
+    params = {'fields[0]': 'obs_study_id'}
+    with obs_redcap_server.RedcapServer(
+        {'TOKEN': lsq2_project}, latency=0.1
+    ) as server:
+        with obs_data.RedcapClient('TOKEN', url=server.url) as client:
+            start = time.perf_counter()
+            obs_data.redcap_data(client, params)
+            assert time.perf_counter() - start >= 0.1
+
+    with obs_redcap_server.RedcapServer(
+        {'TOKEN': lsq2_project}, error_rate=1, error_status=503
+    ) as server:
+        with obs_data.RedcapClient('TOKEN', url=server.url) as client:
+            with pytest.raises(requests.HTTPError) as error:
+                obs_data.redcap_data(client, params)
+    assert error.value.response.status_code == 503
+    assert server.error_count == 1
+
+    with obs_redcap_server.RedcapServer(
+        {'TOKEN': lsq2_project}, max_rate=2
+    ) as server:
+        with obs_data.RedcapClient('TOKEN', url=server.url) as client:
+            statuses = []
+            for _ in range(4):
+                try:
+                    obs_data.redcap_data(client, params)
+                    statuses.append(200)
+                except requests.HTTPError as error:
+                    statuses.append(error.response.status_code)
+    assert statuses[:2] == [200, 200]
+    assert 429 in statuses[2:]
+    assert server.throttled_count == statuses.count(429)
+
+
+def test_RedcapServer_metadata(lsq2_project, tmp_path):
+    """Test obs_redcap_server.RedcapServer data dictionary and RedcapFields"""
+    cache_dir = str(tmp_path / 'redcap')
+    with obs_redcap_server.RedcapServer({'TOKEN': lsq2_project}) as server:
+        with obs_data.RedcapClient('TOKEN', url=server.url) as client:
+            stats = {}
+            metadata = obs_data.redcap_metadata(
+                client, cache_dir=cache_dir, stats=stats
+            )
+            assert stats == {'cached': False, 'changed': True}
+            obs_data.redcap_metadata(client, cache_dir=cache_dir, stats=stats)
+            assert stats == {'cached': True, 'changed': False}
+            obs_data.redcap_metadata(
+                client, cache_dir=cache_dir, refresh=True, stats=stats
+            )
+            assert stats == {'cached': False, 'changed': False}
+            assert server.request_count == 2
+
+            lsq2_fields = obs_data.RedcapFields(metadata)
+            planner = obs_data.RedcapPlanner(metadata={'lsq2': lsq2_fields})
+            planner.add('lsq2', obs_lsq_epds.Lsq2Epds.epds_fields)
+            with pytest.raises(KeyError, match='lwk_unknown'):
+                planner.add('lsq2', ['lwk_unknown'])
+            actual = planner.export(client, 'lsq2')
+
+    assert lsq2_fields.record_id == 'obs_study_id'
+    assert lsq2_fields.completion('lifestyle_questionnaire_2') == [
+        'obs_study_id', 'lifestyle_questionnaire_2_timestamp',
+        'lifestyle_questionnaire_2_complete'
+    ]
+    assert actual.columns.tolist() == list(dict.fromkeys(
+        lsq2_fields.completion('lifestyle_questionnaire_2')
+        + obs_lsq_epds.Lsq2Epds.epds_fields
+    ))
+    assert server.request_count == 3
+
+
+def test_RedcapPlanner_metadata_param(lsq2_project, tmp_path):
+    """Test obs_data.RedcapPlanner exporting data dictionaries itself"""
+    metadata_param = {'cache_dir': str(tmp_path / 'redcap')}
+    with obs_redcap_server.RedcapServer({'TOKEN': lsq2_project}) as server:
+        with obs_data.RedcapClient('TOKEN', url=server.url) as client:
+            # unknown fields are reported before the records are exported
+            planner = obs_data.RedcapPlanner(metadata_param=metadata_param)
+            planner.add('lsq2', ['lwk_unknown'])
+            with pytest.raises(KeyError, match='lwk_unknown'):
+                planner.export(client, 'lsq2')
+            assert server.request_count == 1
+
+            planner = obs_data.RedcapPlanner(metadata_param=metadata_param)
+            planner.add('lsq2', obs_lsq_epds.Lsq2Epds.epds_fields)
+            actual = planner.export(client, 'lsq2')
+            # the data dictionary was cached by the first planner
+            assert server.request_count == 2
+
+    assert planner.metadata['lsq2'].record_id == 'obs_study_id'
+    assert actual.columns.tolist()[3:] == (
+        obs_lsq_epds.Lsq2Epds.epds_fields[1:]
+    )
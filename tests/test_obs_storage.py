@@ -0,0 +1,109 @@
+"""Tests for obs_storage module"""
+
+import datetime
+import sqlite3
+import threading
+import pytest
+import obs_storage
+
+
+def test_get_backend():
+    """Test obs_storage.get_backend"""
+    assert isinstance(
+        obs_storage.get_backend('access', 'fake_testing_path'),
+        obs_storage.AccessBackend
+    )
+    assert isinstance(
+        obs_storage.get_backend('sqlite', 'fake_testing_path'),
+        obs_storage.SqliteBackend
+    )
+    with pytest.raises(ValueError):
+        obs_storage.get_backend('duckdb', 'fake_testing_path')
+
+
+def test_SqliteBackend_create_tables(tmp_path):
+    """Test obs_storage.SqliteBackend.create_tables"""
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    backend.create_tables(
+        {'OBSFollowupLog': ['OBSEnrolmentID', 'OBSVisitDate', 'LSQ(1)Given']},
+        schema={'OBSVisitDate': 'datetime64[ns]', 'LSQ(1)Given': 'bool'}
+    )
+
+    cnxn = backend.connect()
+    cursor = cnxn.cursor()
+    cursor.execute(
+        'INSERT INTO OBSFollowupLog (OBSEnrolmentID, OBSVisitDate, '
+        '"LSQ(1)Given") VALUES (?, ?, ?)',
+        ('912-00001', '2020-01-31', 1)
+    )
+    cnxn.commit()
+    cursor.execute('Select * From [OBSFollowupLog]')
+    actual = cursor.fetchall()
+    backend.release(cnxn)
+
+    assert actual == [
+        (1, '912-00001', datetime.datetime(2020, 1, 31), True)
+    ]
+
+    # other SQLite connections are left alone
+    cnxn = sqlite3.connect(
+        backend.path, detect_types=sqlite3.PARSE_DECLTYPES
+    )
+    actual = cnxn.execute('Select * From [OBSFollowupLog]').fetchall()
+    cnxn.close()
+    assert actual == [(1, '912-00001', '2020-01-31', 1)]
+
+
+def test_StorageBackend_abstract():
+    """Test obs_storage.StorageBackend requires connect"""
+    with pytest.raises(TypeError):
+        obs_storage.StorageBackend('fake_testing_path')
+
+
+def test_Session(tmp_path):
+    """Test obs_storage.Session connection reuse and close"""
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    with obs_storage.Session(backend) as session:
+        assert session.path == backend.path
+        cnxn = session.connect()
+        session.release(cnxn)
+        assert session.connect() is cnxn
+        cnxn.execute('Select 1')
+        assert session.connect_count == 1
+
+        thread_cnxns = []
+        thread = threading.Thread(
+            target=lambda: thread_cnxns.append(session.connect())
+        )
+        thread.start()
+        thread.join()
+        assert thread_cnxns[0] is not cnxn
+        assert session.connect_count == 2
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        cnxn.execute('Select 1')
+    with pytest.raises(RuntimeError):
+        session.connect()
+
+    session.open()
+    assert session.connect() is not cnxn
+    assert session.connect_count == 3
+    session.close()
+
+
+def test_Session_unshared(tmp_path):
+    """Test obs_storage.Session.unshared short-lived connections"""
+    backend = obs_storage.SqliteBackend(str(tmp_path / 'obs.sqlite'))
+    with obs_storage.Session(backend) as session:
+        unshared = session.unshared()
+        cnxn = unshared.connect()
+        assert cnxn is not session.connect()
+        assert session.connect_count == 2
+        unshared.release(cnxn)
+        with pytest.raises(sqlite3.ProgrammingError):
+            cnxn.execute('Select 1')
+        assert unshared.connect() is not cnxn
+        assert session.connect_count == 3
+
+    with pytest.raises(RuntimeError):
+        unshared.connect()
@@ -0,0 +1,206 @@
+"""Tests for obs_throttle module"""
+
+import time
+import threading
+import pandas as pd
+import pytest
+import requests
+import obs_data
+import obs_redcap_server
+import obs_throttle
+
+
+def http_error(status, headers=None):
+    """requests.HTTPError of a response with a status"""
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f'{status} Error', response=response)
+
+
+def test_AimdLimiter():
+    """Test obs_throttle.AimdLimiter additive increase and cut per round"""
+    limiter = obs_throttle.AimdLimiter(limit=4, max_limit=5)
+    with limiter.slot() as started:
+        limiter.on_success(started, 0.1)
+    assert limiter.limit == pytest.approx(4.25)
+
+    # overload signals of the same round trip cut the limit once
+    with limiter.slot() as first, limiter.slot() as second:
+        limiter.on_overload(first)
+        limiter.on_overload(second)
+    assert limiter.limit == pytest.approx(2.125)
+    assert limiter.decrease_count == 1
+
+    with limiter.slot() as started:
+        limiter.on_overload(started)
+    assert limiter.limit == pytest.approx(1.0625)
+    with limiter.slot() as started:
+        limiter.on_overload(started)
+    assert limiter.limit == 1
+
+    for _ in range(100):
+        with limiter.slot() as started:
+            limiter.on_success(started, 0.1)
+    assert limiter.limit == 5
+
+    limiter.latency_target = 1
+    with limiter.slot() as started:
+        limiter.on_success(started, 2)
+    assert limiter.limit == 2.5
+
+
+def test_AimdLimiter_slot():
+    """Test obs_throttle.AimdLimiter limits the requests in flight"""
+    limiter = obs_throttle.AimdLimiter(limit=2)
+    peak = [0]
+
+    def request():
+        with limiter.slot():
+            peak[0] = max(peak[0], limiter.in_flight)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert limiter.in_flight == 0
+
+
+def test_LatencyStats():
+    """Test obs_throttle.LatencyStats.percentiles"""
+    latencies = obs_throttle.LatencyStats(size=100)
+    assert latencies.percentiles() == {}
+    for latency in range(1, 201):
+        latencies.record(latency / 100)
+
+    assert latencies.count == 200
+    actual = latencies.percentiles((0, 50, 100))
+    assert actual[0] == 1.01
+    assert actual[50] == pytest.approx(1.505)
+    assert actual[100] == 2
+
+
+def test_Throttle_retries():
+    """Test obs_throttle.Throttle retries retryable errors only"""
+    throttle = obs_throttle.Throttle(retries=2, backoff=0.01, seed=0)
+    errors = [http_error(503), http_error(429)]
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return 'response'
+
+    assert throttle.send(request) == 'response'
+    assert throttle.retry_count == 2
+    assert throttle.limiter.decrease_count == 2
+
+    errors = [http_error(500)]
+    with pytest.raises(requests.HTTPError):
+        throttle.send(request)
+    errors = [http_error(503)] * 3
+    with pytest.raises(requests.HTTPError):
+        throttle.send(request)
+    assert throttle.retry_count == 4
+
+
+def test_Throttle_backoff_delay():
+    """Test obs_throttle.Throttle exponential backoff and Retry-After"""
+    throttle = obs_throttle.Throttle(backoff=1, max_backoff=5, seed=0)
+    for attempt in range(5):
+        assert 0 <= throttle.backoff_delay(attempt) <= min(5, 2 ** attempt)
+    assert throttle.backoff_delay(
+        0, http_error(429, {'Retry-After': '3'})
+    ) >= 3
+
+
+def test_Throttle_hedge():
+    """Test obs_throttle.Throttle hedges requests slower than hedge_after"""
+    throttle = obs_throttle.Throttle(hedge_after=0.05)
+    # the first request only answers once released, so send can only
+    # return 0 if the hedge answered first
+    released = threading.Event()
+    closed = threading.Event()
+
+    class StalledResponse():
+        def close(self):
+            closed.set()
+
+    def stalled():
+        released.wait(timeout=5)
+        return StalledResponse()
+
+    requests_sent = [stalled, lambda: 0]
+
+    def request():
+        return requests_sent.pop(0)()
+
+    assert throttle.send(request) == 0
+    assert throttle.hedge_count == 1
+    assert throttle.hedge_win_count == 1
+    # the losing response is closed once it arrives
+    assert not closed.is_set()
+    released.set()
+    assert closed.wait(timeout=5)
+
+    def request():
+        delay = delays.pop(0)
+        time.sleep(delay)
+        return delay
+
+    # not hedged: not idempotent, or answered in time
+    delays = [0.1]
+    assert throttle.send(request, idempotent=False) == 0.1
+    delays = [0]
+    assert throttle.send(request) == 0
+    assert throttle.hedge_count == 1
+    throttle.close()
+
+    throttle = obs_throttle.Throttle(hedge_after='p95')
+    assert throttle.hedge_delay() is None
+    for latency in range(20):
+        throttle.latencies.record(latency)
+    assert throttle.hedge_delay() == pytest.approx(18.05)
+
+
+def test_Throttle_redcap_server():
+    """Test obs_throttle.Throttle with obs_data.RedcapClient"""
+    project = pd.DataFrame({'obs_study_id': ['91200001', '91200002']})
+    throttle = obs_throttle.Throttle(retries=5, backoff=0.01, seed=0)
+    with obs_redcap_server.RedcapServer(
+        {'TOKEN': project}, error_rate=0.3, error_status=503, seed=1
+    ) as server:
+        with obs_data.RedcapClient(
+            'TOKEN', url=server.url, throttle=throttle
+        ) as client:
+            for _ in range(10):
+                actual = obs_data.redcap_data(client)
+                assert actual['obs_study_id'].tolist() == [
+                    '91200001', '91200002'
+                ]
+            assert client.latencies.count == 10
+            assert set(client.latencies.percentiles()) == {50, 95, 99}
+
+    assert server.error_count > 0
+    assert throttle.retry_count == server.error_count
+
+
+def test_Throttle_hedge_redcap_server():
+    """Test obs_throttle.Throttle hedges slow REDCap exports"""
+    project = pd.DataFrame({'obs_study_id': ['91200001', '91200002']})
+    throttle = obs_throttle.Throttle(hedge_after=0.2)
+    with obs_redcap_server.RedcapServer(
+        {'TOKEN': project}, jitter=1, seed=0
+    ) as server:
+        with obs_data.RedcapClient(
+            'TOKEN', url=server.url, throttle=throttle
+        ) as client:
+            for _ in range(5):
+                actual = obs_data.redcap_data(client)
+                assert len(actual.index) == 2
+    throttle.close()
+
+    assert throttle.hedge_count > 0
+    assert 5 < server.request_count <= 5 + throttle.hedge_count